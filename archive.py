@@ -0,0 +1,196 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, List, Optional, Tuple
+
+import rollups
+
+# =============================================================================
+# COLD-ATTEMPT ARCHIVE
+# =============================================================================
+#
+# Attempts older than a cutoff move out of the hot database into one SQLite
+# file per term (<database>-<term>.db under ARCHIVE_DIR). archive_terms in
+# the hot database records which file holds which date range, so readers
+# ATTACH an archive only when the range they were asked for overlaps it.
+
+ARCHIVE_DIR = os.environ.get("EDUTUTOR_ARCHIVE_DIR", "archive")
+TERM_MONTHS = int(os.environ.get("EDUTUTOR_ARCHIVE_TERM_MONTHS", "6"))
+# Attempts older than this many days are archived by default
+ARCHIVE_AFTER_DAYS = int(os.environ.get("EDUTUTOR_ARCHIVE_AFTER_DAYS", "365"))
+
+# SQLite's default SQLITE_MAX_ATTACHED is 10; leave room for the caller
+MAX_ATTACHED = 8
+
+ARCHIVE_TERMS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS archive_terms (
+        term TEXT PRIMARY KEY,
+        path TEXT NOT NULL,
+        first_attempt TIMESTAMP,
+        last_attempt TIMESTAMP,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+ARCHIVE_INDEXES_SQL = [
+    "CREATE UNIQUE INDEX IF NOT EXISTS {schema}.ux_archive_attempts_id ON quiz_attempts (id)",
+    '''CREATE INDEX IF NOT EXISTS {schema}.idx_archive_attempts_user_date_id
+       ON quiz_attempts (user_id, attempt_date, id, course_name, topic, score, total_questions, percentage)''',
+    '''CREATE INDEX IF NOT EXISTS {schema}.idx_archive_attempts_date
+       ON quiz_attempts (attempt_date, course_name, topic, percentage)''',
+    "CREATE UNIQUE INDEX IF NOT EXISTS {schema}.ux_archive_items ON attempt_items (attempt_id, position)",
+]
+
+
+def create_archive_registry(conn):
+    conn.execute(ARCHIVE_TERMS_TABLE_SQL)
+    rollups.create_archived_rollups(conn)
+
+def default_cutoff(days: int = ARCHIVE_AFTER_DAYS) -> str:
+    """attempt_date cutoff for 'older than ``days``', in SQLite's timestamp format"""
+    return (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+
+def term_for(attempt_date: str, term_months: int = TERM_MONTHS) -> str:
+    """Term label for a 'YYYY-MM-DD ...' timestamp, e.g. '2024-T1' for Jan-Jun"""
+    year, month = int(attempt_date[:4]), int(attempt_date[5:7])
+    return f"{year}-T{(month - 1) // term_months + 1}"
+
+def archive_path(database_path: str, term: str, archive_dir: str = ARCHIVE_DIR) -> str:
+    stem = os.path.splitext(os.path.basename(database_path))[0]
+    return os.path.join(archive_dir, f"{stem}-{term}.db")
+
+def _schema_name(term: str) -> str:
+    return "arc_" + term.replace("-", "_").lower()
+
+@contextmanager
+def attached(conn, terms: List[sqlite3.Row]) -> Iterator[List[str]]:
+    """ATTACH the archive files of ``terms`` and DETACH them afterwards
+
+    Yields the schema names in the same order. Attaching more than
+    MAX_ATTACHED at once is refused; use term_groups() to batch.
+    """
+    if len(terms) > MAX_ATTACHED:
+        raise ValueError(f"Cannot attach more than {MAX_ATTACHED} archives at once")
+    schemas = []
+    try:
+        for term in terms:
+            schema = _schema_name(term['term'])
+            conn.execute(f"ATTACH DATABASE ? AS {schema}", (term['path'],))
+            schemas.append(schema)
+        yield schemas
+    finally:
+        if conn.in_transaction:
+            conn.commit()
+        for schema in schemas:
+            conn.execute(f"DETACH DATABASE {schema}")
+
+def term_groups(terms: List[sqlite3.Row]) -> Iterator[List[sqlite3.Row]]:
+    for start in range(0, len(terms), MAX_ATTACHED):
+        yield terms[start:start + MAX_ATTACHED]
+
+def terms_overlapping(conn, since: Optional[str] = None, until: Optional[str] = None) -> List[sqlite3.Row]:
+    """Archive terms holding attempts within [since, until); None is unbounded"""
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute('''
+        SELECT term, path, first_attempt, last_attempt FROM archive_terms
+        WHERE attempts > 0
+          AND (? IS NULL OR last_attempt >= ?)
+          AND (? IS NULL OR first_attempt < ?)
+        ORDER BY last_attempt DESC
+    ''', (since, since, until, until))
+    return cursor.fetchall()
+
+def _open_archive(conn, database_path: str, term: str, archive_dir: str) -> str:
+    """Create the archive file for a term if needed and attach it; returns its schema"""
+    path = archive_path(database_path, term, archive_dir)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    schema = _schema_name(term)
+    conn.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+    # Copy the live column layout so INSERT ... SELECT * lines up exactly
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {schema}.quiz_attempts AS SELECT * FROM main.quiz_attempts WHERE 0")
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {schema}.attempt_items AS SELECT * FROM main.attempt_items WHERE 0")
+    for sql in ARCHIVE_INDEXES_SQL:
+        conn.execute(sql.format(schema=schema))
+    conn.execute('''
+        INSERT INTO archive_terms (term, path) VALUES (?, ?)
+        ON CONFLICT (term) DO NOTHING
+    ''', (term, path))
+    conn.commit()
+    return schema
+
+def archive_attempts(conn, database_path: str, cutoff: str, chunk_size: int = 5000,
+                     archive_dir: str = ARCHIVE_DIR) -> Iterator[Tuple[str, int]]:
+    """Move attempts dated before ``cutoff`` into per-term archive files
+
+    Works oldest first in chunks of chunk_size attempts. Each chunk is
+    copied into its archive and committed there first; only then is it
+    deleted from the hot database (with its attempt_items) in a second
+    transaction, so an interruption can duplicate a chunk but never lose one,
+    and re-running resumes cleanly. The rollups keep counting archived
+    attempts. Yields (term, attempts moved) per chunk.
+
+    At most MAX_ATTACHED archives are attached at a time. Attempts move
+    oldest first, so the term attached longest ago is finished and is the
+    one detached to make room.
+    """
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS archive_chunk (id INTEGER PRIMARY KEY)")
+    schemas = {}
+    try:
+        while True:
+            rows = conn.execute('''
+                SELECT id, attempt_date FROM quiz_attempts
+                WHERE attempt_date < ?
+                ORDER BY attempt_date, id
+                LIMIT ?
+            ''', (cutoff, chunk_size)).fetchall()
+            if not rows:
+                return
+
+            by_term = {}
+            for attempt_id, attempt_date in rows:
+                by_term.setdefault(term_for(attempt_date), []).append(attempt_id)
+
+            for term, ids in by_term.items():
+                if term not in schemas:
+                    if len(schemas) >= MAX_ATTACHED:
+                        finished = next(iter(schemas))
+                        conn.execute(f"DETACH DATABASE {schemas.pop(finished)}")
+                    schemas[term] = _open_archive(conn, database_path, term, archive_dir)
+                schema = schemas[term]
+
+                conn.execute("DELETE FROM temp.archive_chunk")
+                conn.executemany("INSERT INTO temp.archive_chunk (id) VALUES (?)", [(i,) for i in ids])
+                chunk = "SELECT id FROM temp.archive_chunk"
+
+                # 1. copy into the archive file and make it durable there
+                conn.execute(f'''
+                    INSERT OR IGNORE INTO {schema}.quiz_attempts
+                    SELECT * FROM main.quiz_attempts WHERE id IN ({chunk})
+                ''')
+                conn.execute(f'''
+                    INSERT OR IGNORE INTO {schema}.attempt_items
+                    SELECT * FROM main.attempt_items WHERE attempt_id IN ({chunk})
+                ''')
+                conn.commit()
+
+                # 2. drop from the hot database what the archive now holds
+                conn.execute(f"DELETE FROM temp.archive_chunk WHERE id NOT IN (SELECT id FROM {schema}.quiz_attempts)")
+                moved = rollups.delete_preserving_rollups(conn, term, chunk)
+                conn.execute(f'''
+                    UPDATE archive_terms SET
+                        attempts = (SELECT COUNT(*) FROM {schema}.quiz_attempts),
+                        first_attempt = (SELECT MIN(attempt_date) FROM {schema}.quiz_attempts),
+                        last_attempt = (SELECT MAX(attempt_date) FROM {schema}.quiz_attempts),
+                        archived_at = CURRENT_TIMESTAMP
+                    WHERE term = ?
+                ''', (term,))
+                conn.commit()
+                yield term, moved
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        for schema in schemas.values():
+            conn.execute(f"DETACH DATABASE {schema}")
@@ -0,0 +1,87 @@
+import asyncio
+import atexit
+import functools
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import models
+from db import POOL_SIZE
+
+# =============================================================================
+# ASYNC DATA LAYER
+# =============================================================================
+#
+# Awaitable wrappers around models.py. SQLite calls block, so they run on two
+# bounded thread pools:
+#
+#   reader lane  ASYNC_READERS threads (at most one pooled connection each),
+#                so independent queries overlap instead of queueing
+#   writer lane  one thread that encodes and submits to the group-commit
+#                writer; awaiting the result waits for its COMMIT
+#
+# A slow analytics query occupies one reader thread and never delays writes.
+#
+#   students, analytics = asyncio.run(gather_dashboard())
+#
+# Synchronous callers such as the Streamlit pages skip the event loop and
+# wait on the read lane's Future directly:
+#
+#   students, analytics = dashboard().result()
+
+ASYNC_READERS = min(int(os.environ.get("EDUTUTOR_ASYNC_READERS", str(POOL_SIZE))), POOL_SIZE)
+
+_lanes = {}
+_lanes_lock = threading.Lock()
+
+def _lane(name: str, max_workers: int) -> ThreadPoolExecutor:
+    with _lanes_lock:
+        executor = _lanes.get(name)
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"edututor-{name}")
+            _lanes[name] = executor
+        return executor
+
+async def _read(function, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_lane("read", ASYNC_READERS), functools.partial(function, *args, **kwargs))
+
+async def _write(function, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    committed = await loop.run_in_executor(_lane("write", 1), functools.partial(function, *args, **kwargs))
+    return await asyncio.wrap_future(committed)
+
+async def get_user_quiz_history(user_id, limit=None, before=None, columns=models.DEFAULT_HISTORY_COLUMNS,
+                                since=None, until=None):
+    """Awaitable models.get_user_quiz_history"""
+    return await _read(models.get_user_quiz_history, user_id, limit, before, columns, since, until)
+
+async def get_all_students_progress():
+    """Awaitable models.get_all_students_progress"""
+    return await _read(models.get_all_students_progress)
+
+async def get_course_analytics(since=None, until=None):
+    """Awaitable models.get_course_analytics"""
+    return await _read(models.get_course_analytics, since, until)
+
+async def save_quiz_attempt(user_id, course_name, topic, answers, score, total_questions, feedback=None):
+    """Save a quiz attempt; resolves to the attempt id once it is committed"""
+    return await _write(models.save_quiz_attempt, user_id, course_name, topic, answers,
+                        score, total_questions, feedback)
+
+async def gather_dashboard():
+    """Fetch the educator dashboard's student progress and course analytics from one snapshot"""
+    return await _read(models.get_educator_dashboard)
+
+def dashboard() -> Future:
+    """Submit the educator dashboard read to the reader lane; resolves to (students, analytics)"""
+    return _lane("read", ASYNC_READERS).submit(models.get_educator_dashboard)
+
+@atexit.register
+def shutdown():
+    """Finish queued work and stop both lanes (runs automatically at interpreter exit)"""
+    with _lanes_lock:
+        lanes = list(_lanes.values())
+        _lanes.clear()
+    for executor in lanes:
+        executor.shutdown(wait=True)
@@ -0,0 +1,106 @@
+import hashlib
+import json
+from typing import Iterator, List, Optional, Tuple
+
+from payload_codec import decode_payload, load_dictionaries
+
+# =============================================================================
+# PER-QUESTION RESPONSES
+# =============================================================================
+#
+# attempt_items holds one row per answered question, written in the same
+# transaction as its quiz_attempts row, so item-level statistics are indexed
+# SQL aggregates instead of json.loads over every feedback blob.
+
+ATTEMPT_ITEMS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS attempt_items (
+        attempt_id INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        question_id TEXT NOT NULL,
+        chosen_option INTEGER,
+        is_correct INTEGER NOT NULL,
+        topic TEXT NOT NULL,
+        PRIMARY KEY (attempt_id, position),
+        FOREIGN KEY (attempt_id) REFERENCES quiz_attempts (id)
+    ) WITHOUT ROWID
+'''
+
+# Items belong to their attempt; remove them when the attempt goes away
+ATTEMPT_ITEMS_DELETE_TRIGGER_SQL = '''
+    CREATE TRIGGER IF NOT EXISTS trg_attempt_items_delete
+    AFTER DELETE ON quiz_attempts
+    BEGIN
+        DELETE FROM attempt_items WHERE attempt_id = OLD.id;
+    END
+'''
+
+INSERT_ATTEMPT_ITEMS_SQL = '''
+    INSERT OR IGNORE INTO attempt_items (attempt_id, position, question_id, chosen_option, is_correct, topic)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+def create_attempt_items(conn):
+    """Create the attempt_items table and its cleanup trigger"""
+    conn.execute(ATTEMPT_ITEMS_TABLE_SQL)
+    conn.execute(ATTEMPT_ITEMS_DELETE_TRIGGER_SQL)
+
+def question_key(question_text: str) -> str:
+    """Stable question id derived from the question text"""
+    return hashlib.sha1(question_text.encode("utf-8")).hexdigest()[:16]
+
+def attempt_item_rows(attempt_id: int, answers: Optional[str], feedback: Optional[str]) -> List[Tuple]:
+    """Rows for attempt_items from an attempt's answers and feedback JSON"""
+    if not feedback:
+        return []
+    try:
+        feedback_items = json.loads(feedback)
+        chosen = json.loads(answers) if answers else []
+    except (TypeError, ValueError):
+        return []
+    if not isinstance(chosen, list):
+        chosen = []
+
+    rows = []
+    for position, item in enumerate(feedback_items):
+        if not isinstance(item, dict) or 'question' not in item:
+            continue
+        option = chosen[position] if 0 <= position < len(chosen) else None
+        rows.append((
+            attempt_id,
+            position,
+            question_key(item['question']),
+            option if isinstance(option, int) else None,
+            1 if item.get('is_correct') else 0,
+            item.get('topic') or 'General',
+        ))
+    return rows
+
+def backfill_attempt_items(conn, batch_size: int = 1000, after_id: int = 0) -> Iterator[Tuple[int, int]]:
+    """Populate attempt_items from existing feedback blobs, one batch at a time
+
+    Walks quiz_attempts by id so only one batch of blobs is in memory, and
+    commits per batch; yields (last attempt id, items written) after each
+    commit so callers can report progress or resume with after_id.
+    Attempts that already have items are left untouched.
+    """
+    load_dictionaries(conn)
+    while True:
+        rows = conn.execute('''
+            SELECT id, answers, feedback FROM quiz_attempts
+            WHERE id > ? AND feedback IS NOT NULL
+            ORDER BY id
+            LIMIT ?
+        ''', (after_id, batch_size)).fetchall()
+        if not rows:
+            return
+
+        items = []
+        for attempt_id, answers, feedback in rows:
+            items.extend(attempt_item_rows(attempt_id, decode_payload(answers), decode_payload(feedback)))
+        before = conn.total_changes
+        conn.executemany(INSERT_ATTEMPT_ITEMS_SQL, items)
+        written = conn.total_changes - before
+        conn.commit()
+
+        after_id = rows[-1][0]
+        yield after_id, written
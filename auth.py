@@ -0,0 +1,198 @@
+import atexit
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# =============================================================================
+# PASSWORD HASHING SERVICE
+# =============================================================================
+#
+# Password hashes use a deliberately slow KDF (scrypt by default). When a
+# whole class logs in at once, hashing in Streamlit's script threads would
+# queue every login behind the others and starve the server. Instead,
+# hashing and verification run in a pool of AUTH_WORKERS processes:
+#
+#   - at most AUTH_QUEUE_SIZE requests are in flight; further callers wait
+#     up to AUTH_TIMEOUT seconds for a slot and then get AuthBusy
+#   - a request that does not finish within AUTH_TIMEOUT raises AuthTimeout
+#   - if a worker dies (e.g. OOM-killed mid-scrypt) the pool is broken for
+#     good: the failed call raises AuthUnavailable and the service is
+#     replaced, so the next call gets a fresh pool
+#   - AUTH_WORKERS=0 hashes inline in the calling thread
+#
+# The hash method is EDUTUTOR_PASSWORD_METHOD if set. Otherwise, with
+# EDUTUTOR_AUTH_TARGET_MS set, it is an scrypt cost calibrated on first use
+# so that one verification takes about that long on this machine, and
+# without either it is werkzeug's default. A successful login whose stored
+# hash uses other parameters is rehashed with the current method in the
+# same worker call (see needs_rehash), so changing the method or target
+# upgrades accounts as their owners log in.
+
+AUTH_WORKERS = int(os.environ.get("EDUTUTOR_AUTH_WORKERS", str(os.cpu_count() or 1)))
+AUTH_QUEUE_SIZE = int(os.environ.get("EDUTUTOR_AUTH_QUEUE_SIZE", str(max(AUTH_WORKERS, 1) * 8)))
+AUTH_TIMEOUT = float(os.environ.get("EDUTUTOR_AUTH_TIMEOUT", "10"))
+# Target verification latency for calibrate(); 0 keeps DEFAULT_METHOD
+AUTH_TARGET_MS = float(os.environ.get("EDUTUTOR_AUTH_TARGET_MS", "0"))
+PASSWORD_METHOD = os.environ.get("EDUTUTOR_PASSWORD_METHOD")
+
+# What werkzeug's generate_password_hash() uses by default
+DEFAULT_METHOD = "scrypt:32768:8:1"
+
+# scrypt cost bounds for calibration; memory per hash is 128 * n * r bytes
+# (16 MiB at the floor, which is OWASP's minimum)
+SCRYPT_MIN_N = 2 ** 14
+SCRYPT_MAX_N = 2 ** 17
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+
+class AuthUnavailable(Exception):
+    """Base class for when a hashing request cannot be served right now"""
+
+
+class AuthBusy(AuthUnavailable):
+    """Raised when the hashing queue stayed full for the whole timeout"""
+
+
+class AuthTimeout(AuthUnavailable):
+    """Raised when a queued hashing request did not finish in time"""
+
+
+_method = PASSWORD_METHOD
+_method_lock = threading.Lock()
+
+def calibrate(target_ms: float = AUTH_TARGET_MS) -> str:
+    """scrypt method string whose verification takes about ``target_ms`` here
+
+    Times one hash at SCRYPT_MIN_N and scales n (a power of two, linear in
+    cost) to the target, within [SCRYPT_MIN_N, SCRYPT_MAX_N].
+    """
+    method = f"scrypt:{SCRYPT_MIN_N}:{SCRYPT_R}:{SCRYPT_P}"
+    start = time.perf_counter()
+    generate_password_hash("calibration", method)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    n = SCRYPT_MIN_N * 2 ** max(round(math.log2(max(target_ms, 1) / elapsed_ms)), 0)
+    return f"scrypt:{min(n, SCRYPT_MAX_N)}:{SCRYPT_R}:{SCRYPT_P}"
+
+def password_method() -> str:
+    """Method new hashes are created with (calibrated once per process)"""
+    global _method
+    if _method is None:
+        with _method_lock:
+            if _method is None:
+                _method = calibrate() if AUTH_TARGET_MS > 0 else DEFAULT_METHOD
+    return _method
+
+def needs_rehash(password_hash: str, method: Optional[str] = None) -> bool:
+    """Whether a stored hash was made with other parameters than ``method``"""
+    return password_hash.split("$", 1)[0] != (method or password_method())
+
+def _hash(password: str, method: str) -> str:
+    return generate_password_hash(password, method)
+
+def _verify(password_hash: str, password: str, method: str) -> Tuple[bool, Optional[str]]:
+    """Check a password; on success also return a new hash if the stored one is outdated"""
+    if not check_password_hash(password_hash, password):
+        return False, None
+    if needs_rehash(password_hash, method):
+        return True, generate_password_hash(password, method)
+    return True, None
+
+
+class AuthService:
+    """Bounded process pool for password hashing and verification"""
+
+    def __init__(self, workers: int = AUTH_WORKERS, queue_size: int = AUTH_QUEUE_SIZE,
+                 timeout: float = AUTH_TIMEOUT):
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max(queue_size, 1))
+        # spawn, not fork: the Streamlit server is multi-threaded
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        ) if workers > 0 else None
+
+    def _run(self, function, *args):
+        if self._pool is None:
+            return function(*args)
+        deadline = time.monotonic() + self.timeout
+        if not self._slots.acquire(timeout=self.timeout):
+            raise AuthBusy(f"{self.timeout:g}s without a free hashing slot")
+        try:
+            future = self._pool.submit(function, *args)
+        except BrokenProcessPool:
+            self._slots.release()
+            _replace_service(self)
+            raise AuthUnavailable("password hashing workers were lost; restarting them") from None
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is held until the worker is done, even if we stop waiting
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=max(deadline - time.monotonic(), 0))
+        except FutureTimeout:
+            future.cancel()
+            raise AuthTimeout(f"password hashing took longer than {self.timeout:g}s") from None
+        except BrokenProcessPool:
+            _replace_service(self)
+            raise AuthUnavailable("a password hashing worker died; restarting the workers") from None
+
+    def hash(self, password: str) -> str:
+        """Hash a new password with the current method"""
+        return self._run(_hash, password, password_method())
+
+    def verify(self, password_hash: str, password: str) -> Tuple[bool, Optional[str]]:
+        """Check a password against its stored hash
+
+        Returns (matches, new_hash). new_hash is set when the password
+        matched but the stored hash should be replaced (see needs_rehash).
+        """
+        return self._run(_verify, password_hash, password, password_method())
+
+    def close(self, wait: bool = True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_auth_service() -> AuthService:
+    """Get the process-wide hashing service, starting it on first use"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = AuthService()
+        return _service
+
+def _replace_service(broken: AuthService):
+    """Drop a service whose pool broke, so get_auth_service() starts a new one"""
+    global _service
+    with _service_lock:
+        if _service is broken:
+            _service = None
+    # The broken pool's workers are already gone; do not wait for them
+    broken.close(wait=False)
+
+def hash_password(password: str) -> str:
+    return get_auth_service().hash(password)
+
+def verify_password(password_hash: str, password: str) -> Tuple[bool, Optional[str]]:
+    return get_auth_service().verify(password_hash, password)
+
+@atexit.register
+def close_auth_service():
+    """Stop the hashing workers (runs automatically at interpreter exit)"""
+    global _service
+    with _service_lock:
+        service, _service = _service, None
+    if service is not None:
+        service.close()
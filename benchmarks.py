@@ -0,0 +1,483 @@
+"""Micro-benchmarks for the EduTutor data layer.
+
+Run ``python benchmarks.py <name>``; every benchmark works on a scratch
+database in a temporary directory and never touches the application data.
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+
+import auth
+import db
+import question_bank
+import querylog
+import topic_router
+
+
+def _seed_database(path, students=200, attempts_per_student=50):
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            user_type TEXT NOT NULL,
+            student_level TEXT DEFAULT 'Beginner',
+            last_login TIMESTAMP
+        );
+        CREATE TABLE quiz_attempts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            course_name TEXT NOT NULL,
+            topic TEXT NOT NULL,
+            score INTEGER NOT NULL,
+            total_questions INTEGER NOT NULL,
+            percentage REAL NOT NULL,
+            attempt_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    ''')
+    conn.executemany(
+        "INSERT INTO users (name, email, password_hash, user_type) VALUES (?, ?, 'x', 'student')",
+        [(f"Student {i}", f"student{i}@school.edu") for i in range(students)]
+    )
+    rng = random.Random(0)
+    conn.executemany(
+        "INSERT INTO quiz_attempts (user_id, course_name, topic, score, total_questions, percentage) "
+        "VALUES (?, 'mathematics', 'Algebra', ?, 5, ?)",
+        [(u, s, s * 20.0)
+         for u in range(1, students + 1)
+         for s in (rng.randint(0, 5) for _ in range(attempts_per_student))]
+    )
+    conn.commit()
+    conn.close()
+
+
+def _run_threads(threads, queries_per_thread, work):
+    def worker():
+        rng = random.Random(threading.get_ident())
+        for _ in range(queries_per_thread):
+            work(rng)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return threads * queries_per_thread / elapsed
+
+
+def bench_pool(args):
+    """Queries per second: connect-per-call vs the pooled WAL connections"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        _seed_database(path, students=args.students)
+        query = "SELECT * FROM users WHERE email = ?"
+
+        def connect_per_call(rng):
+            conn = sqlite3.connect(path)
+            conn.row_factory = sqlite3.Row
+            conn.execute(query, (f"student{rng.randrange(args.students)}@school.edu",)).fetchone()
+            conn.close()
+
+        pool = db.ConnectionPool(path, max_size=args.pool_size)
+
+        def pooled(rng):
+            conn = pool.connect()
+            conn.execute(query, (f"student{rng.randrange(args.students)}@school.edu",)).fetchone()
+            conn.close()
+
+        print(f"{args.threads} threads x {args.queries} queries, pool size {args.pool_size}")
+        baseline = _run_threads(args.threads, args.queries, connect_per_call)
+        print(f"  connect-per-call: {baseline:10.0f} queries/s")
+        pooled_qps = _run_threads(args.threads, args.queries, pooled)
+        print(f"  pooled (WAL):     {pooled_qps:10.0f} queries/s  ({pooled_qps / baseline:.1f}x)")
+        pool.close()
+
+
+def bench_querylog(args):
+    """Overhead of query instrumentation on pooled point lookups"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        _seed_database(path, students=args.students)
+        query = "SELECT * FROM users WHERE email = ?"
+        emails = [f"student{i % args.students}@school.edu" for i in range(args.queries)]
+        pool = db.ConnectionPool(path, max_size=1)
+
+        def get_user_by_email(email):
+            conn = pool.connect(caller="get_user_by_email")
+            cursor = conn.cursor()
+            cursor.execute(query, (email,))
+            user = cursor.fetchone()
+            conn.close()
+            return dict(user) if user else None
+
+        def run(enabled):
+            querylog.ENABLED = enabled
+            start = time.perf_counter()
+            for email in emails:
+                get_user_by_email(email)
+            return time.perf_counter() - start
+
+        # Alternate the two modes and keep the best of each, so drift in
+        # machine load does not land on one side
+        enabled, sample_rate = querylog.ENABLED, querylog.SAMPLE_RATE
+        querylog.SAMPLE_RATE = args.sample_rate
+        plain = instrumented = float("inf")
+        for _ in range(args.repeat):
+            plain = min(plain, run(False))
+            instrumented = min(instrumented, run(True))
+        querylog.ENABLED, querylog.SAMPLE_RATE = enabled, sample_rate
+        pool.close()
+        print(f"{args.queries} pooled point lookups, best of {args.repeat}, sample rate {args.sample_rate}")
+        print(f"  querylog off: {plain / args.queries * 1e6:8.2f} us/call")
+        print(f"  querylog on:  {instrumented / args.queries * 1e6:8.2f} us/call  "
+              f"({(instrumented / plain - 1) * 100:+.2f}%)")
+        # The end-to-end difference is within timer noise; time the hook itself
+        querylog.ENABLED = True
+        hook = min(timeit.repeat(lambda: querylog.sample("get_user_by_email"), number=100000, repeat=args.repeat)) / 100000
+        querylog.ENABLED = enabled
+        print(f"  per-checkout hook: {hook * 1e9:.0f} ns ({hook / (plain / args.queries) * 100:.2f}% of a call)")
+
+
+def bench_auth(args):
+    """Logins per second: hashing in the request threads vs the auth process pool"""
+    method = args.method or auth.password_method()
+    stored = auth.generate_password_hash("correct horse", method)
+    per_thread = max(args.logins // args.threads, 1)
+
+    def login_with(service):
+        def work(rng):
+            matches, _ = service.verify(stored, "correct horse")
+            assert matches
+        return work
+
+    print(f"{args.threads} request threads x {per_thread} logins, {method}, {os.cpu_count()} cores")
+    inline = auth.AuthService(workers=0)
+    baseline = _run_threads(args.threads, per_thread, login_with(inline))
+    print(f"  inline (threads): {baseline:8.1f} logins/s")
+    for workers in sorted({1, 2, 4, 8, os.cpu_count() or 1}):
+        if workers > args.max_workers:
+            continue
+        service = auth.AuthService(workers=workers, queue_size=workers * 8, timeout=600)
+        # Start the worker processes before timing
+        service._run(auth._hash, "warm up", f"scrypt:{auth.SCRYPT_MIN_N}:8:1")
+        rate = _run_threads(args.threads, per_thread, login_with(service))
+        service.close()
+        print(f"  {workers:2d} worker(s):     {rate:8.1f} logins/s  ({rate / baseline:.2f}x)")
+
+
+def bench_question_bank(args):
+    """AIQuizGenerator construction: rebuilding the bank literal vs the shared frozen bank"""
+    # Evaluating the bank as a dict display is what the old __init__ did
+    literal = compile(repr(question_bank.load_source(args.bank)), "<question bank literal>", "eval")
+    question_bank.get(args.bank)  # first use opens the store
+
+    rebuild = min(timeit.repeat(lambda: eval(literal), number=args.number, repeat=args.repeat)) / args.number
+    shared = min(timeit.repeat(lambda: question_bank.get(args.bank), number=args.number,
+                               repeat=args.repeat)) / args.number
+    print(f"question bank '{args.bank}', best of {args.repeat} x {args.number}")
+    print(f"  rebuild per generator: {rebuild * 1e6:8.2f} us")
+    print(f"  shared frozen bank:    {shared * 1e6:8.2f} us  ({rebuild / shared:.0f}x faster)")
+
+
+_MEMORY_PROBE = """
+import json, random, sys, time
+def rss(field):
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+before = rss("RssAnon")
+start = time.perf_counter()
+%s
+quiz = random.sample(list(bank["subject0"]["medium"]), 10)
+print(json.dumps({"seconds": time.perf_counter() - start,
+                  "private_kb": rss("RssAnon") - before, "file_kb": rss("RssFile")}))
+"""
+
+def _probe(code, path):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.dirname(os.path.abspath(__file__)), path]))
+    output = subprocess.run([sys.executable, "-c", _MEMORY_PROBE % code], env=env, cwd=path,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output)
+
+def _synthetic_bank(questions, subjects, topics=25, seed=7):
+    rng = random.Random(seed)
+    difficulties = ("easy", "medium", "hard")
+    per_run = max(questions // (subjects * len(difficulties)), 1)
+    return {
+        f"subject{s}": {
+            difficulty: [{
+                "question": f"Question {s}-{difficulty}-{i}: " + " ".join(
+                    rng.choice(("what", "is", "the", "value", "of", "x", "when", "y", "equals")) for _ in range(12)),
+                "options": [f"option {n} {rng.random():.6f}" for n in range(4)],
+                "correct": rng.randrange(4),
+                "explanation": "Because " + " ".join(rng.choice(("a", "b", "c", "therefore")) for _ in range(20)),
+                "topic": f"Topic {i % topics}",
+            } for i in range(per_run)]
+            for difficulty in difficulties
+        }
+        for s in range(subjects)
+    }
+
+def bench_question_store(args):
+    """Cold start and private memory of a large bank: dict literal vs the lazy mmap store"""
+    if not os.path.exists("/proc/self/status"):
+        raise SystemExit("question-store reads memory use from /proc (Linux only)")
+    bank = _synthetic_bank(args.questions, args.subjects)
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "literal_bank.py"), "w") as handle:
+            handle.write("def build():\n    return " + repr(bank) + "\n")
+        with open(os.path.join(tmp, "bench.json"), "w") as handle:
+            json.dump(bank, handle)
+        question_bank.write_store(bank, os.path.join(tmp, "bench.qbank"))
+
+        literal = "import literal_bank\nbank = literal_bank.build()"
+        store = f"import question_bank\nbank = question_bank.get('bench', {tmp!r})"
+        results = {
+            "dict literal (compile)": _probe(literal, tmp),
+            "dict literal (.pyc)": _probe(literal, tmp),
+            "mmap store": _probe(store, tmp),
+        }
+        total = sum(len(questions) for runs in bank.values() for questions in runs.values())
+        print(f"{total:,} questions in {args.subjects} subjects; time to first quiz and private memory")
+        for name, result in results.items():
+            print(f"  {name:<24} {result['seconds'] * 1000:8.1f} ms  {result['private_kb'] / 1024:8.1f} MiB private")
+
+
+def bench_question_select(args):
+    """Quiz selection: copying and sampling difficulty lists vs the precomputed run index (warm)"""
+    print(f"select {args.k} questions, best of {args.repeat} x {args.number}")
+    for size in args.sizes:
+        bank = _synthetic_bank(size, args.subjects)
+        with tempfile.TemporaryDirectory() as tmp:
+            question_bank.write_store(bank, os.path.join(tmp, "bench.qbank"))
+            store_bank = question_bank.QuestionBank(question_bank.QuestionStore(os.path.join(tmp, "bench.qbank")))
+            frozen = question_bank.freeze(bank)
+            exclude = [store_bank.question_id(index) for index in store_bank.select(args.k, ["subject0"])]
+            # Steady state: the questions quizzes draw from have been decoded
+            # once, as the frozen bank's have; first use costs one decode each
+            start = time.perf_counter()
+            decoded = sum(len(store_bank.questions("subject0", difficulty)) for difficulty in ("medium", "hard"))
+            decode_us = (time.perf_counter() - start) / decoded * 1e6
+
+            def copy_and_sample():
+                # What generate_quiz did: copy the level's list, top it up, sample
+                available = list(frozen["subject0"]["medium"])
+                if len(available) < args.k:
+                    available.extend(frozen["subject0"]["hard"])
+                return [dict(question) for question in random.sample(available, args.k)]
+
+            def indexed():
+                return [question_bank.QuizQuestion(store_bank.question(index))
+                        for index in store_bank.select(args.k, ["subject0"], ["medium"])]
+
+            def compound():
+                return [question_bank.QuizQuestion(store_bank.question(index)) for index in store_bank.select(
+                    args.k, ["subject0"], ["medium", "hard"], ["Topic 1", "Topic 2"], exclude)]
+
+            timings = {}
+            for name, work in (("copy + sample", copy_and_sample), ("run index", indexed),
+                               ("run index, compound", compound)):
+                timings[name] = min(timeit.repeat(work, number=args.number, repeat=args.repeat)) / args.number
+            print(f"  {size:>7,} questions: " + "  ".join(
+                f"{name} {seconds * 1e6:8.1f} us" for name, seconds in timings.items())
+                + f"  (first use: +{decode_us:.1f} us per question decoded)")
+            store_bank.store.close()
+
+
+def bench_quiz_questions(args):
+    """Per-quiz questions: copying each shared question vs a QuizQuestion overlay"""
+    bank = question_bank.get(args.bank)
+    shared = [question for difficulties in bank.values() for questions in difficulties.values()
+              for question in questions][:args.k]
+
+    def copies():
+        # What generate_quiz did: a dict copy per question, then tag the copy
+        quiz = [dict(question) for question in shared]
+        for question in quiz:
+            question['generated_topic'] = "Benchmark"
+            question['difficulty'] = "medium"
+            question['subject'] = "mathematics"
+        return quiz
+
+    def overlays():
+        return [question_bank.QuizQuestion(question, generated_topic="Benchmark", difficulty="medium",
+                                           subject="mathematics") for question in shared]
+
+    print(f"{len(shared)}-question quiz from bank '{args.bank}', best of {args.repeat} x {args.number}")
+    for name, work in (("dict copies", copies), ("overlays", overlays)):
+        seconds = min(timeit.repeat(work, number=args.number, repeat=args.repeat)) / args.number
+        # Objects a quiz owns: the list, its per-question objects and their dicts
+        quiz = work()
+        owned = sys.getsizeof(quiz) + sum(
+            sys.getsizeof(question) + (sys.getsizeof(question.overlay) if name == "overlays" else 0)
+            for question in quiz)
+        print(f"  {name:<12} {seconds * 1e6:8.2f} us  {owned:8,} bytes per quiz")
+
+
+def _owned_size(value, seen=None):
+    """Bytes of everything reachable from ``value`` except the shared bank's questions"""
+    seen = set() if seen is None else seen
+    if id(value) in seen or isinstance(value, question_bank.Question):
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_owned_size(key, seen) + _owned_size(item, seen) for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_owned_size(item, seen) for item in value)
+    elif isinstance(value, question_bank.QuizQuestion):
+        size += _owned_size(value.overlay, seen)
+    elif isinstance(value, question_bank.QuizHandle):
+        size += sum(_owned_size(getattr(value, name), seen) for name in value.__slots__)
+    return size
+
+def bench_quiz_session(args):
+    """Per-session quiz state: full question copies vs overlays vs an ID-only QuizHandle"""
+    import edu
+    generator = edu.AIQuizGenerator()
+    quizzes = {
+        "quiz": generator.generate_quiz("Algebra", 2, "mathematics", args.questions),
+        "diagnostic quiz": generator.generate_diagnostic_quiz(),
+    }
+    print(f"session state per quiz, {args.sessions:,} concurrent sessions holding both")
+    totals = {}
+    for label, quiz in quizzes.items():
+        states = {
+            # Before: every session held its own dicts, text, options and explanations
+            "question copies": json.loads(json.dumps([dict(question) for question in quiz])),
+            "overlays": quiz,
+            "quiz handle": generator.quiz_handle(quiz),
+        }
+        print(f"  {label} ({len(quiz)} questions):")
+        for name, state in states.items():
+            size = _owned_size(state)
+            totals[name] = totals.get(name, 0) + size
+            print(f"    {name:<16} {size:8,} bytes")
+    for name, size in totals.items():
+        print(f"  {name:<18} {size * args.sessions / 2 ** 20:8.1f} MiB for {args.sessions:,} sessions")
+
+
+def bench_topic_router(args):
+    """Topic to subject: sequential keyword-list scans vs the compiled, memoized router"""
+    rng = random.Random(7)
+    syllables = ("al", "ge", "bra", "phy", "sic", "lit", "er", "com", "pu", "ter", "ma", "tics", "no", "vel",
+                 "quan", "tum", "po", "em", "da", "ta")
+    keywords = set()
+    while len(keywords) < args.keywords:
+        keywords.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    keywords = sorted(keywords)
+    rng.shuffle(keywords)
+    taxonomy = {f"subject{n}": {keyword: rng.choice((0.5, 1.0, 2.0)) for keyword in keywords[n::args.subjects]}
+                for n in range(args.subjects)}
+    lists = [(subject, list(weights)) for subject, weights in taxonomy.items()]
+    topics = [" ".join(rng.choice(keywords + ["intro", "to", "the", "basics"]) for _ in range(rng.randint(1, 4)))
+              for _ in range(args.topics)]
+
+    def linear(topic):
+        # What _determine_subject_from_topic did, one any() scan per subject
+        topic_lower = topic.lower()
+        for subject, subject_keywords in lists:
+            if any(keyword in topic_lower for keyword in subject_keywords):
+                return subject
+        return "mathematics"
+
+    start = time.perf_counter()
+    router = topic_router.TopicRouter(taxonomy)
+    compile_seconds = time.perf_counter() - start
+
+    def run(route):
+        return lambda: [route(topic) for topic in topics]
+
+    print(f"{router.keyword_count:,} keywords in {args.subjects} subjects, {len(topics):,} topics; "
+          f"compiled in {compile_seconds * 1000:.0f} ms")
+    results = {}
+    for name, work in (("keyword lists", run(linear)), ("automaton", run(router.scores)),
+                       ("automaton, memoized", run(router.route))):
+        results[name] = min(timeit.repeat(work, number=1, repeat=args.repeat)) / len(topics)
+    for name, seconds in results.items():
+        print(f"  {name:<20} {seconds * 1e6:9.2f} us per topic  "
+              f"({results['keyword lists'] / seconds:.0f}x)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+
+    p = sub.add_parser("pool", help=bench_pool.__doc__)
+    p.add_argument("--threads", type=int, default=8)
+    p.add_argument("--queries", type=int, default=2000, help="queries per thread")
+    p.add_argument("--students", type=int, default=200)
+    p.add_argument("--pool-size", type=int, default=db.POOL_SIZE)
+    p.set_defaults(func=bench_pool)
+
+    p = sub.add_parser("querylog", help=bench_querylog.__doc__)
+    p.add_argument("--queries", type=int, default=50000)
+    p.add_argument("--repeat", type=int, default=15)
+    p.add_argument("--students", type=int, default=200)
+    p.add_argument("--sample-rate", type=float, default=0.01)
+    p.set_defaults(func=bench_querylog)
+
+    p = sub.add_parser("auth", help=bench_auth.__doc__)
+    p.add_argument("--logins", type=int, default=64, help="logins per configuration")
+    p.add_argument("--threads", type=int, default=16, help="concurrent request threads")
+    p.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    p.add_argument("--method", help="werkzeug hash method (default: auth.password_method())")
+    p.set_defaults(func=bench_auth)
+
+    p = sub.add_parser("question-bank", help=bench_question_bank.__doc__)
+    p.add_argument("--bank", choices=["edu", "app"], default="edu")
+    p.add_argument("--number", type=int, default=2000)
+    p.add_argument("--repeat", type=int, default=7)
+    p.set_defaults(func=bench_question_bank)
+
+    p = sub.add_parser("question-store", help=bench_question_store.__doc__)
+    p.add_argument("--questions", type=int, default=30000)
+    p.add_argument("--subjects", type=int, default=12)
+    p.set_defaults(func=bench_question_store)
+
+    p = sub.add_parser("question-select", help=bench_question_select.__doc__)
+    p.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    p.add_argument("--subjects", type=int, default=4)
+    p.add_argument("-k", type=int, default=10, help="questions per quiz")
+    p.add_argument("--number", type=int, default=200)
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(func=bench_question_select)
+
+    p = sub.add_parser("quiz-questions", help=bench_quiz_questions.__doc__)
+    p.add_argument("--bank", default="edu", choices=["edu", "app"])
+    p.add_argument("-k", type=int, default=10, help="questions per quiz")
+    p.add_argument("--number", type=int, default=20000)
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(func=bench_quiz_questions)
+
+    p = sub.add_parser("quiz-session", help=bench_quiz_session.__doc__)
+    p.add_argument("--questions", type=int, default=10, help="questions in the regular quiz")
+    p.add_argument("--sessions", type=int, default=10000)
+    p.set_defaults(func=bench_quiz_session)
+
+    p = sub.add_parser("topic-router", help=bench_topic_router.__doc__)
+    p.add_argument("--keywords", type=int, default=10000)
+    p.add_argument("--subjects", type=int, default=40)
+    p.add_argument("--topics", type=int, default=2000)
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(func=bench_topic_router)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
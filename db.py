@@ -0,0 +1,278 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import querylog
+
+# =============================================================================
+# CONNECTION POOL
+# =============================================================================
+
+POOL_SIZE = int(os.environ.get("EDUTUTOR_DB_POOL_SIZE", "8"))
+BUSY_TIMEOUT_MS = int(os.environ.get("EDUTUTOR_DB_BUSY_TIMEOUT_MS", "5000"))
+HEALTH_CHECK_INTERVAL = float(os.environ.get("EDUTUTOR_DB_HEALTH_CHECK_INTERVAL", "30"))
+CHECKOUT_TIMEOUT = float(os.environ.get("EDUTUTOR_DB_CHECKOUT_TIMEOUT", "30"))
+
+# Read-only analytics connections: their own small pool, a larger page cache
+# (in KiB) and memory-mapped reads, so report scans neither evict the hot
+# pages of the main pool nor take any lock a writer could wait on
+ANALYTICS_POOL_SIZE = int(os.environ.get("EDUTUTOR_ANALYTICS_POOL_SIZE", "2"))
+ANALYTICS_CACHE_KB = int(os.environ.get("EDUTUTOR_ANALYTICS_CACHE_KB", "65536"))
+ANALYTICS_MMAP_BYTES = int(os.environ.get("EDUTUTOR_ANALYTICS_MMAP_BYTES", str(256 * 1024 * 1024)))
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes available in time"""
+
+
+def open_connection(database_path: str, busy_timeout_ms: int = BUSY_TIMEOUT_MS,
+                    read_only: bool = False, instrumented: bool = False) -> sqlite3.Connection:
+    """Open a connection in WAL mode with the configured busy timeout
+
+    read_only connections refuse writes (PRAGMA query_only) and use the
+    analytics cache and mmap sizes. instrumented connections record every
+    statement in querylog; pooled connections are sampled per checkout instead.
+    """
+    conn = sqlite3.connect(
+        database_path,
+        timeout=busy_timeout_ms / 1000,
+        check_same_thread=False,
+        factory=querylog.InstrumentedConnection if instrumented and querylog.ENABLED else sqlite3.Connection
+    )
+    conn.row_factory = sqlite3.Row
+    querylog.watch(conn)
+    conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+    if database_path != ":memory:":
+        conn.execute("PRAGMA journal_mode = WAL")
+        # NORMAL is durable across application crashes in WAL mode
+        conn.execute("PRAGMA synchronous = NORMAL")
+    if read_only:
+        conn.execute(f"PRAGMA cache_size = {-int(ANALYTICS_CACHE_KB)}")
+        conn.execute(f"PRAGMA mmap_size = {int(ANALYTICS_MMAP_BYTES)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+@contextmanager
+def read_snapshot(conn):
+    """Run several queries against one consistent snapshot of the database
+
+    Opens a WAL read transaction and pins its snapshot straight away, so
+    every statement in the block sees the same data no matter what commits
+    meanwhile. Readers never block writers in WAL mode, but a snapshot held
+    open stops checkpoints from passing it, so keep the block to one report.
+    ATTACH is not allowed inside the block.
+    """
+    if conn.in_transaction:
+        conn.rollback()
+    conn.execute("BEGIN")
+    try:
+        conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+        yield conn
+    finally:
+        conn.rollback()
+
+
+class PooledConnection:
+    """Connection handle whose close() returns the connection to its pool
+
+    Use it as a context manager so the connection goes back even when a
+    query raises; any transaction still open is rolled back on release. For
+    checkouts sampled by querylog, cursors are instrumented.
+    """
+
+    def __init__(self, pool: "ConnectionPool", conn: sqlite3.Connection, sampled: bool = False,
+                 caller: Optional[str] = None):
+        self._pool = pool
+        self._conn = conn
+        self._closed = False
+        self._sampled = sampled
+        self._previous_caller = querylog.checked_out(conn, caller)
+
+    def __getattr__(self, name):
+        if self._closed:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def cursor(self, factory=None):
+        if self._closed:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        if factory is None:
+            factory = querylog.InstrumentedCursor if self._sampled else sqlite3.Cursor
+        return self._conn.cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            querylog.checked_out(self._conn, self._previous_caller)
+            self._pool.release(self._conn)
+
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections with per-thread reuse.
+
+    A thread that checks out a connection while it already holds one gets the
+    same connection back, so nested data-layer calls never need a second
+    connection. Idle connections are health-checked before being handed out
+    again if they have been sitting unused for longer than
+    ``health_check_interval`` seconds.
+    """
+
+    def __init__(self, database_path: str, max_size: int = POOL_SIZE,
+                 busy_timeout_ms: int = BUSY_TIMEOUT_MS,
+                 health_check_interval: float = HEALTH_CHECK_INTERVAL,
+                 read_only: bool = False):
+        self.database_path = database_path
+        self.read_only = read_only
+        self.max_size = max(1, max_size)
+        self.busy_timeout_ms = busy_timeout_ms
+        self.health_check_interval = health_check_interval
+        self._local = threading.local()
+        self._cond = threading.Condition()
+        self._idle = []  # (connection, released_at), most recently used last
+        self._size = 0
+        self._closed = False
+
+    def connect(self, timeout: float = CHECKOUT_TIMEOUT, caller: Optional[str] = None) -> PooledConnection:
+        """Check out a connection; use the handle in a with block to return it
+
+        ``caller`` names the data-layer function for querylog's slow
+        statement capture.
+        """
+        held = getattr(self._local, "held", None)
+        if held is not None:
+            self._local.depth += 1
+            return PooledConnection(self, held, querylog.sample(caller), caller)
+
+        conn = self._checkout(timeout)
+        self._local.held = conn
+        self._local.depth = 1
+        return PooledConnection(self, conn, querylog.sample(caller), caller)
+
+    def release(self, conn: sqlite3.Connection):
+        """Return a connection checked out by the current thread"""
+        if getattr(self._local, "held", None) is conn:
+            self._local.depth -= 1
+            if self._local.depth > 0:
+                return
+            self._local.held = None
+
+        if conn.in_transaction:
+            conn.rollback()
+
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                conn.close()
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def close(self):
+        """Close all idle connections; checked-out ones close on release"""
+        with self._cond:
+            self._closed = True
+            for conn, _ in self._idle:
+                conn.close()
+                self._size -= 1
+            self._idle.clear()
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "max_size": self.max_size,
+            }
+
+    def _checkout(self, timeout: float) -> sqlite3.Connection:
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout(f"Connection pool for {self.database_path} is closed")
+                if self._idle:
+                    conn, released_at = self._idle.pop()
+                    if self._is_healthy(conn, released_at):
+                        return conn
+                    self._size -= 1
+                    continue
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    raise PoolTimeout(
+                        f"No connection available for {self.database_path} "
+                        f"after {timeout:.1f}s (pool size {self.max_size})"
+                    )
+
+        try:
+            return open_connection(self.database_path, self.busy_timeout_ms, self.read_only)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def _is_healthy(self, conn: sqlite3.Connection, released_at: float) -> bool:
+        if time.monotonic() - released_at < self.health_check_interval:
+            return True
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            return False
+
+
+_pools: Dict[tuple, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(database_path: str, max_size: Optional[int] = None,
+             busy_timeout_ms: Optional[int] = None, read_only: bool = False) -> ConnectionPool:
+    """Get the process-wide pool for a database file, creating it on first use
+
+    read_only selects the separate analytics pool (see open_connection).
+    """
+    with _pools_lock:
+        pool = _pools.get((database_path, read_only))
+        if pool is None:
+            pool = ConnectionPool(
+                database_path,
+                max_size=max_size or (ANALYTICS_POOL_SIZE if read_only else POOL_SIZE),
+                busy_timeout_ms=busy_timeout_ms or BUSY_TIMEOUT_MS,
+                read_only=read_only
+            )
+            _pools[(database_path, read_only)] = pool
+        return pool
+
+
+def close_pools():
+    """Close every pool (used at shutdown and by tooling that swaps databases)"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
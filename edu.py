@@ -4,207 +4,22 @@ import pandas as pd
 import json
 import plotly.express as px
 import plotly.graph_objects as go
-import sqlite3
 import random
-from werkzeug.security import generate_password_hash, check_password_hash
+from auth import AuthUnavailable, hash_password
+from concurrent.futures import TimeoutError as FutureTimeout
 from datetime import datetime
 from typing import Dict, List, Any, Optional
+from models import (
+    init_db, authenticate_user, create_user, update_user_login,
+    save_quiz_attempt, get_user_quiz_history, update_user_diagnostic
+)
+from async_models import dashboard
+from lastlogin import LAST_LOGIN_APPROXIMATE
+from writer import WRITE_TIMEOUT, WriterClosed
+import question_bank
+import topic_router
 import os
 
-# =============================================================================
-# DATABASE LAYER - FIXED VERSION
-# =============================================================================
-
-DATABASE_PATH = "edututor_fixed.db"
-
-def get_db_connection():
-    """Get database connection with proper configuration"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def init_db():
-    """Initialize database with all required tables - Fixed version"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Check if tables exist and drop if needed for clean setup
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-    existing_tables = [row[0] for row in cursor.fetchall()]
-    
-    if 'quiz_attempts' in existing_tables:
-        # Check if course_name column exists
-        cursor.execute("PRAGMA table_info(quiz_attempts)")
-        columns = [column[1] for column in cursor.fetchall()]
-        if 'course_name' not in columns:
-            cursor.execute('DROP TABLE quiz_attempts')
-    
-    # Users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            user_type TEXT NOT NULL CHECK (user_type IN ('student', 'educator')),
-            diagnostic_completed BOOLEAN DEFAULT FALSE,
-            difficulty_level INTEGER DEFAULT 1,
-            student_level TEXT DEFAULT 'Beginner',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_login TIMESTAMP
-        )
-    ''')
-    
-    # Quiz attempts table with correct schema
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS quiz_attempts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            quiz_id INTEGER,
-            course_name TEXT NOT NULL,
-            topic TEXT NOT NULL,
-            answers TEXT NOT NULL,
-            score INTEGER NOT NULL,
-            total_questions INTEGER NOT NULL,
-            percentage REAL NOT NULL,
-            feedback TEXT,
-            attempt_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    
-    # Insert demo users if they don't exist
-    cursor.execute("SELECT COUNT(*) FROM users")
-    if cursor.fetchone()[0] == 0:
-        demo_users = [
-            ('Demo Student', 'demo@student.edu', generate_password_hash('demo123'), 'student', 'Intermediate'),
-            ('Prof Demo', 'prof@university.edu', generate_password_hash('prof123'), 'educator', 'Advanced'),
-            ('Alice Smith', 'alice@student.edu', generate_password_hash('alice123'), 'student', 'Advanced'),
-            ('John Doe', 'john@student.edu', generate_password_hash('john123'), 'student', 'Beginner')
-        ]
-        
-        cursor.executemany('''
-            INSERT INTO users (name, email, password_hash, user_type, student_level)
-            VALUES (?, ?, ?, ?, ?)
-        ''', demo_users)
-    
-    conn.commit()
-    conn.close()
-
-def get_user_by_email(email):
-    """Get user by email"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE email = ?", (email,))
-    user = cursor.fetchone()
-    conn.close()
-    return dict(user) if user else None
-
-def create_user(name, email, password_hash, user_type):
-    """Create new user"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute('''
-            INSERT INTO users (name, email, password_hash, user_type)
-            VALUES (?, ?, ?, ?)
-        ''', (name, email, password_hash, user_type))
-        user_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return user_id
-    except sqlite3.IntegrityError:
-        conn.close()
-        return None
-
-def update_user_login(user_id):
-    """Update user's last login timestamp"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?",
-        (user_id,)
-    )
-    conn.commit()
-    conn.close()
-
-def save_quiz_attempt(user_id, course_name, topic, answers, score, total_questions, feedback=None):
-    """Save quiz attempt to database"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    percentage = (score / total_questions) * 100
-    
-    cursor.execute('''
-        INSERT INTO quiz_attempts (user_id, course_name, topic, answers, score, total_questions, percentage, feedback)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (user_id, course_name, topic, answers, score, total_questions, percentage, feedback))
-    
-    conn.commit()
-    conn.close()
-
-def get_user_quiz_history(user_id):
-    """Get user's quiz history"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT course_name, topic, score, total_questions, percentage, attempt_date
-        FROM quiz_attempts
-        WHERE user_id = ?
-        ORDER BY attempt_date DESC
-    ''', (user_id,))
-    history = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in history]
-
-def get_all_students_progress():
-    """Get progress data for all students"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT u.id, u.name, u.email, u.student_level,
-               COUNT(qa.id) as total_quizzes,
-               COALESCE(AVG(qa.percentage), 0) as avg_score,
-               MAX(qa.attempt_date) as last_activity
-        FROM users u
-        LEFT JOIN quiz_attempts qa ON u.id = qa.user_id
-        WHERE u.user_type = 'student'
-        GROUP BY u.id, u.name, u.email, u.student_level
-    ''')
-    students = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in students]
-
-def get_course_analytics():
-    """Get course-wide analytics"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT course_name, topic,
-               COUNT(*) as attempts,
-               AVG(percentage) as avg_score,
-               MIN(percentage) as min_score,
-               MAX(percentage) as max_score
-        FROM quiz_attempts
-        GROUP BY course_name, topic
-        ORDER BY course_name, avg_score DESC
-    ''')
-    analytics = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in analytics]
-
-def update_user_diagnostic(user_id, difficulty_level, student_level):
-    """Update user's diagnostic results"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE users 
-        SET diagnostic_completed = TRUE, difficulty_level = ?, student_level = ?
-        WHERE id = ?
-    ''', (difficulty_level, student_level, user_id))
-    conn.commit()
-    conn.close()
-
 # =============================================================================
 # AI QUIZ GENERATOR
 # =============================================================================
@@ -213,245 +28,10 @@ class AIQuizGenerator:
     """Enhanced AI Quiz Generator with comprehensive question banks"""
     
     def __init__(self):
-        self.question_banks = {
-            "mathematics": {
-                "easy": [
-                    {
-                        "question": "What is 15% of 200?",
-                        "options": ["20", "25", "30", "35"],
-                        "correct": 2,
-                        "explanation": "15% of 200 = 0.15 × 200 = 30",
-                        "topic": "Percentages"
-                    },
-                    {
-                        "question": "What is the area of a rectangle with length 8 and width 5?",
-                        "options": ["40", "13", "26", "35"],
-                        "correct": 0,
-                        "explanation": "Area = length × width = 8 × 5 = 40",
-                        "topic": "Basic Geometry"
-                    },
-                    {
-                        "question": "Solve: 3x + 7 = 16",
-                        "options": ["x = 2", "x = 3", "x = 4", "x = 5"],
-                        "correct": 1,
-                        "explanation": "3x = 16 - 7 = 9, so x = 3",
-                        "topic": "Basic Algebra"
-                    },
-                    {
-                        "question": "What is 45 ÷ 9?",
-                        "options": ["4", "5", "6", "7"],
-                        "correct": 1,
-                        "explanation": "45 ÷ 9 = 5",
-                        "topic": "Basic Division"
-                    }
-                ],
-                "medium": [
-                    {
-                        "question": "What is the derivative of x² + 3x?",
-                        "options": ["2x + 3", "x² + 3", "2x", "3x"],
-                        "correct": 0,
-                        "explanation": "Using power rule: d/dx(x²) = 2x and d/dx(3x) = 3",
-                        "topic": "Calculus"
-                    },
-                    {
-                        "question": "Find the limit of (x² - 4)/(x - 2) as x approaches 2",
-                        "options": ["2", "4", "0", "Undefined"],
-                        "correct": 1,
-                        "explanation": "Factor: (x+2)(x-2)/(x-2) = x+2, limit = 4",
-                        "topic": "Limits"
-                    },
-                    {
-                        "question": "What is the slope of the line y = 3x + 2?",
-                        "options": ["2", "3", "5", "1"],
-                        "correct": 1,
-                        "explanation": "In y = mx + b form, m is the slope, so slope = 3",
-                        "topic": "Linear Equations"
-                    }
-                ],
-                "hard": [
-                    {
-                        "question": "Solve the differential equation dy/dx = 2y",
-                        "options": ["y = Ce^(2x)", "y = C + 2x", "y = 2Ce^x", "y = Ce^x"],
-                        "correct": 0,
-                        "explanation": "Separable equation: dy/y = 2dx, ln|y| = 2x + C",
-                        "topic": "Differential Equations"
-                    },
-                    {
-                        "question": "Find the integral of sin(x)cos(x)dx",
-                        "options": ["sin²(x)/2 + C", "-cos²(x)/2 + C", "sin(x)cos(x) + C", "Both A and B"],
-                        "correct": 3,
-                        "explanation": "Using substitution or identity, both forms are correct",
-                        "topic": "Integration"
-                    }
-                ]
-            },
-            "computer_science": {
-                "easy": [
-                    {
-                        "question": "What does CPU stand for?",
-                        "options": ["Central Processing Unit", "Computer Processing Unit", "Central Program Unit", "Computer Program Unit"],
-                        "correct": 0,
-                        "explanation": "CPU stands for Central Processing Unit",
-                        "topic": "Computer Basics"
-                    },
-                    {
-                        "question": "Which of these is a programming language?",
-                        "options": ["HTML", "Python", "CSS", "HTTP"],
-                        "correct": 1,
-                        "explanation": "Python is a general-purpose programming language",
-                        "topic": "Programming Languages"
-                    },
-                    {
-                        "question": "What is binary code made of?",
-                        "options": ["0s and 1s", "Letters", "Numbers 1-9", "Symbols"],
-                        "correct": 0,
-                        "explanation": "Binary code uses only 0s and 1s",
-                        "topic": "Computer Basics"
-                    }
-                ],
-                "medium": [
-                    {
-                        "question": "What is the time complexity of binary search?",
-                        "options": ["O(n)", "O(log n)", "O(n²)", "O(1)"],
-                        "correct": 1,
-                        "explanation": "Binary search halves the search space each iteration",
-                        "topic": "Algorithms"
-                    },
-                    {
-                        "question": "Which data structure uses LIFO principle?",
-                        "options": ["Queue", "Stack", "Array", "Linked List"],
-                        "correct": 1,
-                        "explanation": "Stack follows Last In, First Out (LIFO) principle",
-                        "topic": "Data Structures"
-                    },
-                    {
-                        "question": "What does SQL stand for?",
-                        "options": ["Structured Query Language", "Simple Query Language", "Standard Query Language", "System Query Language"],
-                        "correct": 0,
-                        "explanation": "SQL stands for Structured Query Language",
-                        "topic": "Databases"
-                    }
-                ],
-                "hard": [
-                    {
-                        "question": "What is the worst-case time complexity of QuickSort?",
-                        "options": ["O(n log n)", "O(n²)", "O(n)", "O(log n)"],
-                        "correct": 1,
-                        "explanation": "QuickSort worst case is O(n²) when pivot is always smallest/largest",
-                        "topic": "Advanced Algorithms"
-                    },
-                    {
-                        "question": "Which design pattern ensures a class has only one instance?",
-                        "options": ["Factory", "Observer", "Singleton", "Strategy"],
-                        "correct": 2,
-                        "explanation": "Singleton pattern ensures only one instance of a class exists",
-                        "topic": "Design Patterns"
-                    }
-                ]
-            },
-            "physics": {
-                "easy": [
-                    {
-                        "question": "What is the unit of force in SI system?",
-                        "options": ["Joule", "Watt", "Newton", "Pascal"],
-                        "correct": 2,
-                        "explanation": "The SI unit of force is Newton (N)",
-                        "topic": "Units and Measurements"
-                    },
-                    {
-                        "question": "What is the speed of light in vacuum?",
-                        "options": ["3 × 10⁸ m/s", "3 × 10⁶ m/s", "3 × 10¹⁰ m/s", "3 × 10⁹ m/s"],
-                        "correct": 0,
-                        "explanation": "Speed of light in vacuum is approximately 3 × 10⁸ m/s",
-                        "topic": "Constants"
-                    }
-                ],
-                "medium": [
-                    {
-                        "question": "What is the acceleration due to gravity on Earth?",
-                        "options": ["9.8 m/s²", "10 m/s²", "9.81 m/s²", "9.0 m/s²"],
-                        "correct": 2,
-                        "explanation": "Standard acceleration due to gravity is approximately 9.81 m/s²",
-                        "topic": "Mechanics"
-                    },
-                    {
-                        "question": "What is Newton's second law of motion?",
-                        "options": ["F = ma", "E = mc²", "P = mv", "W = Fd"],
-                        "correct": 0,
-                        "explanation": "Newton's second law states that Force equals mass times acceleration",
-                        "topic": "Classical Mechanics"
-                    }
-                ],
-                "hard": [
-                    {
-                        "question": "What is Schrödinger's equation used for?",
-                        "options": ["Classical mechanics", "Quantum mechanics", "Thermodynamics", "Electromagnetism"],
-                        "correct": 1,
-                        "explanation": "Schrödinger's equation describes quantum mechanical systems",
-                        "topic": "Quantum Physics"
-                    },
-                    {
-                        "question": "What is the uncertainty principle?",
-                        "options": ["ΔxΔp ≥ ħ/2", "E = hf", "λ = h/p", "F = qE"],
-                        "correct": 0,
-                        "explanation": "Heisenberg uncertainty principle: ΔxΔp ≥ ħ/2",
-                        "topic": "Quantum Physics"
-                    }
-                ]
-            },
-            "literature": {
-                "easy": [
-                    {
-                        "question": "Who wrote 'Romeo and Juliet'?",
-                        "options": ["Charles Dickens", "William Shakespeare", "Jane Austen", "Mark Twain"],
-                        "correct": 1,
-                        "explanation": "Romeo and Juliet was written by William Shakespeare",
-                        "topic": "Classic Literature"
-                    },
-                    {
-                        "question": "What is a haiku?",
-                        "options": ["A type of novel", "A Japanese poem", "A play", "An essay"],
-                        "correct": 1,
-                        "explanation": "A haiku is a traditional Japanese poem with 17 syllables",
-                        "topic": "Poetry"
-                    }
-                ],
-                "medium": [
-                    {
-                        "question": "What literary device is 'The wind whispered through the trees'?",
-                        "options": ["Metaphor", "Simile", "Personification", "Alliteration"],
-                        "correct": 2,
-                        "explanation": "Personification gives human characteristics to non-human things",
-                        "topic": "Literary Devices"
-                    },
-                    {
-                        "question": "Who wrote '1984'?",
-                        "options": ["George Orwell", "Aldous Huxley", "Ray Bradbury", "H.G. Wells"],
-                        "correct": 0,
-                        "explanation": "1984 was written by George Orwell",
-                        "topic": "Modern Literature"
-                    }
-                ],
-                "hard": [
-                    {
-                        "question": "In which novel does the character Jay Gatsby appear?",
-                        "options": ["To Kill a Mockingbird", "The Great Gatsby", "1984", "Pride and Prejudice"],
-                        "correct": 1,
-                        "explanation": "Jay Gatsby is the protagonist of F. Scott Fitzgerald's 'The Great Gatsby'",
-                        "topic": "American Literature"
-                    },
-                    {
-                        "question": "What is stream of consciousness in literature?",
-                        "options": ["A poetic form", "A narrative technique", "A literary movement", "A type of meter"],
-                        "correct": 1,
-                        "explanation": "Stream of consciousness is a narrative technique that presents thoughts as they occur",
-                        "topic": "Literary Techniques"
-                    }
-                ]
-            }
-        }
+        # Shared, read-only; built once per process (see question_bank.py)
+        self.question_banks = question_bank.get("edu")
 
-    def generate_diagnostic_quiz(self, num_questions: int = 10) -> List[Dict[str, Any]]:
+    def generate_diagnostic_quiz(self, num_questions: int = 10) -> List[question_bank.QuizQuestion]:
         """Generate a diagnostic quiz to assess student level"""
         diagnostic_questions = []
         subjects = list(self.question_banks.keys())
@@ -465,19 +45,29 @@ class AIQuizGenerator:
             
             for _ in range(count):
                 subject = random.choice(subjects)
-                if difficulty in self.question_banks[subject]:
-                    questions = self.question_banks[subject][difficulty]
-                    if questions:
-                        question = random.choice(questions).copy()
-                        question['difficulty'] = difficulty
-                        question['subject'] = subject
-                        diagnostic_questions.append(question)
+                for index in self.question_banks.select(1, [subject], [difficulty]):
+                    diagnostic_questions.append(self._quiz_question(index, difficulty=difficulty, subject=subject))
         
         random.shuffle(diagnostic_questions)
         return diagnostic_questions
 
-    def generate_quiz(self, topic: str, difficulty_level: int = 2, subject: str = "general", num_questions: int = 5) -> List[Dict[str, Any]]:
-        """Generate a quiz based on topic and difficulty"""
+    def quiz_handle(self, questions: List[question_bank.QuizQuestion]) -> question_bank.QuizHandle:
+        """What a session should keep of a generated quiz (see question_bank.QuizHandle)"""
+        return question_bank.QuizHandle.of(self.question_banks, questions)
+
+    def _quiz_question(self, index: int, **attributes) -> question_bank.QuizQuestion:
+        """A bank question for one quiz; ``attributes`` and later writes stay with the quiz"""
+        return question_bank.QuizQuestion(self.question_banks.question(index), **attributes)
+
+    def generate_quiz(self, topic: str, difficulty_level: int = 2, subject: str = "general", num_questions: int = 5,
+                      difficulties: Optional[List[str]] = None, topics: Optional[List[str]] = None,
+                      exclude_ids: Optional[List[str]] = None) -> List[question_bank.QuizQuestion]:
+        """Generate a quiz based on topic and difficulty
+
+        Optional filters narrow the pool: ``difficulties`` replaces the level
+        (e.g. ["medium", "hard"]), ``topics`` keeps those bank topics and
+        ``exclude_ids`` skips questions by id (e.g. ones already seen).
+        """
         difficulty_map = {1: "easy", 2: "medium", 3: "hard"}
         difficulty = difficulty_map.get(difficulty_level, "medium")
         
@@ -485,49 +75,28 @@ class AIQuizGenerator:
             subject = self._determine_subject_from_topic(topic)
         
         subject_key = subject.lower().replace(" ", "_")
-        
-        if subject_key in self.question_banks and difficulty in self.question_banks[subject_key]:
-            available_questions = self.question_banks[subject_key][difficulty].copy()
-        else:
-            available_questions = self.question_banks["mathematics"][difficulty].copy()
-        
-        if len(available_questions) < num_questions:
-            for other_diff in ["easy", "medium", "hard"]:
-                if other_diff != difficulty and subject_key in self.question_banks:
-                    if other_diff in self.question_banks[subject_key]:
-                        available_questions.extend(self.question_banks[subject_key][other_diff])
-        
-        selected_questions = random.sample(
-            available_questions, 
-            min(num_questions, len(available_questions))
-        )
-        
-        for question in selected_questions:
-            question['generated_topic'] = topic
-            question['difficulty'] = difficulty
-            question['subject'] = subject
-        
-        return selected_questions
+        if subject_key not in self.question_banks:
+            subject_key = "mathematics"
+        
+        bank = self.question_banks
+        exclude_ids = exclude_ids or ()
+        selected = bank.select(num_questions, [subject_key], difficulties or [difficulty], topics, exclude_ids)
+        
+        if len(selected) < num_questions and not difficulties:
+            other_difficulties = [other for other in bank[subject_key] if other != difficulty]
+            selected += bank.select(num_questions - len(selected), [subject_key], other_difficulties,
+                                    topics, exclude_ids)
+        
+        # Each question keeps the difficulty of the run it came from, which
+        # differs from the level with a difficulties filter or a top-up
+        return [
+            self._quiz_question(index, generated_topic=topic, difficulty=bank.location(index)[1], subject=subject)
+            for index in selected
+        ]
 
     def _determine_subject_from_topic(self, topic: str) -> str:
-        """Determine subject based on topic keywords"""
-        topic_lower = topic.lower()
-        
-        math_keywords = ["math", "algebra", "calculus", "geometry", "statistics", "equation", "derivative", "integral"]
-        cs_keywords = ["programming", "algorithm", "data structure", "computer", "coding", "software", "python", "java"]
-        physics_keywords = ["physics", "force", "energy", "momentum", "gravity", "quantum", "mechanics"]
-        literature_keywords = ["literature", "novel", "poem", "shakespeare", "author", "writing", "story"]
-        
-        if any(keyword in topic_lower for keyword in math_keywords):
-            return "mathematics"
-        elif any(keyword in topic_lower for keyword in cs_keywords):
-            return "computer_science"
-        elif any(keyword in topic_lower for keyword in physics_keywords):
-            return "physics"
-        elif any(keyword in topic_lower for keyword in literature_keywords):
-            return "literature"
-        else:
-            return "mathematics"
+        """Determine subject based on topic keywords (see topic_router.py)"""
+        return topic_router.route(topic).subject
 
     def evaluate_answers(self, questions: List[Dict], answers: List[int]) -> Dict[str, Any]:
         """Evaluate quiz answers and provide detailed feedback"""
@@ -617,7 +186,7 @@ class AIQuizGenerator:
         
         return recommendations
 
-    def generate_adaptive_quiz(self, user_history: List[Dict], subject: str, num_questions: int = 8) -> List[Dict[str, Any]]:
+    def generate_adaptive_quiz(self, user_history: List[Dict], subject: str, num_questions: int = 8) -> List[question_bank.QuizQuestion]:
         """Generate adaptive quiz based on user's performance history"""
         if not user_history:
             return self.generate_quiz("General Assessment", 2, subject, num_questions)
@@ -696,8 +265,11 @@ def show_login_page():
             
             if st.button("Login", use_container_width=True, key="login_btn"):
                 if email and password:
-                    user = get_user_by_email(email)
-                    if user and check_password_hash(user['password_hash'], password):
+                    try:
+                        user, busy = authenticate_user(email, password), False
+                    except AuthUnavailable:
+                        user, busy = None, True
+                    if user:
                         st.session_state.logged_in = True
                         st.session_state.user_id = user['id']
                         st.session_state.username = user['name']
@@ -708,6 +280,8 @@ def show_login_page():
                         update_user_login(user['id'])
                         st.success("Logged in successfully!")
                         st.rerun()
+                    elif busy:
+                        st.error("Too many sign-ins right now, please try again in a moment")
                     else:
                         st.error("Invalid email or password")
                 else:
@@ -722,8 +296,10 @@ def show_login_page():
             
             if st.button("Register", use_container_width=True, key="register_btn"):
                 if name and email and password:
-                    password_hash = generate_password_hash(password)
-                    user_id = create_user(name, email, password_hash, user_type)
+                    try:
+                        user_id, busy = create_user(name, email, hash_password(password), user_type), False
+                    except AuthUnavailable:
+                        user_id, busy = None, True
                     
                     if user_id:
                         st.session_state.logged_in = True
@@ -735,6 +311,8 @@ def show_login_page():
                         
                         st.success("Registration successful!")
                         st.rerun()
+                    elif busy:
+                        st.error("Too many sign-ins right now, please try again in a moment")
                     else:
                         st.error("Email already exists")
                 else:
@@ -782,14 +360,17 @@ def show_educator_interface():
     
     tab1, tab2, tab3, tab4 = st.tabs(["👥 Students", "📈 Analytics", "📝 Quiz Management", "📚 Courses"])
     
+    # Both reports come from one snapshot, read on the async reader lane
+    students_data, analytics_data = dashboard().result()
+    
     with tab1:
-        show_student_list()
+        show_student_list(students_data)
     
     with tab2:
-        show_analytics()
+        show_analytics(analytics_data)
     
     with tab3:
-        show_quiz_management()
+        show_quiz_management(analytics_data)
     
     with tab4:
         show_course_management()
@@ -835,7 +416,8 @@ def show_quiz_interface():
     
     if topic and st.button("Generate New Quiz"):
         quiz_generator = AIQuizGenerator()
-        user_history = get_user_quiz_history(st.session_state.user_id)
+        # The adaptive path only looks at the most recent attempts
+        user_history = get_user_quiz_history(st.session_state.user_id, limit=5, columns=('percentage',))
         
         with st.spinner("Generating AI-powered quiz..."):
             if len(user_history) > 3:
@@ -844,7 +426,8 @@ def show_quiz_interface():
                 difficulty_level = 1 if st.session_state.student_level == 'Beginner' else 2 if st.session_state.student_level == 'Intermediate' else 3
                 quiz_questions = quiz_generator.generate_quiz(topic, difficulty_level, subject_type)
         
-        st.session_state.current_quiz = quiz_questions
+        # Only ids and the option order; the questions stay in the shared bank
+        st.session_state.current_quiz = quiz_generator.quiz_handle(quiz_questions)
         st.session_state.quiz_topic = topic
         st.session_state.quiz_subject = subject_type
         st.session_state.quiz_answers = {}
@@ -853,7 +436,7 @@ def show_quiz_interface():
         st.markdown("---")
         st.markdown(f"### Quiz: {st.session_state.get('quiz_topic', 'General Assessment')}")
         
-        quiz_questions = st.session_state.current_quiz
+        quiz_questions = st.session_state.current_quiz.questions()
         
         for i, question in enumerate(quiz_questions):
             st.markdown(f"**Question {i+1}:** {question['question']}")
@@ -874,39 +457,43 @@ def show_quiz_interface():
                 quiz_generator = AIQuizGenerator()
                 evaluation = quiz_generator.evaluate_answers(quiz_questions, list(st.session_state.quiz_answers.values()))
                 
-                save_quiz_attempt(
-                    user_id=st.session_state.user_id,
-                    course_name=st.session_state.get('quiz_subject', 'General'),
-                    topic=st.session_state.get('quiz_topic', 'General Quiz'),
-                    answers=json.dumps(list(st.session_state.quiz_answers.values())),
-                    score=evaluation['correct_answers'],
-                    total_questions=evaluation['total_questions'],
-                    feedback=json.dumps(evaluation['feedback'])
-                )
-                
-                st.success(f"Quiz completed! Score: {evaluation['correct_answers']}/{evaluation['total_questions']} ({evaluation['percentage']:.1f}%)")
-                st.markdown(f"**Performance Level:** {evaluation['performance_level']}")
+                # Wait for the group commit so the Progress tab sees this attempt
+                try:
+                    save_quiz_attempt(
+                        user_id=st.session_state.user_id,
+                        course_name=st.session_state.get('quiz_subject', 'General'),
+                        topic=st.session_state.get('quiz_topic', 'General Quiz'),
+                        answers=json.dumps(list(st.session_state.quiz_answers.values())),
+                        score=evaluation['correct_answers'],
+                        total_questions=evaluation['total_questions'],
+                        feedback=json.dumps(evaluation['feedback'])
+                    ).result(timeout=WRITE_TIMEOUT)
+                except (FutureTimeout, WriterClosed):
+                    st.error("Your quiz could not be saved right now. Please submit it again in a moment.")
+                else:
+                    st.success(f"Quiz completed! Score: {evaluation['correct_answers']}/{evaluation['total_questions']} ({evaluation['percentage']:.1f}%)")
+                    st.markdown(f"**Performance Level:** {evaluation['performance_level']}")
                 
-                with st.expander("View Detailed Feedback"):
-                    for item in evaluation['feedback']:
-                        if item['is_correct']:
-                            st.success(f"Q{item['question_id']+1}: ✓ Correct!")
-                        else:
-                            st.error(f"Q{item['question_id']+1}: ✗ Incorrect")
-                            st.write(f"Your answer: {item['your_answer']}")
-                            st.write(f"Correct answer: {item['correct_answer']}")
-                            st.write(f"Explanation: {item['explanation']}")
+                    with st.expander("View Detailed Feedback"):
+                        for item in evaluation['feedback']:
+                            if item['is_correct']:
+                                st.success(f"Q{item['question_id']+1}: ✓ Correct!")
+                            else:
+                                st.error(f"Q{item['question_id']+1}: ✗ Incorrect")
+                                st.write(f"Your answer: {item['your_answer']}")
+                                st.write(f"Correct answer: {item['correct_answer']}")
+                                st.write(f"Explanation: {item['explanation']}")
                 
-                if evaluation['recommendations']:
-                    st.markdown("### Recommendations")
-                    for rec in evaluation['recommendations']:
-                        st.write(f"• {rec}")
+                    if evaluation['recommendations']:
+                        st.markdown("### Recommendations")
+                        for rec in evaluation['recommendations']:
+                            st.write(f"• {rec}")
                 
-                for key in ['current_quiz', 'quiz_answers', 'quiz_topic', 'quiz_subject']:
-                    if key in st.session_state:
-                        del st.session_state[key]
+                    for key in ['current_quiz', 'quiz_answers', 'quiz_topic', 'quiz_subject']:
+                        if key in st.session_state:
+                            del st.session_state[key]
                 
-                st.rerun()
+                    st.rerun()
     
     st.markdown("---")
     if st.button("Take Diagnostic Test"):
@@ -919,10 +506,10 @@ def show_quiz_interface():
         
         if 'diagnostic_quiz' not in st.session_state:
             quiz_generator = AIQuizGenerator()
-            st.session_state.diagnostic_quiz = quiz_generator.generate_diagnostic_quiz()
+            st.session_state.diagnostic_quiz = quiz_generator.quiz_handle(quiz_generator.generate_diagnostic_quiz())
             st.session_state.diagnostic_answers = {}
         
-        diagnostic_questions = st.session_state.diagnostic_quiz
+        diagnostic_questions = st.session_state.diagnostic_quiz.questions()
         
         for i, question in enumerate(diagnostic_questions):
             st.markdown(f"**Question {i+1}:** {question['question']}")
@@ -1000,7 +587,7 @@ def show_student_progress():
 def show_achievements():
     st.markdown("#### Achievements")
     
-    quiz_history = get_user_quiz_history(st.session_state.user_id)
+    quiz_history = get_user_quiz_history(st.session_state.user_id, columns=('percentage',))
     
     if not quiz_history:
         st.info("Complete quizzes to unlock achievements!")
@@ -1028,11 +615,9 @@ def show_achievements():
         if perfect_scores >= 3:
             st.success("💯 Perfectionist - 3+ perfect scores!")
 
-def show_student_list():
+def show_student_list(students_data):
     st.markdown("#### Student Performance Overview")
     
-    students_data = get_all_students_progress()
-    
     if not students_data:
         st.info("No student data available yet. Students need to take quizzes to appear here.")
         return
@@ -1053,16 +638,15 @@ def show_student_list():
         active_today = len(df[df['last_activity'].fillna('').str.contains(today, na=False)])
         st.metric("Active Today", active_today)
     
-    display_cols = ['name', 'student_level', 'total_quizzes', 'avg_score', 'last_activity']
+    display_cols = ['name', 'student_level', 'total_quizzes', 'avg_score', 'last_activity', 'last_login']
     display_df = df[display_cols].copy()
-    display_df.columns = ['Name', 'Level', 'Total Quizzes', 'Avg Score (%)', 'Last Activity']
+    display_df.columns = ['Name', 'Level', 'Total Quizzes', 'Avg Score (%)', 'Last Activity',
+                          'Last Login (approx.)' if LAST_LOGIN_APPROXIMATE else 'Last Login']
     st.dataframe(display_df, use_container_width=True)
 
-def show_analytics():
+def show_analytics(analytics_data):
     st.markdown("#### Class Analytics")
     
-    analytics_data = get_course_analytics()
-    
     if not analytics_data:
         st.info("No quiz data available yet. Analytics will appear once students start taking quizzes.")
         return
@@ -1087,12 +671,12 @@ def show_analytics():
         st.plotly_chart(fig2, use_container_width=True)
         
         st.markdown("##### Detailed Analytics")
-        display_df = df_analytics[['course_name', 'topic', 'attempts', 'avg_score', 'min_score', 'max_score']].copy()
-        display_df.columns = ['Course', 'Topic', 'Attempts', 'Avg Score', 'Min Score', 'Max Score']
+        display_df = df_analytics[['course_name', 'topic', 'attempts', 'avg_score', 'min_score', 'max_score', 'score_variance']].copy()
+        display_df.columns = ['Course', 'Topic', 'Attempts', 'Avg Score', 'Min Score', 'Max Score', 'Score Variance']
         display_df = display_df.round(1)
         st.dataframe(display_df, use_container_width=True)
 
-def show_quiz_management():
+def show_quiz_management(analytics):
     st.markdown("#### Quiz Management")
     
     col1, col2 = st.columns(2)
@@ -1126,7 +710,6 @@ def show_quiz_management():
     
     with col2:
         st.markdown("##### Quiz Analytics")
-        analytics = get_course_analytics()
         
         if analytics:
             st.write("**Recent Quiz Performance:**")
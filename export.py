@@ -0,0 +1,246 @@
+import json
+import os
+from typing import Dict, Iterator, List
+
+try:
+    import pyarrow
+    import pyarrow.dataset
+    import pyarrow.fs
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # optional: pip install pyarrow
+    pyarrow = None
+
+import archive
+from payload_codec import decode_payload, load_dictionaries
+
+# =============================================================================
+# COLUMNAR EXPORT
+# =============================================================================
+#
+# Streams quiz_attempts and users (with their student_stats rollup) into
+# Parquet or Arrow IPC files under an export directory, chunk_size rows at a
+# time, so memory use does not depend on table size.
+#
+#   <dir>/attempts/part-<first id>-<last id>.<ext>   one file per export run
+#   <dir>/attempts/_high_water.json                  last exported attempt id
+#   <dir>/users/snapshot.<ext>                       replaced on every run
+#
+# quiz_attempts is append-only, so each run exports only ids above the high
+# water mark (archived terms included). Users change in place and are
+# re-snapshotted. Files are written under a temporary name and renamed when
+# complete, and the mark only moves after the rename, so an interrupted run
+# is simply redone.
+#
+# Arrow IPC files are uncompressed and can be memory-mapped: open_export()
+# lets a dashboard filter and project them without reading whole files.
+
+FORMATS = {"parquet": ".parquet", "ipc": ".arrow"}
+HIGH_WATER_FILE = "_high_water.json"
+
+
+class ExportUnavailable(Exception):
+    """Raised when exporting or reading exports without pyarrow installed"""
+
+
+def _require_pyarrow():
+    if pyarrow is None:
+        raise ExportUnavailable("columnar export needs the 'pyarrow' package")
+
+def attempts_schema(include_payloads: bool = False):
+    _require_pyarrow()
+    fields = [
+        ("id", pyarrow.int64()),
+        ("user_id", pyarrow.int64()),
+        ("course_name", pyarrow.string()),
+        ("topic", pyarrow.string()),
+        ("score", pyarrow.int32()),
+        ("total_questions", pyarrow.int32()),
+        ("percentage", pyarrow.float64()),
+        ("attempt_date", pyarrow.timestamp("s")),
+    ]
+    if include_payloads:
+        fields += [("answers", pyarrow.string()), ("feedback", pyarrow.string())]
+    return pyarrow.schema(fields)
+
+def users_schema():
+    _require_pyarrow()
+    return pyarrow.schema([
+        ("id", pyarrow.int64()),
+        ("name", pyarrow.string()),
+        ("email", pyarrow.string()),
+        ("user_type", pyarrow.string()),
+        ("student_level", pyarrow.string()),
+        ("difficulty_level", pyarrow.int32()),
+        ("created_at", pyarrow.timestamp("s")),
+        ("last_login", pyarrow.timestamp("s")),
+        ("total_quizzes", pyarrow.int64()),
+        ("avg_score", pyarrow.float64()),
+        ("last_activity", pyarrow.timestamp("s")),
+    ])
+
+def attempts_sql(schema: str = "main", include_payloads: bool = False) -> str:
+    payloads = ", answers, feedback" if include_payloads else ""
+    return f'''
+    SELECT id, user_id, course_name, topic, score, total_questions, percentage, attempt_date{payloads}
+    FROM {schema}.quiz_attempts
+    WHERE id > ?
+    ORDER BY id
+'''
+
+# Never exports password_hash
+EXPORT_USERS_SQL = '''
+    SELECT u.id, u.name, u.email, u.user_type, u.student_level, u.difficulty_level,
+           u.created_at, u.last_login,
+           COALESCE(s.total_quizzes, 0) as total_quizzes,
+           s.percentage_sum / NULLIF(s.percentage_count, 0) as avg_score,
+           s.last_activity
+    FROM users u
+    LEFT JOIN student_stats s ON u.id = s.user_id
+    ORDER BY u.id
+'''
+
+def _record_batch(rows, schema):
+    """Build a RecordBatch column by column; timestamps arrive as SQLite text"""
+    columns = []
+    for index, field in enumerate(schema):
+        values = [row[index] for row in rows]
+        if pyarrow.types.is_timestamp(field.type):
+            columns.append(pyarrow.array(values, pyarrow.string()).cast(field.type))
+        else:
+            columns.append(pyarrow.array(values, field.type))
+    return pyarrow.RecordBatch.from_arrays(columns, schema=schema)
+
+class _Writer:
+    """Write record batches to ``path`` via a temporary file renamed on close"""
+
+    def __init__(self, path: str, schema, fmt: str):
+        self.path = path
+        self._tmp = path + ".tmp"
+        if fmt == "parquet":
+            self._writer = pyarrow.parquet.ParquetWriter(self._tmp, schema, compression="zstd")
+        else:
+            self._writer = pyarrow.ipc.new_file(self._tmp, schema)
+        self.rows = 0
+
+    def write(self, batch):
+        self._writer.write_batch(batch)
+        self.rows += batch.num_rows
+
+    def close(self):
+        self._writer.close()
+        os.replace(self._tmp, self.path)
+
+    def abort(self):
+        self._writer.close()
+        os.remove(self._tmp)
+
+def _fetch_chunks(cursor, chunk_size) -> Iterator[List]:
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield rows
+
+def read_high_water(directory: str) -> int:
+    try:
+        with open(os.path.join(directory, "attempts", HIGH_WATER_FILE)) as handle:
+            return json.load(handle)["attempt_id"]
+    except FileNotFoundError:
+        return 0
+
+def _write_high_water(directory, attempt_id):
+    path = os.path.join(directory, "attempts", HIGH_WATER_FILE)
+    with open(path + ".tmp", "w") as handle:
+        json.dump({"attempt_id": attempt_id}, handle)
+    os.replace(path + ".tmp", path)
+
+def export_attempts(conn, directory: str, fmt: str = "parquet", chunk_size: int = 50000,
+                    include_payloads: bool = False, full: bool = False) -> Dict:
+    """Export attempts above the high water mark into a new part file
+
+    Returns {"rows", "first_id", "last_id", "path"}; path is None when there
+    was nothing new.
+    """
+    schema = attempts_schema(include_payloads)
+    os.makedirs(os.path.join(directory, "attempts"), exist_ok=True)
+    after_id = 0 if full else read_high_water(directory)
+    if include_payloads:
+        load_dictionaries(conn)
+
+    def rows_from(cursor, schema_name):
+        cursor.execute(attempts_sql(schema_name, include_payloads), (after_id,))
+        for rows in _fetch_chunks(cursor, chunk_size):
+            if include_payloads:
+                rows = [(*row[:8], decode_payload(row[8]), decode_payload(row[9])) for row in rows]
+            yield rows
+
+    def chunks():
+        yield from rows_from(cursor, "main")
+        for group in archive.term_groups(archive.terms_overlapping(conn)):
+            with archive.attached(conn, group) as schemas:
+                for name in schemas:
+                    yield from rows_from(cursor, name)
+
+    # Named after the ids it holds once they are known
+    writer = _Writer(os.path.join(directory, "attempts", f"part-{after_id + 1:012d}{FORMATS[fmt]}"), schema, fmt)
+    cursor = conn.cursor()
+    first_id, last_id = None, after_id
+    try:
+        for rows in chunks():
+            writer.write(_record_batch(rows, schema))
+            first_id = min(first_id or rows[0][0], rows[0][0])
+            last_id = max(last_id, rows[-1][0])
+    except BaseException:
+        writer.abort()
+        raise
+
+    if writer.rows == 0:
+        writer.abort()
+        return {"rows": 0, "first_id": None, "last_id": None, "path": None}
+    writer.path = os.path.join(directory, "attempts", f"part-{first_id:012d}-{last_id:012d}{FORMATS[fmt]}")
+    writer.close()
+    _write_high_water(directory, last_id)
+    return {"rows": writer.rows, "first_id": first_id, "last_id": last_id, "path": writer.path}
+
+def export_users(conn, directory: str, fmt: str = "parquet", chunk_size: int = 50000) -> Dict:
+    """Snapshot users and their rollup stats, replacing the previous snapshot"""
+    schema = users_schema()
+    os.makedirs(os.path.join(directory, "users"), exist_ok=True)
+    path = os.path.join(directory, "users", f"snapshot{FORMATS[fmt]}")
+    writer = _Writer(path, schema, fmt)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(EXPORT_USERS_SQL)
+        for rows in _fetch_chunks(cursor, chunk_size):
+            writer.write(_record_batch(rows, schema))
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    for other in FORMATS.values():
+        stale = os.path.join(directory, "users", f"snapshot{other}")
+        if other != FORMATS[fmt] and os.path.exists(stale):
+            os.remove(stale)
+    return {"rows": writer.rows, "path": path}
+
+def open_export(directory: str, name: str = "attempts"):
+    """Open an exported table as a pyarrow Dataset without reading it
+
+    Arrow IPC files are memory-mapped, so ``to_table(columns=..., filter=...)``
+    only touches the pages of the columns and batches it needs; Parquet parts
+    are decoded on demand. Both formats may be mixed in one directory.
+    """
+    _require_pyarrow()
+    base = os.path.join(directory, name)
+    filesystem = pyarrow.fs.LocalFileSystem(use_mmap=True)
+    datasets = []
+    for fmt, ext in FORMATS.items():
+        paths = sorted(
+            os.path.join(base, entry) for entry in os.listdir(base) if entry.endswith(ext)
+        )
+        if paths:
+            datasets.append(pyarrow.dataset.dataset(paths, format=fmt, filesystem=filesystem))
+    if not datasets:
+        raise FileNotFoundError(f"No exported {name} files in {base}")
+    return datasets[0] if len(datasets) == 1 else pyarrow.dataset.dataset(datasets)
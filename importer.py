@@ -0,0 +1,360 @@
+import csv
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from werkzeug.security import generate_password_hash
+
+import auth
+import migrations
+import payload_codec
+from attempt_items import INSERT_ATTEMPT_ITEMS_SQL, attempt_item_rows
+from usercache import normalize_email
+
+# =============================================================================
+# BULK IMPORT
+# =============================================================================
+#
+# Streams users/rosters or historical attempts from CSV or JSONL. Records are
+# parsed, validated and (for users) password-hashed in a process pool, then
+# loaded in order with executemany, one large transaction per batch. Each
+# batch commits together with its checkpoint in import_checkpoints, so a
+# re-run of the same file resumes after the last committed record.
+#
+# users    name, email, password | password_hash, [user_type], [student_level]
+#          user_type defaults to 'student', so a class roster needs no column
+# attempts user_id | email, course_name, topic, score, total_questions,
+#          [percentage], [attempt_date], [answers], [feedback]
+
+KINDS = ("users", "attempts")
+USER_TYPES = ("student", "educator")
+STUDENT_LEVELS = ("Beginner", "Intermediate", "Advanced")
+
+# Managed indexes each kind writes to; --defer-indexes drops them for the load
+DEFERRABLE_INDEXES = {
+    "users": ("users",),
+    "attempts": ("quiz_attempts", "attempt_items"),
+}
+
+# Skips emails already registered in any case, rather than tripping the
+# users email triggers (see migrations.EMAIL_NOCASE_TRIGGERS_SQL)
+IMPORT_USER_SQL = '''
+    INSERT OR IGNORE INTO users (name, email, password_hash, user_type, student_level)
+    SELECT ?, ?, ?, ?, ?
+    WHERE NOT EXISTS (SELECT 1 FROM users WHERE email = ? COLLATE NOCASE)
+'''
+
+IMPORT_ATTEMPT_SQL = '''
+    INSERT INTO quiz_attempts (id, user_id, course_name, topic, answers, score,
+                               total_questions, percentage, feedback, attempt_date)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+'''
+
+
+class RejectedRow(ValueError):
+    """A record that failed validation; the import skips it and reports why"""
+
+
+def iter_records(path: str, fmt: Optional[str] = None) -> Iterator[Tuple[int, Union[Dict, str]]]:
+    """Yield (record number, record) from a CSV or JSONL file without loading it whole
+
+    JSONL lines are yielded unparsed so the worker pool does the decoding.
+    """
+    fmt = fmt or ("jsonl" if path.endswith((".jsonl", ".ndjson", ".json")) else "csv")
+    with open(path, newline="", encoding="utf-8") as handle:
+        if fmt == "csv":
+            for number, row in enumerate(csv.DictReader(handle), 1):
+                yield number, {key: value if value != "" else None for key, value in row.items()}
+        elif fmt == "jsonl":
+            number = 0
+            for line in handle:
+                if line.strip():
+                    number += 1
+                    yield number, line
+        else:
+            raise ValueError(f"Unknown import format: {fmt}")
+
+# -----------------------------------------------------------------------------
+# Validation (runs in worker processes)
+# -----------------------------------------------------------------------------
+
+def _text(record, field, required=True):
+    value = record.get(field)
+    if value is None or str(value).strip() == "":
+        if required:
+            raise RejectedRow(f"missing {field}")
+        return None
+    return str(value).strip()
+
+def _number(record, field, kind=int, required=True):
+    value = record.get(field)
+    if value is None or value == "":
+        if required:
+            raise RejectedRow(f"missing {field}")
+        return None
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        raise RejectedRow(f"{field} is not a number: {value!r}")
+
+def _json_text(value):
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+def _timestamp(value):
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).strip().replace("Z", "")).strftime("%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        raise RejectedRow(f"attempt_date is not an ISO timestamp: {value!r}")
+
+def validate_user(record: Dict) -> Tuple:
+    """Row for IMPORT_USER_SQL; hashes a plaintext password"""
+    name = _text(record, "name")
+    email = normalize_email(_text(record, "email"))
+    if "@" not in email:
+        raise RejectedRow(f"invalid email: {email!r}")
+    user_type = _text(record, "user_type", required=False) or "student"
+    if user_type not in USER_TYPES:
+        raise RejectedRow(f"user_type must be one of {', '.join(USER_TYPES)}")
+    student_level = _text(record, "student_level", required=False) or "Beginner"
+    if student_level not in STUDENT_LEVELS:
+        raise RejectedRow(f"student_level must be one of {', '.join(STUDENT_LEVELS)}")
+
+    password_hash = _text(record, "password_hash", required=False)
+    if password_hash is None:
+        password = _text(record, "password", required=False)
+        if password is None:
+            raise RejectedRow("missing password or password_hash")
+        password_hash = generate_password_hash(password, auth.password_method())
+    return (name, email, password_hash, user_type, student_level)
+
+def validate_attempt(record: Dict) -> Tuple:
+    """(user reference, attempt fields, item rows without attempt_id)
+
+    The user reference is an int user_id or an email string, resolved by
+    the loader.
+    """
+    user_id = _number(record, "user_id", required=False)
+    user_ref = user_id if user_id is not None else _text(record, "email", required=False)
+    if isinstance(user_ref, str):
+        user_ref = normalize_email(user_ref)
+    if user_ref is None:
+        raise RejectedRow("missing user_id or email")
+
+    score = _number(record, "score")
+    total_questions = _number(record, "total_questions")
+    if total_questions <= 0 or not 0 <= score <= total_questions:
+        raise RejectedRow(f"score {score} out of range for {total_questions} question(s)")
+    percentage = _number(record, "percentage", float, required=False)
+    if percentage is None:
+        percentage = score / total_questions * 100
+    if not 0 <= percentage <= 100:
+        raise RejectedRow(f"percentage {percentage} out of range")
+
+    answers = _json_text(record.get("answers")) or "[]"
+    feedback = _json_text(record.get("feedback"))
+    items = [row[1:] for row in attempt_item_rows(0, answers, feedback)]
+    fields = (
+        _text(record, "course_name"), _text(record, "topic"), answers, score,
+        total_questions, percentage, feedback, _timestamp(record.get("attempt_date")),
+    )
+    return user_ref, fields, items
+
+_VALIDATORS = {"users": validate_user, "attempts": validate_attempt}
+
+def validate_chunk(kind: str, chunk: List[Tuple[int, Union[Dict, str]]]) -> List[Tuple[int, Optional[Tuple], Optional[str]]]:
+    """Validate a chunk of records; returns (record number, row, error) per record"""
+    validate = _VALIDATORS[kind]
+    results = []
+    for number, record in chunk:
+        try:
+            if isinstance(record, str):
+                try:
+                    record = json.loads(record)
+                except ValueError as exc:
+                    raise RejectedRow(f"invalid JSON: {exc}")
+                if not isinstance(record, dict):
+                    raise RejectedRow("expected a JSON object")
+            results.append((number, validate(record), None))
+        except RejectedRow as exc:
+            results.append((number, None, str(exc)))
+    return results
+
+# -----------------------------------------------------------------------------
+# Loading (runs in the importing process)
+# -----------------------------------------------------------------------------
+
+def get_checkpoint(conn, source: str, kind: str) -> int:
+    row = conn.execute(
+        "SELECT records_done FROM import_checkpoints WHERE source = ? AND kind = ?", (source, kind)
+    ).fetchone()
+    return row[0] if row else 0
+
+def _save_checkpoint(conn, source, kind, records_done):
+    conn.execute('''
+        INSERT INTO import_checkpoints (source, kind, records_done) VALUES (?, ?, ?)
+        ON CONFLICT (source, kind) DO UPDATE SET
+            records_done = excluded.records_done,
+            updated_at = CURRENT_TIMESTAMP
+    ''', (source, kind, records_done))
+
+def _resolve_emails(conn, emails, cache):
+    missing = [email for email in emails if email not in cache]
+    for start in range(0, len(missing), 500):
+        batch = missing[start:start + 500]
+        placeholders = ", ".join("?" * len(batch))
+        cache.update(conn.execute(f"SELECT email, id FROM users WHERE email IN ({placeholders})", batch))
+    return cache
+
+def _load_users(conn, batch):
+    rows = [row for _, row in batch]
+    before = conn.total_changes
+    conn.executemany(IMPORT_USER_SQL, [row + (row[1],) for row in rows])
+    inserted = conn.total_changes - before
+    return inserted, len(rows) - inserted, []
+
+def _load_attempts(conn, batch, codec, email_ids):
+    rows = [row for _, row in batch]
+    _resolve_emails(conn, {ref for ref, _, _ in rows if isinstance(ref, str)}, email_ids)
+    known_ids = set()
+    user_ids = {ref for ref, _, _ in rows if isinstance(ref, int)}
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), 500):
+        ids = user_ids[start:start + 500]
+        placeholders = ", ".join("?" * len(ids))
+        known_ids.update(row[0] for row in conn.execute(f"SELECT id FROM users WHERE id IN ({placeholders})", ids))
+
+    # executemany has no lastrowid, so ids are allocated up front; the
+    # caller holds the write lock, so nobody else can take them meanwhile.
+    # sqlite_sequence also remembers ids that have since been archived.
+    next_id = conn.execute('''
+        SELECT MAX(COALESCE(MAX(id), 0),
+                   COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'quiz_attempts'), 0))
+        FROM quiz_attempts
+    ''').fetchone()[0]
+    attempts, items, errors = [], [], []
+    for number, (ref, fields, item_rows) in batch:
+        user_id = email_ids.get(ref) if isinstance(ref, str) else (ref if ref in known_ids else None)
+        if user_id is None:
+            errors.append((number, f"unknown user {ref!r}"))
+            continue
+        next_id += 1
+        course_name, topic, answers, score, total, percentage, feedback, attempt_date = fields
+        attempts.append((
+            next_id, user_id, course_name, topic, payload_codec.encode_payload(answers, codec),
+            score, total, percentage, payload_codec.encode_payload(feedback, codec), attempt_date,
+        ))
+        items.extend((next_id, *item) for item in item_rows)
+
+    conn.executemany(IMPORT_ATTEMPT_SQL, attempts)
+    conn.executemany(INSERT_ATTEMPT_ITEMS_SQL, items)
+    return len(attempts), 0, errors
+
+def _chunks(records, size):
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _validated(kind, records, workers, chunk_size):
+    """Validate chunks in a process pool, yielding results in input order
+
+    At most 2 * workers chunks are in flight, so memory stays bounded no
+    matter how large the input is.
+    """
+    if workers <= 1:
+        for chunk in _chunks(records, chunk_size):
+            yield from validate_chunk(kind, chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in _chunks(records, chunk_size):
+            pending.append(pool.submit(validate_chunk, kind, chunk))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+def import_file(conn, path: str, kind: str, fmt: Optional[str] = None, batch_size: int = 50000,
+                workers: Optional[int] = None, chunk_size: int = 500, defer_indexes: bool = False,
+                restart: bool = False) -> Iterator[Dict]:
+    """Import a CSV/JSONL file of ``kind`` records, yielding a stats dict per committed batch
+
+    Stats carry cumulative counts (records, inserted, skipped duplicates,
+    rejected), the elapsed seconds, and up to 20 sample errors as
+    "record N: reason". conn must be at the current schema version.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unknown import kind: {kind}")
+    workers = workers or os.cpu_count() or 1
+    source = os.path.abspath(path)
+    done = 0 if restart else get_checkpoint(conn, source, kind)
+    codec = payload_codec.get_codec(payload_codec.PAYLOAD_CODEC, conn) if kind == "attempts" else None
+
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # batches manage their own transactions
+    dropped = []
+    if defer_indexes:
+        for table in DEFERRABLE_INDEXES[kind]:
+            for (name,) in conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND name LIKE 'idx\\_%' ESCAPE '\\'",
+                    (table,)).fetchall():
+                conn.execute(f'DROP INDEX "{name}"')
+                dropped.append(name)
+
+    stats = {"resumed_at": done, "records": done, "inserted": 0, "skipped": 0,
+             "rejected": 0, "elapsed_s": 0.0, "errors": []}
+    email_ids = {}
+    start = time.perf_counter()
+
+    def record_error(number, message):
+        stats["rejected"] += 1
+        if len(stats["errors"]) < 20:
+            stats["errors"].append(f"record {number}: {message}")
+
+    def commit(batch):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if kind == "users":
+                inserted, skipped, errors = _load_users(conn, batch)
+            else:
+                inserted, skipped, errors = _load_attempts(conn, batch, codec, email_ids)
+            _save_checkpoint(conn, source, kind, stats["records"])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        stats["inserted"] += inserted
+        stats["skipped"] += skipped
+        for number, message in errors:
+            record_error(number, message)
+        stats["elapsed_s"] = time.perf_counter() - start
+        return dict(stats, errors=list(stats["errors"]))
+
+    try:
+        records = islice(iter_records(path, fmt), done, None)
+        batch = []
+        for number, row, error in _validated(kind, records, workers, chunk_size):
+            stats["records"] = number
+            if error is not None:
+                record_error(number, error)
+            else:
+                batch.append((number, row))
+            if len(batch) >= batch_size:
+                yield commit(batch)
+                batch = []
+        if batch or stats["records"] > done:
+            yield commit(batch)
+    finally:
+        if dropped:
+            migrations.ensure_indexes(conn)
+        conn.isolation_level = isolation_level
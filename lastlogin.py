@@ -0,0 +1,126 @@
+import atexit
+import os
+import threading
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
+
+from writer import get_writer
+
+# =============================================================================
+# COALESCED LAST-LOGIN UPDATES
+# =============================================================================
+#
+# A login only needs its timestamp recorded eventually, so logins are
+# buffered in memory (latest timestamp per user) and written every
+# LAST_LOGIN_FLUSH_SECONDS as one executemany in a single group-commit
+# operation, and at interpreter exit. A login burst then costs one write
+# transaction per interval instead of one per login.
+#
+# users.last_login can therefore lag a login by up to the flush interval
+# (longer if the process dies before flushing); LAST_LOGIN_APPROXIMATE
+# tells readers such as the educator's student list to say so. Set the
+# interval to 0 to write every login through immediately.
+
+LAST_LOGIN_FLUSH_SECONDS = float(os.environ.get("EDUTUTOR_LAST_LOGIN_FLUSH_SECONDS", "30"))
+LAST_LOGIN_APPROXIMATE = LAST_LOGIN_FLUSH_SECONDS > 0
+
+# Never moves a timestamp backwards, e.g. past one flushed by another process
+UPDATE_LAST_LOGIN_SQL = '''
+    UPDATE users SET last_login = ?
+    WHERE id = ? AND (last_login IS NULL OR last_login < ?)
+'''
+
+
+class LoginRecorder:
+    """Buffer last-login timestamps and flush them in batches"""
+
+    def __init__(self, database_path: str, interval: float = LAST_LOGIN_FLUSH_SECONDS,
+                 on_flushed: Optional[Callable[[int], None]] = None):
+        self.database_path = database_path
+        self.interval = interval
+        self.on_flushed = on_flushed
+        self._pending: Dict[int, str] = {}
+        self._flushed = Future()  # resolves when the buffered logins are committed
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        if interval > 0:
+            self._thread = threading.Thread(target=self._run, name=f"edututor-logins:{database_path}",
+                                            daemon=True)
+            self._thread.start()
+
+    def record(self, user_id: int) -> Future:
+        """Buffer a login now; the future resolves once it has been committed"""
+        timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")  # UTC, as CURRENT_TIMESTAMP
+        with self._lock:
+            self._pending[user_id] = timestamp
+            flushed = self._flushed
+        if self._thread is None:
+            self.flush()
+        return flushed
+
+    def flush(self) -> Future:
+        """Write the buffered logins now; resolves to the number of users updated"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            flushed, self._flushed = self._flushed, Future()
+        if not pending:
+            flushed.set_result(0)
+            return flushed
+        rows = [(timestamp, user_id, timestamp) for user_id, timestamp in pending.items()]
+        committed = get_writer(self.database_path).submit(
+            lambda conn: conn.executemany(UPDATE_LAST_LOGIN_SQL, rows).rowcount
+        )
+
+        def done(result):
+            if self.on_flushed is not None:
+                for user_id in pending:
+                    self.on_flushed(user_id)
+            if result.exception() is not None:
+                flushed.set_exception(result.exception())
+            else:
+                flushed.set_result(result.result())
+
+        committed.add_done_callback(done)
+        return flushed
+
+    def pending(self) -> Dict[int, str]:
+        """Logins recorded but not flushed yet, user id -> timestamp"""
+        with self._lock:
+            return dict(self._pending)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def close(self):
+        """Stop the flush thread and write what is buffered"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.flush()
+
+
+_recorders: Dict[str, LoginRecorder] = {}
+_recorders_lock = threading.Lock()
+
+def get_login_recorder(database_path: str, on_flushed: Optional[Callable[[int], None]] = None) -> LoginRecorder:
+    """Get the process-wide recorder for a database file, starting it on first use"""
+    with _recorders_lock:
+        recorder = _recorders.get(database_path)
+        if recorder is None:
+            recorder = LoginRecorder(database_path, on_flushed=on_flushed)
+            _recorders[database_path] = recorder
+        return recorder
+
+
+# Registered after writer.close_writers, so it runs before the writers stop
+@atexit.register
+def close_recorders():
+    """Flush every recorder (runs automatically at interpreter exit)"""
+    with _recorders_lock:
+        recorders = list(_recorders.values())
+        _recorders.clear()
+    for recorder in recorders:
+        recorder.close()
@@ -0,0 +1,392 @@
+"""Maintenance commands for the EduTutor database.
+
+Run ``python manage.py <command> --help`` for the options of each command.
+"""
+import argparse
+import re
+import sqlite3
+import sys
+import time
+
+import archive
+import db
+import attempt_items
+import export
+import importer
+import migrations
+import models
+import payload_codec
+import question_bank
+import rollups
+
+# "SCAN users" is a full table scan; "SCAN qa USING COVERING INDEX ..." walks an
+# index, and "SCAN (subquery-1)" / "SCAN CONSTANT ROW" are not table reads.
+_TABLE_SCAN = re.compile(r"^SCAN (?!CONSTANT ROW)(?!\()(\S+)(?!.*\bUSING\b)")
+
+
+def explain(conn, sql, params=()):
+    """Return the EXPLAIN QUERY PLAN detail lines for a statement"""
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()]
+
+
+def find_full_scans(conn, queries, allowed=frozenset()):
+    """Map query name -> plan lines that fall back to a full table scan"""
+    offenders = {}
+    for name, (sql, params) in queries.items():
+        scans = [
+            line for line in explain(conn, sql, params)
+            if (match := _TABLE_SCAN.match(line)) and match.group(1) not in allowed
+        ]
+        if scans:
+            offenders[name] = scans
+    return offenders
+
+
+def cmd_check_plans(args):
+    if args.database:
+        conn = sqlite3.connect(args.database)
+        migrations.apply_migrations(conn)
+    else:
+        conn = sqlite3.connect(":memory:")
+        migrations.apply_migrations(conn)
+
+    queries = models.DATA_LAYER_QUERIES
+    offenders = find_full_scans(conn, queries, models.FULL_SCAN_ALLOWED)
+    for name, (sql, params) in queries.items():
+        status = "FULL SCAN" if name in offenders else "ok"
+        print(f"{status:>9}  {name}")
+        if args.verbose or name in offenders:
+            for line in explain(conn, sql, params):
+                print(f"           {line}")
+    conn.close()
+
+    if offenders:
+        print(f"\n{len(offenders)} of {len(queries)} queries fall back to a full table scan")
+        return 1
+    return 0
+
+
+def cmd_ensure_indexes(args):
+    conn = _open(args.database)
+    created = migrations.ensure_indexes(conn)
+    conn.commit()
+    conn.close()
+    print(f"Created {len(created)} index(es): {', '.join(created) or 'none'}")
+    return 0
+
+
+def _open(database):
+    conn = sqlite3.connect(database or models.DATABASE_PATH)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _open_analytics(database):
+    """Read-only connection with the analytics cache/mmap settings"""
+    return db.open_connection(database or models.DATABASE_PATH, read_only=True)
+
+
+def cmd_migrate(args):
+    conn = _open(args.database)
+    before = migrations.current_version(conn)
+    applied = migrations.apply_migrations(conn)
+    for migration in applied:
+        print(f"  applied {migration.version:>3}: {migration.description}")
+    print(f"Schema version {before} -> {migrations.current_version(conn)}")
+    conn.close()
+    return 0
+
+
+def cmd_bootstrap(args):
+    if args.database:
+        models.DATABASE_PATH = args.database
+    models.init_db()
+    added = models.seed_demo_users()
+    print(f"Schema ready; {added} demo user(s) created")
+    return 0
+
+
+def cmd_rebuild_student_stats(args):
+    conn = _open(args.database)
+    rollups.create_student_stats(conn)
+    rows = rollups.rebuild_student_stats(conn)
+    conn.commit()
+    conn.close()
+    print(f"Rebuilt student_stats: {rows} row(s)")
+    return 0
+
+
+def cmd_check_student_stats(args):
+    conn = _open_analytics(args.database)
+    # One snapshot, so quizzes submitted during the check cannot show up as drift
+    with db.read_snapshot(conn):
+        mismatches = rollups.check_student_stats(conn)
+    conn.close()
+    for item in mismatches:
+        print(f"user {item['user_id']}: expected {item['expected']}, found {item['actual']}")
+    if mismatches:
+        print(f"{len(mismatches)} student_stats row(s) out of date; run rebuild-student-stats")
+        return 1
+    print("student_stats is consistent with quiz_attempts")
+    return 0
+
+
+def cmd_rebuild_course_stats(args):
+    conn = _open(args.database)
+    rollups.create_course_topic_stats(conn)
+    rows = rollups.rebuild_course_topic_stats(conn)
+    conn.commit()
+    conn.close()
+    print(f"Backfilled course_topic_stats: {rows} row(s)")
+    return 0
+
+
+def cmd_check_course_stats(args):
+    conn = _open_analytics(args.database)
+    with db.read_snapshot(conn):
+        mismatches = rollups.check_course_topic_stats(conn)
+    conn.close()
+    for item in mismatches:
+        print(f"{item['course_topic']}: expected {item['expected']}, found {item['actual']}")
+    if mismatches:
+        print(f"{len(mismatches)} course_topic_stats row(s) out of date; run rebuild-course-stats")
+        return 1
+    print("course_topic_stats is consistent with quiz_attempts")
+    return 0
+
+
+def cmd_backfill_attempt_items(args):
+    conn = _open(args.database)
+    migrations.apply_migrations(conn)
+    total = 0
+    for last_id, written in attempt_items.backfill_attempt_items(conn, args.batch_size, args.after_id):
+        total += written
+        print(f"  through attempt {last_id}: {total} item(s) written")
+    conn.close()
+    print(f"Backfilled {total} attempt item(s)")
+    return 0
+
+
+def cmd_compact_payloads(args):
+    conn = _open(args.database)
+    migrations.apply_migrations(conn)
+    if args.train_dictionary:
+        samples = [
+            payload_codec.decode_payload(row[0]) for row in conn.execute(
+                "SELECT feedback FROM quiz_attempts WHERE feedback IS NOT NULL ORDER BY id DESC LIMIT ?",
+                (args.train_samples,)
+            )
+        ]
+        try:
+            dictionary_id = payload_codec.train_zstd_dictionary(conn, samples, args.dictionary_size)
+        except (payload_codec.TrainingFailed, payload_codec.CodecUnavailable) as exc:
+            conn.close()
+            print(f"Cannot train a dictionary: {exc}")
+            print("Use more --train-samples or a smaller --dictionary-size, or compact without --train-dictionary")
+            return 1
+        conn.commit()
+        print(f"Trained zstd dictionary {dictionary_id} on {len(samples)} feedback payload(s)")
+    codec = payload_codec.get_codec(args.codec, conn)
+
+    totals = {}
+    for stats in payload_codec.compact_attempt_payloads(conn, codec, args.batch_size, args.after_id):
+        for key, value in stats.items():
+            totals[key] = value if key == "last_id" else totals.get(key, 0) + value
+        print(f"  through attempt {stats['last_id']}: {totals['rewritten']} row(s) rewritten")
+    conn.close()
+
+    if not totals:
+        print("No attempts to compact")
+        return 0
+    saved = totals["bytes_before"] - totals["bytes_after"]
+    mb = totals["json_bytes"] / 1e6
+    print(f"Payload bytes: {totals['bytes_before']:,} -> {totals['bytes_after']:,} "
+          f"(saved {saved:,}, {saved / max(totals['bytes_before'], 1):.0%})")
+    print(f"Decode throughput: {mb / max(totals['decode_before_s'], 1e-9):.0f} MB/s before, "
+          f"{mb / max(totals['decode_after_s'], 1e-9):.0f} MB/s after")
+    print("Run VACUUM (sqlite3 <db> 'VACUUM') to return the freed pages to the filesystem")
+    return 0
+
+
+def cmd_check_emails(args):
+    conn = _open(args.database)
+    migrations.apply_migrations(conn)
+    collisions = migrations.ensure_email_index(conn)
+    conn.commit()
+    conn.close()
+    for row in collisions:
+        print(f"{row['normalized_email']}: users {row['user_ids']} ({row['emails']})")
+    if collisions:
+        print(f"{len(collisions)} email(s) shared by several users; merge or rename them, then re-run "
+              f"to make {migrations.EMAIL_INDEX} unique")
+        return 1
+    print(f"No email collisions; {migrations.EMAIL_INDEX} is unique")
+    return 0
+
+
+def cmd_build_question_banks(args):
+    for name in args.banks:
+        path = question_bank.store_path(name)
+        count = question_bank.write_store(question_bank.load_source(name), path)
+        print(f"  {name}: {count} question(s) -> {path}")
+    return 0
+
+
+def cmd_archive(args):
+    database = args.database or models.DATABASE_PATH
+    conn = _open(database)
+    migrations.apply_migrations(conn)
+    cutoff = args.before or archive.default_cutoff(args.older_than_days)
+    print(f"Archiving attempts before {cutoff} into {args.archive_dir}/")
+    moved = {}
+    for term, count in archive.archive_attempts(conn, database, cutoff, args.chunk_size, args.archive_dir):
+        moved[term] = moved.get(term, 0) + count
+        print(f"  {term}: {moved[term]} attempt(s) moved")
+    conn.close()
+    print(f"Archived {sum(moved.values())} attempt(s) into {len(moved)} term file(s)")
+    return 0
+
+
+def cmd_import(args):
+    conn = _open(args.database)
+    migrations.apply_migrations(conn)
+    stats = None
+    for stats in importer.import_file(conn, args.path, args.kind, args.format, args.batch_size,
+                                      args.workers, args.chunk_size, args.defer_indexes, args.restart):
+        rate = (stats["records"] - stats["resumed_at"]) / max(stats["elapsed_s"], 1e-9)
+        print(f"  record {stats['records']:,}: {stats['inserted']:,} inserted, "
+              f"{stats['skipped']:,} duplicate(s), {stats['rejected']:,} rejected ({rate:,.0f} rows/s)")
+    conn.close()
+
+    if stats is None:
+        print("Nothing to import (already complete; use --restart to import again)")
+        return 0
+    for error in stats["errors"]:
+        print(f"  rejected {error}")
+    processed = stats["records"] - stats["resumed_at"]
+    print(f"Imported {stats['inserted']:,} {args.kind} from {processed:,} record(s) in "
+          f"{stats['elapsed_s']:.1f}s ({processed / max(stats['elapsed_s'], 1e-9):,.0f} rows/s)")
+    return 1 if stats["rejected"] else 0
+
+
+def cmd_export(args):
+    conn = _open(args.database)
+    migrations.apply_migrations(conn)
+    conn.close()
+    conn = _open_analytics(args.database)
+    start = time.perf_counter()
+    if "attempts" in args.tables:
+        result = export.export_attempts(conn, args.out, args.format, args.chunk_size,
+                                        args.with_payloads, args.full)
+        if result["path"]:
+            print(f"  attempts {result['first_id']}..{result['last_id']}: {result['rows']:,} row(s) -> {result['path']}")
+        else:
+            print("  attempts: nothing new since the last export")
+    if "users" in args.tables:
+        result = export.export_users(conn, args.out, args.format, args.chunk_size)
+        print(f"  users: {result['rows']:,} row(s) -> {result['path']}")
+    conn.close()
+    print(f"Export finished in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("check-plans", help="fail if any data-layer query does a full table scan")
+    p.add_argument("--database", help="check against this database instead of a scratch schema")
+    p.add_argument("-v", "--verbose", action="store_true", help="print every query plan")
+    p.set_defaults(func=cmd_check_plans)
+
+    p = sub.add_parser("migrate", help="apply pending schema migrations")
+    p.add_argument("--database", help="defaults to EDUTUTOR_DATABASE")
+    p.set_defaults(func=cmd_migrate)
+
+    p = sub.add_parser("bootstrap", help="migrate and seed the demo accounts into an empty database")
+    p.add_argument("--database", help="defaults to EDUTUTOR_DATABASE")
+    p.set_defaults(func=cmd_bootstrap)
+
+    p = sub.add_parser("ensure-indexes", help="create missing managed indexes and drop stale ones")
+    p.add_argument("--database", help="defaults to EDUTUTOR_DATABASE")
+    p.set_defaults(func=cmd_ensure_indexes)
+
+    p = sub.add_parser("rebuild-student-stats", help="recompute the per-student rollup from quiz_attempts")
+    p.add_argument("--database", help="defaults to EDUTUTOR_DATABASE")
+    p.set_defaults(func=cmd_rebuild_student_stats)
+
+    p = sub.add_parser("check-student-stats", help="compare the per-student rollup with a full recompute")
+    p.add_argument("--database", help="defaults to EDUTUTOR_DATABASE")
+    p.set_defaults(func=cmd_check_student_stats)
+
+    p = sub.add_parser("rebuild-course-stats", help="backfill the course/topic rollup from quiz_attempts")
+    p.add_argument("--database", help="defaults to EDUTUTOR_DATABASE")
+    p.set_defaults(func=cmd_rebuild_course_stats)
+
+    p = sub.add_parser("check-course-stats", help="compare the course/topic rollup with a full recompute")
+    p.add_argument("--database", help="defaults to EDUTUTOR_DATABASE")
+    p.set_defaults(func=cmd_check_course_stats)
+
+    p = sub.add_parser("backfill-attempt-items", help="populate attempt_items from existing feedback blobs")
+    p.add_argument("--database", help="defaults to EDUTUTOR_DATABASE")
+    p.add_argument("--batch-size", type=int, default=1000, help="attempts per transaction")
+    p.add_argument("--after-id", type=int, default=0, help="resume after this attempt id")
+    p.set_defaults(func=cmd_backfill_attempt_items)
+
+    p = sub.add_parser("compact-payloads", help="re-encode feedback/answers payloads with a codec")
+    p.add_argument("--database", help="defaults to EDUTUTOR_DATABASE")
+    p.add_argument("--codec", choices=["none", "zlib", "zstd"], default=payload_codec.PAYLOAD_CODEC)
+    p.add_argument("--train-dictionary", action="store_true", help="train a new zstd dictionary first")
+    p.add_argument("--train-samples", type=int, default=5000)
+    p.add_argument("--dictionary-size", type=int, default=64 * 1024)
+    p.add_argument("--batch-size", type=int, default=500, help="attempts per transaction")
+    p.add_argument("--after-id", type=int, default=0, help="resume after this attempt id")
+    p.set_defaults(func=cmd_compact_payloads)
+
+    p = sub.add_parser("check-emails", help="list users whose emails differ only in case; index uniquely once none remain")
+    p.add_argument("--database", help="defaults to EDUTUTOR_DATABASE")
+    p.set_defaults(func=cmd_check_emails)
+
+    p = sub.add_parser("build-question-banks", help="compile question_banks/*.json into their memory-mapped stores")
+    p.add_argument("banks", nargs="*", default=["edu", "app"])
+    p.set_defaults(func=cmd_build_question_banks)
+
+    p = sub.add_parser("archive", help="move old attempts into per-term archive databases")
+    p.add_argument("--database", help="defaults to EDUTUTOR_DATABASE")
+    p.add_argument("--before", help="archive attempts dated before this timestamp (YYYY-MM-DD[ HH:MM:SS])")
+    p.add_argument("--older-than-days", type=int, default=archive.ARCHIVE_AFTER_DAYS,
+                   help="cutoff when --before is not given (EDUTUTOR_ARCHIVE_AFTER_DAYS)")
+    p.add_argument("--chunk-size", type=int, default=5000, help="attempts per transaction")
+    p.add_argument("--archive-dir", default=archive.ARCHIVE_DIR, help="defaults to EDUTUTOR_ARCHIVE_DIR")
+    p.set_defaults(func=cmd_archive)
+
+    p = sub.add_parser("import", help="bulk-load users/rosters or historical attempts from CSV or JSONL")
+    p.add_argument("kind", choices=importer.KINDS)
+    p.add_argument("path", help="CSV with a header row, or JSONL (one object per line)")
+    p.add_argument("--database", help="defaults to EDUTUTOR_DATABASE")
+    p.add_argument("--format", choices=["csv", "jsonl"], help="defaults to the file extension")
+    p.add_argument("--batch-size", type=int, default=50000, help="rows per transaction and checkpoint")
+    p.add_argument("--workers", type=int, help="validation/hashing processes (default: CPU count)")
+    p.add_argument("--chunk-size", type=int, default=500, help="records per worker task")
+    p.add_argument("--defer-indexes", action="store_true",
+                   help="drop the target tables' indexes during the load and rebuild them after")
+    p.add_argument("--restart", action="store_true", help="ignore the checkpoint and start from the top")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("export", help="stream attempts and users to Parquet or Arrow IPC files")
+    p.add_argument("out", help="export directory")
+    p.add_argument("--database", help="defaults to EDUTUTOR_DATABASE")
+    p.add_argument("--format", choices=sorted(export.FORMATS), default="parquet",
+                   help="ipc files can be memory-mapped by readers (default: parquet)")
+    p.add_argument("--tables", nargs="+", choices=["attempts", "users"], default=["attempts", "users"])
+    p.add_argument("--chunk-size", type=int, default=50000, help="rows held in memory at a time")
+    p.add_argument("--with-payloads", action="store_true", help="include decoded answers/feedback JSON")
+    p.add_argument("--full", action="store_true", help="ignore the high water mark and export every attempt")
+    p.set_defaults(func=cmd_export)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,358 @@
+import logging
+import sqlite3
+import threading
+from typing import Callable, List, NamedTuple
+
+import archive
+import attempt_items
+import payload_codec
+import rollups
+from db import open_connection
+from usercache import normalize_email
+
+logger = logging.getLogger("edututor.migrations")
+
+# =============================================================================
+# SCHEMA
+# =============================================================================
+
+USERS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        user_type TEXT NOT NULL CHECK (user_type IN ('student', 'educator')),
+        diagnostic_completed BOOLEAN DEFAULT FALSE,
+        difficulty_level INTEGER DEFAULT 1,
+        student_level TEXT DEFAULT 'Beginner',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_login TIMESTAMP
+    )
+'''
+
+QUIZ_ATTEMPTS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS quiz_attempts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        quiz_id INTEGER,
+        course_name TEXT NOT NULL,
+        topic TEXT NOT NULL,
+        answers TEXT NOT NULL,
+        score INTEGER NOT NULL,
+        total_questions INTEGER NOT NULL,
+        percentage REAL NOT NULL,
+        feedback TEXT,
+        attempt_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+'''
+
+# Resume points for importer.import_file: records of a source file already
+# committed, counting rejected ones.
+IMPORT_CHECKPOINTS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS import_checkpoints (
+        source TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        records_done INTEGER NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (source, kind)
+    )
+'''
+
+# users_email_nocase can only be UNIQUE once no collisions are left, so
+# until then these triggers keep new ones from appearing: an insert, or an
+# email change, is rejected (IntegrityError) when another user already has
+# the email in any case. Grandfathered collisions are left alone.
+EMAIL_NOCASE_TRIGGERS_SQL = (
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_users_email_nocase_insert
+    BEFORE INSERT ON users
+    WHEN EXISTS (SELECT 1 FROM users WHERE email = NEW.email COLLATE NOCASE)
+    BEGIN
+        SELECT RAISE(ABORT, 'email already registered');
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_users_email_nocase_update
+    BEFORE UPDATE OF email ON users
+    WHEN EXISTS (SELECT 1 FROM users WHERE email = NEW.email COLLATE NOCASE AND id != NEW.id)
+    BEGIN
+        SELECT RAISE(ABORT, 'email already registered');
+    END
+    ''',
+)
+
+# Users whose emails differ only in case or surrounding whitespace, found
+# when emails were first normalized (see ensure_email_index). Their emails
+# are left as they were until someone merges or renames the accounts.
+EMAIL_COLLISIONS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS email_collisions (
+        normalized_email TEXT PRIMARY KEY,
+        user_ids TEXT NOT NULL,
+        emails TEXT NOT NULL,
+        detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+# Managed secondary indexes. ensure_indexes() creates missing ones and drops
+# any other idx_* index, so this dict is the single source of truth.
+INDEXES = {
+    # Quiz history: seek by user, walk (attempt_date, id) for keyset pages,
+    # and cover every column the history API can project.
+    "idx_quiz_attempts_user_date_id": '''
+        CREATE INDEX IF NOT EXISTS idx_quiz_attempts_user_date_id
+        ON quiz_attempts (user_id, attempt_date, id, course_name, topic, score, total_questions, percentage)
+    ''',
+    # Course analytics: GROUP BY course_name, topic straight off the index.
+    "idx_quiz_attempts_course_topic": '''
+        CREATE INDEX IF NOT EXISTS idx_quiz_attempts_course_topic
+        ON quiz_attempts (course_name, topic, percentage)
+    ''',
+    # Archiving and date-range analytics: select attempts by date, covering
+    # the columns the course/topic aggregates read.
+    "idx_quiz_attempts_date": '''
+        CREATE INDEX IF NOT EXISTS idx_quiz_attempts_date
+        ON quiz_attempts (attempt_date, course_name, topic, percentage)
+    ''',
+    # Item analytics: per-question and per-topic correctness aggregates.
+    "idx_attempt_items_question": '''
+        CREATE INDEX IF NOT EXISTS idx_attempt_items_question
+        ON attempt_items (question_id, is_correct)
+    ''',
+    "idx_attempt_items_topic": '''
+        CREATE INDEX IF NOT EXISTS idx_attempt_items_topic
+        ON attempt_items (topic, is_correct)
+    ''',
+    # Student list: filter on user_type without touching the users table.
+    "idx_users_type": '''
+        CREATE INDEX IF NOT EXISTS idx_users_type
+        ON users (user_type, id, name, email, student_level)
+    ''',
+}
+
+def ensure_indexes(conn):
+    """Bring the database's idx_* indexes in line with INDEXES"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx\\_%' ESCAPE '\\'")
+    existing = {row[0] for row in cursor.fetchall()}
+
+    for name in existing - set(INDEXES):
+        cursor.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+    missing = [name for name in INDEXES if name not in existing]
+    for name in missing:
+        cursor.execute(INDEXES[name])
+
+    if missing:
+        # Refresh planner statistics so the new indexes are picked up
+        cursor.execute("ANALYZE")
+    return missing
+
+# =============================================================================
+# EMAIL NORMALIZATION
+# =============================================================================
+#
+# Emails are stored stripped and lower-cased (usercache.normalize_email) and
+# looked up with COLLATE NOCASE through users_email_nocase, so a login is
+# one index seek whatever the case. The index is UNIQUE once no two users
+# share a normalized email; until then it is a plain index, and the
+# colliding accounts are listed in email_collisions.
+
+EMAIL_INDEX = "users_email_nocase"
+
+def find_email_collisions(conn) -> List[sqlite3.Row]:
+    """Groups of users sharing a normalized email: (normalized_email, user_ids, emails)"""
+    conn.create_function("normalize_email", 1, normalize_email, deterministic=True)
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute('''
+        SELECT normalize_email(email) as normalized_email,
+               GROUP_CONCAT(id) as user_ids,
+               GROUP_CONCAT(email, ' ') as emails
+        FROM users
+        GROUP BY normalized_email
+        HAVING COUNT(*) > 1
+        ORDER BY normalized_email
+    ''')
+    return cursor.fetchall()
+
+def ensure_email_index(conn) -> List[sqlite3.Row]:
+    """Refresh email_collisions and (re)build users_email_nocase to match
+
+    Returns the current collisions; the index is UNIQUE when there are none.
+    """
+    collisions = find_email_collisions(conn)
+    conn.execute("DELETE FROM email_collisions")
+    conn.executemany(
+        "INSERT INTO email_collisions (normalized_email, user_ids, emails) VALUES (?, ?, ?)",
+        [tuple(row) for row in collisions]
+    )
+    unique = not collisions
+    current = [row for row in conn.execute("PRAGMA index_list(users)") if row[1] == EMAIL_INDEX]
+    if not current or bool(current[0][2]) != unique:
+        conn.execute(f"DROP INDEX IF EXISTS {EMAIL_INDEX}")
+        conn.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX {EMAIL_INDEX} ON users (email COLLATE NOCASE)")
+    return collisions
+
+def _normalize_emails(conn):
+    conn.execute(EMAIL_COLLISIONS_TABLE_SQL)
+    collisions = ensure_email_index(conn)
+    conn.execute('''
+        UPDATE users SET email = normalize_email(email)
+        WHERE email != normalize_email(email)
+          AND normalize_email(email) NOT IN (SELECT normalized_email FROM email_collisions)
+    ''')
+    if collisions:
+        logger.warning(
+            "%d email(s) are shared by several users and were left as they were; "
+            "see the email_collisions table or run 'manage.py check-emails': %s",
+            len(collisions), ", ".join(row['normalized_email'] for row in collisions[:20])
+        )
+
+def _create_email_triggers(conn):
+    for sql in EMAIL_NOCASE_TRIGGERS_SQL:
+        conn.execute(sql)
+
+def _add_missing_columns(conn, table, columns):
+    """ALTER TABLE ADD COLUMN for every (name, declaration) the table lacks"""
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, declaration in columns:
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {declaration}")
+
+# =============================================================================
+# MIGRATIONS
+# =============================================================================
+#
+# Each step runs in its own transaction and bumps schema_version, so a
+# database is always at a well-defined version. Steps are append-only: never
+# edit a released step, add a new one instead.
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[sqlite3.Connection], None]
+
+
+def _create_base_tables(conn):
+    conn.execute(USERS_TABLE_SQL)
+    conn.execute(QUIZ_ATTEMPTS_TABLE_SQL)
+
+def _upgrade_legacy_columns(conn):
+    # Databases created before course tracking (such as the shipped
+    # edututor.db) lack these columns. Earlier versions dropped quiz_attempts
+    # in that case; upgrade in place instead.
+    _add_missing_columns(conn, "users", [
+        ("diagnostic_completed", "BOOLEAN DEFAULT FALSE"),
+        ("difficulty_level", "INTEGER DEFAULT 1"),
+        ("student_level", "TEXT DEFAULT 'Beginner'"),
+        ("last_login", "TIMESTAMP"),
+    ])
+    attempt_columns = {row[1] for row in conn.execute("PRAGMA table_info(quiz_attempts)")}
+    _add_missing_columns(conn, "quiz_attempts", [
+        ("quiz_id", "INTEGER"),
+        ("course_name", "TEXT NOT NULL DEFAULT 'General'"),
+        ("topic", "TEXT NOT NULL DEFAULT 'General'"),
+        ("total_questions", "INTEGER NOT NULL DEFAULT 0"),
+        ("percentage", "REAL NOT NULL DEFAULT 0"),
+        ("feedback", "TEXT"),
+        ("attempt_date", "TIMESTAMP"),
+    ])
+    if "percentage" not in attempt_columns:
+        # Legacy rows store the percentage in score and one answer per
+        # question; derive the question count and the number correct
+        conn.execute('''
+            UPDATE quiz_attempts SET
+                percentage = score,
+                total_questions = CASE WHEN json_valid(answers) THEN json_array_length(answers) ELSE 0 END
+        ''')
+        conn.execute("UPDATE quiz_attempts SET score = CAST(ROUND(percentage * total_questions / 100.0) AS INTEGER)")
+    if "attempt_date" not in attempt_columns:
+        completed_at = "completed_at" if "completed_at" in attempt_columns else "NULL"
+        conn.execute(f"UPDATE quiz_attempts SET attempt_date = COALESCE({completed_at}, CURRENT_TIMESTAMP)")
+
+def _create_student_stats(conn):
+    # The first release of step 2 missed the attempt columns, so a legacy
+    # database can sit at version 2 without them; finish that upgrade here
+    _upgrade_legacy_columns(conn)
+    rollups.create_student_stats(conn)
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "create users and quiz_attempts", _create_base_tables),
+    Migration(2, "add course and diagnostic columns to legacy tables", _upgrade_legacy_columns),
+    Migration(3, "per-student rollup", _create_student_stats),
+    Migration(4, "course/topic rollup", rollups.create_course_topic_stats),
+    Migration(5, "per-question attempt_items", attempt_items.create_attempt_items),
+    Migration(6, "payload codec dictionaries", lambda conn: conn.execute(payload_codec.PAYLOAD_DICTIONARIES_TABLE_SQL)),
+    Migration(7, "archive term registry and archived rollup contributions", archive.create_archive_registry),
+    Migration(8, "bulk import checkpoints", lambda conn: conn.execute(IMPORT_CHECKPOINTS_TABLE_SQL)),
+    Migration(9, "normalize emails and index them case-insensitively", _normalize_emails),
+    Migration(10, "reject emails that differ only in case from an existing one", _create_email_triggers),
+]
+
+SCHEMA_VERSION_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+def current_version(conn) -> int:
+    conn.execute(SCHEMA_VERSION_TABLE_SQL)
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+def apply_migrations(conn) -> List[Migration]:
+    """Apply pending migrations on an open connection; returns the steps applied"""
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # each step manages its own transaction
+    applied = []
+    try:
+        for migration in MIGRATIONS:
+            # BEGIN IMMEDIATE takes the write lock first, so concurrent
+            # processes serialize here and re-check the version
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if current_version(conn) >= migration.version:
+                    conn.execute("COMMIT")
+                    continue
+                migration.apply(conn)
+                conn.execute(
+                    "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                    (migration.version, migration.description)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            applied.append(migration)
+
+        conn.execute("BEGIN IMMEDIATE")
+        ensure_indexes(conn)
+        conn.execute("COMMIT")
+    finally:
+        conn.isolation_level = isolation_level
+    return applied
+
+_migrated = set()
+_migrate_lock = threading.Lock()
+
+def migrate(database_path: str) -> List[Migration]:
+    """Apply pending migrations to a database file at most once per process
+
+    Streamlit re-executes the app script on every interaction; after the
+    first call this is a set lookup.
+    """
+    if database_path in _migrated:
+        return []
+    with _migrate_lock:
+        if database_path in _migrated:
+            return []
+        conn = open_connection(database_path)
+        try:
+            applied = apply_migrations(conn)
+        finally:
+            conn.close()
+        _migrated.add(database_path)
+        return applied
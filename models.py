@@ -1,72 +1,516 @@
 import sqlite3
 import os
+import heapq
 from datetime import datetime
+from werkzeug.security import generate_password_hash
 
-DATABASE_PATH = "edututor.db"
+from db import get_pool, read_snapshot
+from writer import get_writer
+from migrations import migrate
+from attempt_items import INSERT_ATTEMPT_ITEMS_SQL, attempt_item_rows
+import payload_codec
+import archive
+import auth
+import querylog
+from lastlogin import UPDATE_LAST_LOGIN_SQL, get_login_recorder
+from usercache import get_user_cache, normalize_email
 
-def get_db_connection():
-    """Get database connection with proper configuration"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row  # Enable dict-like access to rows
-    return conn
+DATABASE_PATH = os.environ.get("EDUTUTOR_DATABASE", "edututor_fixed.db")
+
+def get_db_connection(caller=None):
+    """Get a pooled database connection (WAL mode, shared busy timeout)
+
+    Leaving a ``with`` block on the returned handle (or calling close())
+    hands the connection back to the pool instead of closing the underlying
+    SQLite connection. ``caller``
+    names the data-layer function for querylog's slow-statement capture.
+    """
+    return get_pool(DATABASE_PATH).connect(caller=caller)
+
+def get_analytics_connection(caller=None):
+    """Get a pooled read-only connection for educator reports and exports
+
+    Comes from a separate pool (query_only, larger cache, mmap reads), so
+    long scans never hold a write lock or crowd out the connections that
+    serve quiz submissions. Wrap multi-query reports in db.read_snapshot.
+    """
+    return get_pool(DATABASE_PATH, read_only=True).connect(caller=caller)
+
+_payload_codec = None
+
+def get_payload_codec():
+    """Codec for new feedback/answers payloads (EDUTUTOR_PAYLOAD_CODEC), resolved once"""
+    global _payload_codec
+    if _payload_codec is None:
+        with get_db_connection("get_payload_codec") as conn:
+            _payload_codec = payload_codec.get_codec(payload_codec.PAYLOAD_CODEC, conn) or False
+    return _payload_codec or None
+
+def decode_attempt_payload(value):
+    """Decode a stored feedback/answers value, loading new zstd dictionaries if needed"""
+    try:
+        return payload_codec.decode_payload(value)
+    except payload_codec.CodecUnavailable:
+        with get_db_connection("decode_attempt_payload") as conn:
+            payload_codec.load_dictionaries(conn)
+        return payload_codec.decode_payload(value)
 
 def init_db():
-    """Initialize database with all required tables"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            user_type TEXT NOT NULL CHECK (user_type IN ('student', 'educator')),
-            diagnostic_completed BOOLEAN DEFAULT FALSE,
-            difficulty_level INTEGER DEFAULT 1,
-            student_level TEXT DEFAULT 'Beginner',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_login TIMESTAMP
-        )
-    ''')
-    
-    # Quiz attempts table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS quiz_attempts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            quiz_id INTEGER,
-            course_name TEXT NOT NULL,
-            topic TEXT NOT NULL,
-            answers TEXT NOT NULL,
-            score INTEGER NOT NULL,
-            total_questions INTEGER NOT NULL,
-            percentage REAL NOT NULL,
-            feedback TEXT,
-            attempt_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    
-    # Insert demo users if they don't exist
-    cursor.execute("SELECT COUNT(*) FROM users")
-    if cursor.fetchone()[0] == 0:
-        from werkzeug.security import generate_password_hash
-        
+    """Bring the database schema up to date (once per process)
+
+    Demo accounts are no longer created here; run `python manage.py bootstrap`.
+    """
+    migrate(DATABASE_PATH)
+
+DEMO_USERS = [
+    ('Demo Student', 'demo@student.edu', 'demo123', 'student', 'Intermediate'),
+    ('Prof Demo', 'prof@university.edu', 'prof123', 'educator', 'Advanced'),
+    ('Alice Smith', 'alice@student.edu', 'alice123', 'student', 'Advanced'),
+    ('John Doe', 'john@student.edu', 'john123', 'student', 'Beginner')
+]
+
+def seed_demo_users():
+    """Insert the demo accounts if the users table is empty; returns how many were added"""
+    with get_db_connection("seed_demo_users") as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM users")
+        if cursor.fetchone()[0] > 0:
+            return 0
+
         demo_users = [
-            ('Demo Student', 'demo@student.edu', generate_password_hash('demo123'), 'student', 'Intermediate'),
-            ('Prof Demo', 'prof@university.edu', generate_password_hash('prof123'), 'educator', 'Advanced'),
-            ('Alice Smith', 'alice@student.edu', generate_password_hash('alice123'), 'student', 'Advanced'),
-            ('John Doe', 'john@student.edu', generate_password_hash('john123'), 'student', 'Beginner')
+            (name, email, generate_password_hash(password, auth.password_method()), user_type, level)
+            for name, email, password, user_type, level in DEMO_USERS
         ]
-        
         cursor.executemany('''
             INSERT INTO users (name, email, password_hash, user_type, student_level)
             VALUES (?, ?, ?, ?, ?)
         ''', demo_users)
-    
-    conn.commit()
-    conn.close()
+        conn.commit()
+    return len(demo_users)
+
+# =============================================================================
+# QUERIES
+# =============================================================================
+
+# Emails are stored normalized; NOCASE also finds the mixed-case emails of
+# accounts listed in email_collisions (see migrations.ensure_email_index)
+GET_USER_BY_EMAIL_SQL = "SELECT * FROM users WHERE email = ? COLLATE NOCASE ORDER BY id LIMIT 1"
+
+GET_USER_BY_ID_SQL = "SELECT * FROM users WHERE id = ?"
+
+CREATE_USER_SQL = '''
+    INSERT INTO users (name, email, password_hash, user_type)
+    VALUES (?, ?, ?, ?)
+'''
+
+# Only replaces the hash that was verified, so a concurrent password change wins
+UPDATE_PASSWORD_HASH_SQL = "UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?"
+
+SAVE_QUIZ_ATTEMPT_SQL = '''
+    INSERT INTO quiz_attempts (user_id, course_name, topic, answers, score, total_questions, percentage, feedback)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Columns the quiz history API may project; all covered by
+# idx_quiz_attempts_user_date_id
+HISTORY_COLUMNS = ('id', 'course_name', 'topic', 'score', 'total_questions', 'percentage', 'attempt_date')
+DEFAULT_HISTORY_COLUMNS = ('course_name', 'topic', 'score', 'total_questions', 'percentage', 'attempt_date')
+
+def user_quiz_history_sql(columns=DEFAULT_HISTORY_COLUMNS, keyset=False, limit=False,
+                          date_range=False, schema="main"):
+    """Build the newest-first history query for a projection and paging mode
+
+    date_range adds ``attempt_date >= ? AND attempt_date < ?`` bounds;
+    schema selects an attached archive instead of the hot database.
+    """
+    unknown = set(columns) - set(HISTORY_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown history column(s): {', '.join(sorted(unknown))}")
+    sql = f'''
+    SELECT {', '.join(columns)}
+    FROM {schema}.quiz_attempts
+    WHERE user_id = ?'''
+    if date_range:
+        sql += '''
+      AND attempt_date >= ? AND attempt_date < ?'''
+    if keyset:
+        sql += '''
+      AND (attempt_date, id) < (?, ?)'''
+    sql += '''
+    ORDER BY attempt_date DESC, id DESC'''
+    if limit:
+        sql += '''
+    LIMIT ?'''
+    return sql + '\n'
+
+USER_QUIZ_HISTORY_SQL = user_quiz_history_sql()
+
+# Reads the trigger-maintained rollup (see rollups.py): one row per student
+ALL_STUDENTS_PROGRESS_SQL = '''
+    SELECT u.id, u.name, u.email, u.student_level, u.last_login,
+           COALESCE(s.total_quizzes, 0) as total_quizzes,
+           COALESCE(s.percentage_sum / NULLIF(s.percentage_count, 0), 0) as avg_score,
+           s.last_activity
+    FROM users u
+    LEFT JOIN student_stats s ON u.id = s.user_id
+    WHERE u.user_type = 'student'
+'''
+
+# Reads the trigger-maintained course/topic rollup (see rollups.py)
+COURSE_ANALYTICS_SQL = '''
+    SELECT course_name, topic,
+           attempts,
+           percentage_sum / attempts as avg_score,
+           min_percentage as min_score,
+           max_percentage as max_score,
+           MAX(percentage_sq_sum / attempts - (percentage_sum / attempts) * (percentage_sum / attempts), 0)
+               as score_variance
+    FROM course_topic_stats
+    WHERE attempts > 0
+    ORDER BY course_name, avg_score DESC
+'''
+
+# Date-range analytics aggregate raw attempts (hot and archived) instead of
+# the all-time rollup; partial aggregates from each database are combined.
+def course_range_aggregate_sql(schema="main"):
+    return f'''
+    SELECT course_name, topic,
+           COUNT(*) as attempts,
+           SUM(percentage) as percentage_sum,
+           SUM(percentage * percentage) as percentage_sq_sum,
+           MIN(percentage) as min_percentage,
+           MAX(percentage) as max_percentage
+    FROM {schema}.quiz_attempts
+    WHERE attempt_date >= ? AND attempt_date < ?
+    GROUP BY course_name, topic
+'''
+
+UPDATE_USER_DIAGNOSTIC_SQL = '''
+    UPDATE users
+    SET diagnostic_completed = TRUE, difficulty_level = ?, student_level = ?
+    WHERE id = ?
+'''
+
+QUESTION_STATS_SQL = '''
+    SELECT question_id,
+           COUNT(*) as responses,
+           SUM(is_correct) as correct,
+           AVG(is_correct) * 100 as percent_correct
+    FROM attempt_items
+    WHERE question_id = ?
+'''
+
+ALL_QUESTION_STATS_SQL = '''
+    SELECT question_id,
+           COUNT(*) as responses,
+           SUM(is_correct) as correct,
+           AVG(is_correct) * 100 as percent_correct
+    FROM attempt_items
+    GROUP BY question_id
+    ORDER BY percent_correct
+'''
+
+TOPIC_ITEM_STATS_SQL = '''
+    SELECT topic,
+           COUNT(*) as responses,
+           SUM(is_correct) as correct,
+           AVG(is_correct) * 100 as percent_correct
+    FROM attempt_items
+    GROUP BY topic
+    ORDER BY percent_correct
+'''
+
+# Every statement the data layer issues, with sample parameters, so that
+# `python manage.py check-plans` can EXPLAIN each one.
+DATA_LAYER_QUERIES = {
+    "get_user_by_email": (GET_USER_BY_EMAIL_SQL, ("demo@student.edu",)),
+    "get_user_by_id": (GET_USER_BY_ID_SQL, (1,)),
+    "create_user": (CREATE_USER_SQL, ("Name", "new@student.edu", "hash", "student")),
+    "update_user_login": (UPDATE_LAST_LOGIN_SQL, ("2024-01-01 00:00:00", 1, "2024-01-01 00:00:00")),
+    "authenticate_user:rehash": (UPDATE_PASSWORD_HASH_SQL, ("hash", 1, "old hash")),
+    "save_quiz_attempt": (SAVE_QUIZ_ATTEMPT_SQL, (1, "mathematics", "Algebra", "[]", 3, 5, 60.0, None)),
+    "get_user_quiz_history": (USER_QUIZ_HISTORY_SQL, (1,)),
+    "get_user_quiz_history:page": (
+        user_quiz_history_sql(HISTORY_COLUMNS, keyset=True, limit=True),
+        (1, "2024-01-01 00:00:00", 100, 20)
+    ),
+    "get_user_quiz_history:range": (
+        user_quiz_history_sql(HISTORY_COLUMNS, date_range=True, limit=True),
+        (1, "2024-01-01 00:00:00", "2024-07-01 00:00:00", 20)
+    ),
+    "get_all_students_progress": (ALL_STUDENTS_PROGRESS_SQL, ()),
+    "get_course_analytics": (COURSE_ANALYTICS_SQL, ()),
+    "get_course_analytics:range": (
+        course_range_aggregate_sql(), ("2024-01-01 00:00:00", "2024-07-01 00:00:00")
+    ),
+    "update_user_diagnostic": (UPDATE_USER_DIAGNOSTIC_SQL, (2, "Intermediate", 1)),
+    "save_quiz_attempt:items": (INSERT_ATTEMPT_ITEMS_SQL, (1, 0, "0123456789abcdef", 2, 1, "Algebra")),
+    "get_question_stats": (QUESTION_STATS_SQL, ("0123456789abcdef",)),
+    "get_question_stats:all": (ALL_QUESTION_STATS_SQL, ()),
+    "get_topic_item_stats": (TOPIC_ITEM_STATS_SQL, ()),
+}
+
+for _name, (_sql, _) in DATA_LAYER_QUERIES.items():
+    querylog.label(_sql, _name)
+
+# Rollup tables are small by construction and meant to be read in full, as
+# is the archive registry (one row per archived term)
+FULL_SCAN_ALLOWED = {"course_topic_stats", "archive_terms"}
+
+def _load_user(sql, key, caller):
+    with get_db_connection(caller) as conn:
+        cursor = conn.cursor()
+        cursor.execute(sql, (key,))
+        user = cursor.fetchone()
+    if not user:
+        return None
+    user = dict(user)
+    get_user_cache().put(user)
+    return user
+
+def _invalidate_user(user_id, committed=None):
+    """Drop a user from the cache now and again once ``committed`` resolves
+
+    The second pass discards a copy re-read between queueing the write and
+    its commit.
+    """
+    cache = get_user_cache()
+    cache.invalidate(user_id)
+    if committed is not None:
+        committed.add_done_callback(lambda _: cache.invalidate(user_id))
+    return committed
+
+def get_user_by_email(email):
+    """Get user by email, ignoring case (read through the user cache)"""
+    email = normalize_email(email)
+    return get_user_cache().get_by_email(email) or _load_user(GET_USER_BY_EMAIL_SQL, email, "get_user_by_email")
+
+def get_user_by_id(user_id):
+    """Get user by id (read through the user cache)"""
+    return get_user_cache().get(user_id) or _load_user(GET_USER_BY_ID_SQL, user_id, "get_user_by_id")
+
+def authenticate_user(email, password):
+    """Return the user with this email if the password matches, else None
+
+    Verification runs in the auth service's worker processes and may raise
+    auth.AuthUnavailable under load. A hash made with outdated parameters
+    is replaced in the background.
+    """
+    user = get_user_by_email(email)
+    if not user:
+        return None
+    matches, new_hash = auth.verify_password(user['password_hash'], password)
+    if not matches:
+        return None
+    if new_hash:
+        _invalidate_user(user['id'], get_writer(DATABASE_PATH).execute(
+            UPDATE_PASSWORD_HASH_SQL, (new_hash, user['id'], user['password_hash'])
+        ))
+        user['password_hash'] = new_hash
+    return user
+
+def create_user(name, email, password_hash, user_type):
+    """Create new user; returns None if the email (in any case) is taken"""
+    email = normalize_email(email)
+    with get_db_connection("create_user") as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(CREATE_USER_SQL, (name, email, password_hash, user_type))
+        except sqlite3.IntegrityError:
+            return None
+        user_id = cursor.lastrowid
+        conn.commit()
+    get_user_cache().invalidate(user_id, email)
+    return user_id
+
+def update_user_login(user_id):
+    """Record a login; timestamps are written in batches (see lastlogin.py)
+
+    Returns a Future that resolves once the batch holding this login has
+    been committed.
+    """
+    return get_login_recorder(DATABASE_PATH, on_flushed=get_user_cache().invalidate).record(user_id)
+
+def save_quiz_attempt(user_id, course_name, topic, answers, score, total_questions, feedback=None):
+    """Queue a quiz attempt for the group-commit writer
+
+    Returns a Future that resolves to the new attempt id once the batch
+    holding the row has been committed.
+    """
+    percentage = (score / total_questions) * 100
+    codec = get_payload_codec()
+    stored_answers = payload_codec.encode_payload(answers, codec)
+    stored_feedback = payload_codec.encode_payload(feedback, codec)
+
+    def write(conn):
+        attempt_id = conn.execute(
+            SAVE_QUIZ_ATTEMPT_SQL,
+            (user_id, course_name, topic, stored_answers, score, total_questions, percentage, stored_feedback)
+        ).lastrowid
+        # Per-question rows go in the same transaction as the attempt
+        conn.executemany(INSERT_ATTEMPT_ITEMS_SQL, attempt_item_rows(attempt_id, answers, feedback))
+        return attempt_id
+
+    return get_writer(DATABASE_PATH).submit(write)
+
+def get_user_quiz_history(user_id, limit=None, before=None, columns=DEFAULT_HISTORY_COLUMNS,
+                          since=None, until=None):
+    """Get user's quiz history, newest first
+
+    limit caps the number of rows; before is a keyset cursor
+    (attempt_date, id) taken from the last row of the previous page, so
+    every page is an index seek regardless of how many attempts precede
+    it; columns projects a subset of HISTORY_COLUMNS; since/until bound
+    attempt_date to [since, until).
+
+    Archived terms are attached only when the hot database cannot answer
+    on its own: when it returned fewer than limit rows, or when an archive
+    holds attempts newer than the oldest hot row returned.
+    """
+    fetch_columns = tuple(columns) + tuple(c for c in ('attempt_date', 'id') if c not in columns)
+    date_range = since is not None or until is not None
+
+    def query(cursor, schema):
+        sql = user_quiz_history_sql(fetch_columns, keyset=before is not None,
+                                    limit=limit is not None, date_range=date_range, schema=schema)
+        params = [user_id]
+        if date_range:
+            params.extend((since or "", until or "~"))
+        if before is not None:
+            params.extend(before)
+        if limit is not None:
+            params.append(limit)
+        cursor.execute(sql, params)
+        return [dict(row) for row in cursor.fetchall()]
+
+    with get_db_connection("get_user_quiz_history") as conn:
+        cursor = conn.cursor()
+        history = query(cursor, "main")
+
+        terms = archive.terms_overlapping(conn, since, until)
+        if before is not None:
+            terms = [term for term in terms if term['first_attempt'] <= before[0]]
+        if limit is not None and len(history) == limit:
+            oldest = history[-1]['attempt_date']
+            terms = [term for term in terms if term['last_attempt'] >= oldest]
+
+        if terms:
+            parts = [history]
+            for group in archive.term_groups(terms):
+                with archive.attached(conn, group) as schemas:
+                    parts.extend(query(cursor, schema) for schema in schemas)
+            newest_first = lambda row: (row['attempt_date'], row['id'])
+            history = list(heapq.merge(*parts, key=newest_first, reverse=True))
+            if limit is not None:
+                history = history[:limit]
+
+    if fetch_columns != tuple(columns):
+        history = [{column: row[column] for column in columns} for row in history]
+    return history
+
+def iter_user_quiz_history(user_id, columns=DEFAULT_HISTORY_COLUMNS, page_size=500):
+    """Stream a user's quiz history newest first, one keyset page at a time
+
+    Holds at most page_size rows in memory and never keeps a connection
+    checked out between pages.
+    """
+    fetch_columns = tuple(columns) + tuple(c for c in ('attempt_date', 'id') if c not in columns)
+    before = None
+    while True:
+        page = get_user_quiz_history(user_id, limit=page_size, before=before, columns=fetch_columns)
+        for row in page:
+            yield {column: row[column] for column in columns}
+        if len(page) < page_size:
+            return
+        before = (page[-1]['attempt_date'], page[-1]['id'])
+
+def get_all_students_progress():
+    """Get progress data for all students"""
+    with get_analytics_connection("get_all_students_progress") as conn:
+        cursor = conn.cursor()
+        cursor.execute(ALL_STUDENTS_PROGRESS_SQL)
+        students = cursor.fetchall()
+    return [dict(row) for row in students]
+
+def get_course_analytics(since=None, until=None):
+    """Get course-wide analytics per course and topic, including score variance
+
+    Without a date range this reads the all-time rollup. With one, attempts
+    in [since, until) are aggregated from the hot database and from any
+    archived term that overlaps the range.
+    """
+    with get_analytics_connection("get_course_analytics") as conn:
+        cursor = conn.cursor()
+        if since is None and until is None:
+            cursor.execute(COURSE_ANALYTICS_SQL)
+            return [dict(row) for row in cursor.fetchall()]
+
+        bounds = (since or "", until or "~")
+        parts = [cursor.execute(course_range_aggregate_sql(), bounds).fetchall()]
+        for group in archive.term_groups(archive.terms_overlapping(conn, since, until)):
+            with archive.attached(conn, group) as schemas:
+                parts.extend(cursor.execute(course_range_aggregate_sql(schema), bounds).fetchall()
+                             for schema in schemas)
+
+    totals = {}
+    for row in (row for part in parts for row in part):
+        key = (row['course_name'], row['topic'])
+        if key not in totals:
+            totals[key] = dict(row)
+            continue
+        total = totals[key]
+        for column in ('attempts', 'percentage_sum', 'percentage_sq_sum'):
+            total[column] += row[column]
+        total['min_percentage'] = min(total['min_percentage'], row['min_percentage'])
+        total['max_percentage'] = max(total['max_percentage'], row['max_percentage'])
+
+    analytics = []
+    for total in totals.values():
+        avg = total['percentage_sum'] / total['attempts']
+        analytics.append({
+            'course_name': total['course_name'],
+            'topic': total['topic'],
+            'attempts': total['attempts'],
+            'avg_score': avg,
+            'min_score': total['min_percentage'],
+            'max_score': total['max_percentage'],
+            'score_variance': max(total['percentage_sq_sum'] / total['attempts'] - avg * avg, 0),
+        })
+    analytics.sort(key=lambda row: (row['course_name'], -row['avg_score']))
+    return analytics
+
+def get_educator_dashboard():
+    """Student progress and all-time course analytics from one snapshot
+
+    Both reports run on a single analytics connection inside read_snapshot,
+    so they agree with each other even while quiz attempts are committing.
+    """
+    with get_analytics_connection("get_educator_dashboard") as conn, read_snapshot(conn):
+        return get_all_students_progress(), get_course_analytics()
+
+def update_user_diagnostic(user_id, difficulty_level, student_level):
+    """Queue an update of the user's diagnostic results
+
+    Returns a Future that resolves once the update has been committed.
+    """
+    return _invalidate_user(user_id, get_writer(DATABASE_PATH).execute(
+        UPDATE_USER_DIAGNOSTIC_SQL, (difficulty_level, student_level, user_id)
+    ))
+
+def get_question_stats(question_id=None):
+    """Correctness per question id (see attempt_items.question_key), hardest first"""
+    with get_analytics_connection("get_question_stats") as conn:
+        cursor = conn.cursor()
+        if question_id is None:
+            cursor.execute(ALL_QUESTION_STATS_SQL)
+        else:
+            cursor.execute(QUESTION_STATS_SQL, (question_id,))
+        return [dict(row) for row in cursor.fetchall() if row['responses']]
 
-# [Include all other database functions from models.py...]
\ No newline at end of file
+def get_topic_item_stats():
+    """Correctness per question topic across all attempts, weakest first"""
+    with get_analytics_connection("get_topic_item_stats") as conn:
+        cursor = conn.cursor()
+        cursor.execute(TOPIC_ITEM_STATS_SQL)
+        stats = cursor.fetchall()
+    return [dict(row) for row in stats]
@@ -0,0 +1,226 @@
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, Optional, Union
+
+try:
+    import zstandard
+except ImportError:  # optional: pip install zstandard
+    zstandard = None
+
+# =============================================================================
+# PAYLOAD CODEC
+# =============================================================================
+#
+# quiz_attempts.feedback and .answers hold JSON. Encoded payloads are stored
+# as BLOBs whose first byte names the codec, so rows written under any codec
+# (or none: legacy rows are plain TEXT) decode transparently side by side.
+#
+#   TEXT                        uncompressed JSON (legacy, or not worth compressing)
+#   0x01 + zlib stream          ZlibCodec
+#   0x02 + u32 dict id + frame  ZstdCodec; dict id 0 means no dictionary
+
+PAYLOAD_CODEC = os.environ.get("EDUTUTOR_PAYLOAD_CODEC", "zlib")
+# zstd's trainer fails outright ("Src size is incorrect") on too little
+# data; a dictionary is only worth having when trained on at least this
+# many payloads, totalling at least its own size
+ZSTD_MIN_TRAINING_SAMPLES = 100
+
+PAYLOAD_DICTIONARIES_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS payload_dictionaries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        codec TEXT NOT NULL,
+        dictionary BLOB NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+
+class CodecUnavailable(Exception):
+    """Raised when a payload needs a codec or dictionary this process lacks"""
+
+
+class TrainingFailed(Exception):
+    """Raised when a dictionary cannot be trained from the given samples"""
+
+
+class ZlibCodec:
+    codec_id = 1
+    name = "zlib"
+
+    def __init__(self, level: int = 6):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return bytes([self.codec_id]) + zlib.compress(data, self.level)
+
+    def decompress(self, payload: bytes) -> bytes:
+        return zlib.decompress(payload[1:])
+
+
+class ZstdCodec:
+    codec_id = 2
+    name = "zstd"
+
+    def __init__(self, dictionary: Optional[bytes] = None, dictionary_id: int = 0, level: int = 3):
+        if zstandard is None:
+            raise CodecUnavailable("zstd payloads need the 'zstandard' package")
+        self.dictionary_id = dictionary_id if dictionary else 0
+        self._dict = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        self._level = level
+        self._local = threading.local()  # zstd contexts are not thread-safe
+
+    def _contexts(self):
+        if not hasattr(self._local, "compressor"):
+            self._local.compressor = zstandard.ZstdCompressor(level=self._level, dict_data=self._dict)
+            self._local.decompressor = zstandard.ZstdDecompressor(dict_data=self._dict)
+        return self._local.compressor, self._local.decompressor
+
+    def compress(self, data: bytes) -> bytes:
+        compressor, _ = self._contexts()
+        return struct.pack(">BI", self.codec_id, self.dictionary_id) + compressor.compress(data)
+
+    def decompress(self, payload: bytes) -> bytes:
+        _, decompressor = self._contexts()
+        return decompressor.decompress(payload[5:])
+
+
+# Decoders by (codec id, dictionary id)
+_decoders: Dict[tuple, object] = {(ZlibCodec.codec_id, 0): ZlibCodec()}
+_decoders_lock = threading.Lock()
+
+def register_zstd_dictionary(dictionary_id: int, dictionary: bytes) -> "ZstdCodec":
+    """Make a stored zstd dictionary available for encoding and decoding"""
+    codec = ZstdCodec(dictionary, dictionary_id)
+    with _decoders_lock:
+        _decoders[(ZstdCodec.codec_id, dictionary_id)] = codec
+    return codec
+
+def load_dictionaries(conn) -> int:
+    """Register every dictionary stored in payload_dictionaries; returns the latest id"""
+    latest = 0
+    if zstandard is None:
+        return latest
+    for dictionary_id, dictionary in conn.execute(
+            "SELECT id, dictionary FROM payload_dictionaries WHERE codec = 'zstd' ORDER BY id"):
+        if (ZstdCodec.codec_id, dictionary_id) not in _decoders:
+            register_zstd_dictionary(dictionary_id, dictionary)
+        latest = dictionary_id
+    return latest
+
+def train_zstd_dictionary(conn, samples: Iterable[str], size: int = 64 * 1024) -> int:
+    """Train a dictionary on sample payloads, store it, and return its id"""
+    if zstandard is None:
+        raise CodecUnavailable("training a dictionary needs the 'zstandard' package")
+    encoded = [s.encode("utf-8") for s in samples]
+    total = sum(len(sample) for sample in encoded)
+    if len(encoded) < ZSTD_MIN_TRAINING_SAMPLES or total < size:
+        raise TrainingFailed(
+            f"a {size:,}-byte dictionary needs at least {ZSTD_MIN_TRAINING_SAMPLES} samples "
+            f"totalling {size:,} bytes; got {len(encoded)} totalling {total:,}"
+        )
+    try:
+        dictionary = zstandard.train_dictionary(size, encoded).as_bytes()
+    except zstandard.ZstdError as exc:
+        raise TrainingFailed(f"zstd could not train a dictionary on {len(encoded)} samples: {exc}") from exc
+    dictionary_id = conn.execute(
+        "INSERT INTO payload_dictionaries (codec, dictionary) VALUES ('zstd', ?)", (dictionary,)
+    ).lastrowid
+    register_zstd_dictionary(dictionary_id, dictionary)
+    return dictionary_id
+
+def get_codec(name: str = PAYLOAD_CODEC, conn=None):
+    """Resolve a codec by name; zstd uses the newest stored dictionary if conn is given"""
+    if name in (None, "", "none"):
+        return None
+    if name == "zlib":
+        return _decoders[(ZlibCodec.codec_id, 0)]
+    if name == "zstd":
+        dictionary_id = load_dictionaries(conn) if conn is not None else 0
+        key = (ZstdCodec.codec_id, dictionary_id)
+        with _decoders_lock:
+            if key not in _decoders:
+                _decoders[key] = ZstdCodec()
+            return _decoders[key]
+    raise ValueError(f"Unknown payload codec: {name}")
+
+def encode_payload(text: Optional[str], codec) -> Union[str, bytes, None]:
+    """Encode a JSON payload; keeps it as TEXT when compression does not pay off"""
+    if text is None or codec is None:
+        return text
+    raw = text.encode("utf-8")
+    encoded = codec.compress(raw)
+    return encoded if len(encoded) < len(raw) else text
+
+def decode_payload(value: Union[str, bytes, None]) -> Optional[str]:
+    """Decode a stored feedback/answers value back to its JSON text"""
+    if value is None or isinstance(value, str):
+        return value
+    value = bytes(value)
+    codec_id = value[0]
+    dictionary_id = struct.unpack(">I", value[1:5])[0] if codec_id == ZstdCodec.codec_id else 0
+    decoder = _decoders.get((codec_id, dictionary_id))
+    if decoder is None:
+        if codec_id == ZstdCodec.codec_id and dictionary_id == 0:
+            decoder = get_codec("zstd")
+        else:
+            raise CodecUnavailable(
+                f"No decoder for payload codec {codec_id} (dictionary {dictionary_id}); "
+                f"call load_dictionaries() first"
+            )
+    return decoder.decompress(value).decode("utf-8")
+
+def compact_attempt_payloads(conn, codec, batch_size: int = 500, after_id: int = 0):
+    """Re-encode quiz_attempts.feedback/answers with ``codec``, batch by batch
+
+    Every re-encoded value is decoded again and compared with the original
+    before it is written. Yields a stats dict after each committed batch:
+    rows scanned/rewritten, stored bytes before/after, and the seconds and
+    JSON bytes spent decoding the old and new representations (for
+    throughput).
+    """
+    load_dictionaries(conn)
+    while True:
+        rows = conn.execute('''
+            SELECT id, answers, feedback FROM quiz_attempts
+            WHERE id > ? ORDER BY id LIMIT ?
+        ''', (after_id, batch_size)).fetchall()
+        if not rows:
+            return
+
+        stats = {"last_id": rows[-1][0], "rows": len(rows), "rewritten": 0,
+                 "bytes_before": 0, "bytes_after": 0, "json_bytes": 0,
+                 "decode_before_s": 0.0, "decode_after_s": 0.0}
+        updates = []
+        for attempt_id, answers, feedback in rows:
+            new_values = []
+            for value in (answers, feedback):
+                start = time.perf_counter()
+                text = decode_payload(value)
+                stats["decode_before_s"] += time.perf_counter() - start
+
+                encoded = encode_payload(text, codec)
+                start = time.perf_counter()
+                if decode_payload(encoded) != text:
+                    raise ValueError(f"Round-trip mismatch for attempt {attempt_id}")
+                stats["decode_after_s"] += time.perf_counter() - start
+
+                stats["bytes_before"] += _stored_size(value)
+                stats["bytes_after"] += _stored_size(encoded)
+                stats["json_bytes"] += len(text.encode("utf-8")) if text else 0
+                new_values.append(encoded)
+            if new_values != [answers, feedback]:
+                updates.append((new_values[0], new_values[1], attempt_id))
+
+        conn.executemany("UPDATE quiz_attempts SET answers = ?, feedback = ? WHERE id = ?", updates)
+        conn.commit()
+        stats["rewritten"] = len(updates)
+        after_id = rows[-1][0]
+        yield stats
+
+def _stored_size(value) -> int:
+    if value is None:
+        return 0
+    return len(value.encode("utf-8")) if isinstance(value, str) else len(value)
@@ -0,0 +1,352 @@
+import atexit
+import bisect
+import functools
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+# =============================================================================
+# QUERY INSTRUMENTATION
+# =============================================================================
+#
+# Instrumentation is off unless configured: setting
+# EDUTUTOR_QUERY_SAMPLE_RATE above 0 turns on sampling, the slow-statement
+# progress handler and the group-commit writer's instrumentation. With it
+# off, connections are plain sqlite3 connections and sample() returns False
+# straight away.
+#
+# Sampling happens per pool checkout: db.ConnectionPool.connect() calls
+# sample(), and for a sampled checkout (SAMPLE_RATE) every statement runs on
+# an InstrumentedCursor that records its latency (execute plus fetches) in a
+# histogram, with row counts and lock-wait time. Instrumented statements over
+# SLOW_QUERY_MS are logged with their EXPLAIN QUERY PLAN. Unsampled
+# checkouts pay for one random() call.
+#
+# Slow statements are caught outside the sample too. Data-layer functions
+# name themselves when they check out a connection (get_db_connection's
+# ``caller``), and the pool records that name for the connection while it is
+# checked out. Every connection has a SQLite progress handler that fires once
+# a statement has run PROGRESS_STEPS VM instructions, well below the slow
+# threshold; it forces that caller's next CAPTURE_CALLS checkouts into
+# sampling, so a statement that is slow again is timed and logged with its
+# plan. The handler costs nothing until a statement runs that long. The
+# group-commit writer is always instrumented, because its batches cost
+# milliseconds.
+#
+# Lock waits: in WAL mode readers never wait, and writes here take the write
+# lock up front with BEGIN IMMEDIATE (group-commit writer, migrations,
+# importer), so the time spent in BEGIN IMMEDIATE/EXCLUSIVE is the lock wait.
+#
+# Statements are keyed by the data-layer name registered via label() (see
+# models.DATA_LAYER_QUERIES), or by their whitespace-normalized SQL.
+
+SAMPLE_RATE = float(os.environ.get("EDUTUTOR_QUERY_SAMPLE_RATE", "0"))
+# EDUTUTOR_QUERY_LOG=0 switches instrumentation off even with a sample rate
+ENABLED = SAMPLE_RATE > 0 and os.environ.get("EDUTUTOR_QUERY_LOG", "1") not in ("0", "false", "no")
+SLOW_QUERY_MS = float(os.environ.get("EDUTUTOR_SLOW_QUERY_MS", "200"))
+# VM instructions after which a running statement counts as long (~10 ms)
+PROGRESS_STEPS = int(os.environ.get("EDUTUTOR_SLOW_QUERY_STEPS", "1000000"))
+# Checkouts force-sampled after a long statement from the same function
+CAPTURE_CALLS = int(os.environ.get("EDUTUTOR_SLOW_QUERY_CAPTURE_CALLS", "5"))
+# Seconds between JSON dumps of snapshot(); 0 disables the dump thread
+DUMP_INTERVAL = float(os.environ.get("EDUTUTOR_QUERY_DUMP_INTERVAL", "0"))
+DUMP_PATH = os.environ.get("EDUTUTOR_QUERY_DUMP_PATH", "query_stats.json")
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf"))
+
+logger = logging.getLogger("edututor.slow_query")
+
+_LOCKING = re.compile(r"^\s*BEGIN\s+(IMMEDIATE|EXCLUSIVE)\b", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+class StatementStats:
+    __slots__ = ("key", "sampled", "total_ms", "max_ms", "rows", "lock_wait_ms", "slow", "buckets")
+
+    def __init__(self, key: str):
+        self.key = key
+        self.sampled = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.lock_wait_ms = 0.0
+        self.slow = 0
+        self.buckets = [0] * len(BUCKETS_MS)
+
+    def add(self, elapsed_ms: float, rows: int, lock_wait_ms: float):
+        self.sampled += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.rows += rows
+        self.lock_wait_ms += lock_wait_ms
+        self.buckets[bisect.bisect_left(BUCKETS_MS, elapsed_ms)] += 1
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Upper bound of the bucket holding the given fraction of samples"""
+        if not self.sampled:
+            return None
+        threshold = fraction * self.sampled
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= threshold:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def as_dict(self) -> Dict:
+        sampled = self.sampled or 1
+        return {
+            "sampled": self.sampled,
+            "estimated_calls": round(self.sampled / SAMPLE_RATE) if SAMPLE_RATE > 0 else None,
+            "mean_ms": self.total_ms / sampled,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": self.max_ms,
+            "mean_rows": self.rows / sampled,
+            "lock_wait_ms": self.lock_wait_ms,
+            "slow": self.slow,
+            "histogram": {f"<={bound}": count for bound, count in zip(BUCKETS_MS, self.buckets) if count},
+        }
+
+
+_stats: Dict[str, StatementStats] = {}
+_labels: Dict[str, str] = {}
+_keys: Dict[str, str] = {}  # raw SQL -> key, so normalization runs once per statement text
+_lock = threading.Lock()
+
+def _normalize(sql: str) -> str:
+    return _WHITESPACE.sub(" ", sql).strip()
+
+def label(sql: str, name: str):
+    """Report statistics for ``sql`` under a readable name"""
+    with _lock:
+        _labels[_normalize(sql)] = name
+        _keys.clear()
+
+def _key(sql: str) -> str:
+    key = _keys.get(sql)
+    if key is None:
+        normalized = _normalize(sql)
+        key = _labels.get(normalized, normalized[:200])
+        with _lock:
+            if len(_keys) < 10000:
+                _keys[sql] = key
+    return key
+
+def _stats_for(key: str) -> StatementStats:
+    stats = _stats.get(key)
+    if stats is None:
+        with _lock:
+            stats = _stats.setdefault(key, StatementStats(key))
+    return stats
+
+def _record(sql: str, elapsed_ms: float, rows: int):
+    lock_wait_ms = elapsed_ms if _LOCKING.match(sql) else 0.0
+    stats = _stats_for(_key(sql))
+    with _lock:
+        stats.add(elapsed_ms, rows, lock_wait_ms)
+
+def _log_slow(conn, sql: str, parameters, elapsed_ms: float):
+    stats = _stats_for(_key(sql))
+    with _lock:
+        stats.slow += 1
+    plan = []
+    if parameters is not None:
+        try:
+            # A plain cursor, so explaining is not itself instrumented
+            plan = [row[3] for row in sqlite3.Cursor(conn).execute("EXPLAIN QUERY PLAN " + sql, parameters)]
+        except sqlite3.Error:
+            pass
+    # Parameters are not logged: they can hold emails and password hashes
+    logger.warning("slow query %.1f ms: %s%s", elapsed_ms, _key(sql),
+                   "".join(f"\n    {line}" for line in plan))
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that records every statement's latency, rows and lock wait"""
+
+    _sample = None  # [sql, parameters, elapsed_ms, rows] until the result is consumed
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        start = time.perf_counter()
+        super().execute(sql, parameters)
+        self._sample = [sql, parameters, (time.perf_counter() - start) * 1000, 0]
+        if self.description is None:
+            self._sample[3] = max(self.rowcount, 0)
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        start = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._sample = [sql, None, (time.perf_counter() - start) * 1000, max(self.rowcount, 0)]
+        self._finish()
+        return self
+
+    def _timed_fetch(self, fetch, *args):
+        start = time.perf_counter()
+        result = fetch(*args)
+        self._sample[2] += (time.perf_counter() - start) * 1000
+        return result
+
+    def fetchone(self):
+        if self._sample is None:
+            return super().fetchone()
+        row = self._timed_fetch(super().fetchone)
+        self._sample[3] += row is not None
+        if row is None or self._sample[3] == 1:
+            # Point lookups read one row; close the sample right away
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        if self._sample is None:
+            return super().fetchmany(size) if size is not None else super().fetchmany()
+        size = size if size is not None else self.arraysize
+        rows = self._timed_fetch(super().fetchmany, size)
+        self._sample[3] += len(rows)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        if self._sample is None:
+            return super().fetchall()
+        rows = self._timed_fetch(super().fetchall)
+        self._sample[3] += len(rows)
+        self._finish()
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # Cursors that are iterated rather than fetched from end here
+        self._finish()
+
+    def _finish(self):
+        sample = self._sample
+        if sample is not None:
+            self._sample = None
+            sql, parameters, elapsed_ms, rows = sample
+            _record(sql, elapsed_ms, rows)
+            if elapsed_ms >= SLOW_QUERY_MS:
+                _log_slow(self.connection, sql, parameters, elapsed_ms)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors (including conn.execute shortcuts) are instrumented"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+_capture: Dict[str, int] = {}  # data-layer function -> checkouts still to force-sample
+_checked_out: Dict[int, str] = {}  # id(connection) -> data-layer function using it
+
+_random = random.random
+
+def sample(caller: Optional[str] = None) -> bool:
+    """Whether a checkout by data-layer function ``caller`` should be instrumented"""
+    if not ENABLED:
+        return False
+    if _random() < SAMPLE_RATE:
+        return True
+    return caller is not None and bool(_capture) and _captured(caller)
+
+def _captured(caller: str) -> bool:
+    with _lock:
+        remaining = _capture.get(caller, 0)
+        if not remaining:
+            return False
+        if remaining == 1:
+            del _capture[caller]
+        else:
+            _capture[caller] = remaining - 1
+        return True
+
+def checked_out(conn, caller: Optional[str]) -> Optional[str]:
+    """Record which function is using a watched connection; returns the previous one
+
+    Pass the returned name back when the checkout ends, so nested checkouts
+    of one connection restore their caller's name.
+    """
+    if not ENABLED:
+        return None
+    key = id(conn)
+    previous = _checked_out.get(key)
+    if caller is None:
+        _checked_out.pop(key, None)
+    else:
+        _checked_out[key] = caller
+    return previous
+
+def _on_progress(key: int):
+    caller = _checked_out.get(key)
+    if caller is not None and len(_capture) < 1000:
+        with _lock:
+            _capture.setdefault(caller, CAPTURE_CALLS)
+    return 0
+
+def watch(conn):
+    """Install the long-statement progress handler on a new connection"""
+    if ENABLED and CAPTURE_CALLS > 0:
+        conn.set_progress_handler(functools.partial(_on_progress, id(conn)), PROGRESS_STEPS)
+
+def snapshot() -> Dict:
+    """Current per-statement statistics, slowest mean first"""
+    with _lock:
+        statements = {key: stats.as_dict() for key, stats in _stats.items()}
+    return {
+        "generated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "sample_rate": SAMPLE_RATE,
+        "slow_query_ms": SLOW_QUERY_MS,
+        "statements": dict(sorted(statements.items(), key=lambda item: -item[1]["mean_ms"])),
+    }
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+def dump(path: str = DUMP_PATH):
+    """Write snapshot() to ``path`` as JSON (atomically replaced)"""
+    with open(path + ".tmp", "w") as handle:
+        json.dump(snapshot(), handle, indent=2)
+    os.replace(path + ".tmp", path)
+
+_dumper = None
+
+def start_dumper(interval: float = DUMP_INTERVAL, path: str = DUMP_PATH):
+    """Dump statistics every ``interval`` seconds and at exit; no-op if already running"""
+    global _dumper
+    if interval <= 0 or _dumper is not None:
+        return
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            dump(path)
+
+    _dumper = threading.Thread(target=run, name="edututor-querylog-dump", daemon=True)
+    _dumper.start()
+    atexit.register(lambda: (stop.set(), dump(path)))
+
+if ENABLED:
+    start_dumper()
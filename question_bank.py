@@ -0,0 +1,555 @@
+import bisect
+import json
+import mmap
+import os
+import random
+import struct
+import threading
+from collections.abc import Mapping, MutableMapping
+from types import MappingProxyType
+from typing import Collection, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from attempt_items import question_key
+
+# =============================================================================
+# QUESTION BANKS
+# =============================================================================
+#
+# Each app's bank is edited as question_banks/<name>.json
+# ({subject: {difficulty: [question, ...]}}) and served from a compiled
+# store, question_banks/<name>.qbank, rebuilt automatically whenever the
+# JSON is newer:
+#
+#   "EQB2" | u32 directory length | directory (JSON)
+#   | u64 record offsets (count + 1)
+#   | u64 question ids, in record order
+#   | u64 question ids, sorted | u32 record of each sorted id
+#   | records (one JSON question each)
+#
+# Records are sorted by subject, difficulty and topic, so the directory maps
+# every (subject, difficulty) and every (subject, difficulty, topic) to a
+# contiguous run of records: that is the selection index, and it costs no
+# per-question memory. Question ids are attempt_items.question_key() of the
+# question text, as recorded in attempt_items, so they stay valid when the
+# bank is rebuilt.
+#
+# A process maps the file read-only and shared, so every worker process
+# reads the same page cache copy, and decodes a question only when a quiz
+# uses it. Decoded questions are immutable Question records shared by every
+# session and thread; a quiz wraps each one in a QuizQuestion, which keeps
+# per-quiz attributes (subject, difficulty, ...) in its own small overlay
+# instead of copying or modifying the shared record.
+#
+#   bank = question_bank.get("edu")
+#   bank["mathematics"]["easy"][0]["question"]
+#   bank.select(5, subjects=["mathematics"], difficulties=["medium", "hard"],
+#               topics=["Calculus"], exclude_ids=seen)
+
+QUESTION_BANK_DIR = os.environ.get(
+    "EDUTUTOR_QUESTION_BANK_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "question_banks")
+)
+# Decoded questions kept per bank for reuse across quizzes; a question is
+# decoded once and kept until the bank holds this many (then later ones
+# are decoded on every use)
+DECODED_CACHE_SIZE = int(os.environ.get("EDUTUTOR_QUESTION_CACHE_SIZE", "65536"))
+# Shuffle answer options per quiz. Off by default: some options refer to
+# others by position ("Both A and B")
+SHUFFLE_OPTIONS = os.environ.get("EDUTUTOR_SHUFFLE_OPTIONS", "0") not in ("0", "false", "no")
+
+MAGIC = b"EQB2"
+_HEADER = struct.Struct("<4sI")
+_U64 = struct.Struct("<Q")
+_U32 = struct.Struct("<I")
+_RECORD_BOUNDS = struct.Struct("<2Q")
+
+
+def freeze(value):
+    """Recursively turn dicts into read-only mappings and lists into tuples"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+class Question(Mapping):
+    """An immutable bank question, read like the dict it was compiled from
+
+    Missing optional fields (explanation) are absent from the mapping, so
+    question.get("explanation", default) behaves as it does on a dict.
+    """
+
+    __slots__ = ("id", "question", "options", "correct", "explanation", "topic")
+
+    def __init__(self, id: str, question: str, options: Iterable[str], correct: int,
+                 explanation: Optional[str] = None, topic: str = "General"):
+        set_field = object.__setattr__
+        set_field(self, "id", id)
+        set_field(self, "question", question)
+        set_field(self, "options", tuple(options))
+        set_field(self, "correct", correct)
+        set_field(self, "explanation", explanation)
+        set_field(self, "topic", topic)
+
+    @classmethod
+    def from_record(cls, question_id: str, record: Dict) -> "Question":
+        return cls(question_id, record["question"], record["options"], record["correct"],
+                   record.get("explanation"), record.get("topic", "General"))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    __delattr__ = __setattr__
+
+    def __reduce__(self):
+        return type(self), tuple(getattr(self, name) for name in self.__slots__)
+
+    def __getitem__(self, key):
+        if key not in self.__slots__ or getattr(self, key) is None:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return (name for name in self.__slots__ if getattr(self, name) is not None)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"Question(id={self.id!r}, question={self.question!r})"
+
+
+class QuizQuestion(MutableMapping):
+    """A shared Question as it appears in one quiz
+
+    Reads fall through to the question; writes (quiz-specific attributes
+    such as subject or difficulty) go to this quiz's overlay only, so the
+    shared record is never touched and the overlay is all a quiz allocates.
+    """
+
+    __slots__ = ("base", "overlay")
+
+    def __init__(self, base: Question, **overlay):
+        self.base = base
+        self.overlay = overlay
+
+    def __getitem__(self, key):
+        if key in self.overlay:
+            return self.overlay[key]
+        return self.base[key]
+
+    def __setitem__(self, key, value):
+        self.overlay[key] = value
+
+    def __delitem__(self, key):
+        # Only quiz attributes can be removed; the question itself is shared
+        del self.overlay[key]
+
+    def __iter__(self):
+        yield from self.overlay
+        yield from (key for key in self.base if key not in self.overlay)
+
+    def __len__(self):
+        return len(self.overlay) + sum(1 for key in self.base if key not in self.overlay)
+
+    def __repr__(self):
+        return f"QuizQuestion({self.base!r}, **{self.overlay!r})"
+
+
+def source_path(name: str, directory: str = QUESTION_BANK_DIR) -> str:
+    return os.path.join(directory, f"{name}.json")
+
+def store_path(name: str, directory: str = QUESTION_BANK_DIR) -> str:
+    return os.path.join(directory, f"{name}.qbank")
+
+def load_source(name: str, directory: str = QUESTION_BANK_DIR) -> Dict:
+    """The editable JSON bank as a fresh mutable dict"""
+    with open(source_path(name, directory), encoding="utf-8") as handle:
+        return json.load(handle)
+
+def _aligned(position: int) -> int:
+    return (position + 7) // 8 * 8
+
+def _sections(directory_length: int, count: int) -> Tuple[int, int, int, int, int]:
+    """Byte positions of offsets, ids, sorted ids, their records, and the records"""
+    offsets_at = _aligned(_HEADER.size + directory_length)
+    ids_at = offsets_at + _U64.size * (count + 1)
+    sorted_ids_at = ids_at + _U64.size * count
+    sorted_records_at = sorted_ids_at + _U64.size * count
+    records_at = _aligned(sorted_records_at + _U32.size * count)
+    return offsets_at, ids_at, sorted_ids_at, sorted_records_at, records_at
+
+def write_store(banks: Dict, path: str) -> int:
+    """Compile {subject: {difficulty: [question]}} into a store file; returns the question count"""
+    subjects = {}
+    records = []
+    ids = []
+    for subject, difficulties in banks.items():
+        subjects[subject] = {}
+        for difficulty, questions in difficulties.items():
+            run = {"start": len(records), "count": len(questions), "topics": {}}
+            # Stable sort: questions keep their order within a topic
+            for question in sorted(questions, key=lambda question: question.get("topic", "General")):
+                topic = run["topics"].setdefault(question.get("topic", "General"), [len(records), 0])
+                topic[1] += 1
+                records.append(json.dumps(question, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+                ids.append(int(question_key(question["question"]), 16))
+            subjects[subject][difficulty] = run
+
+    directory = json.dumps({"subjects": subjects, "count": len(records)}).encode("utf-8")
+    offsets_at, _, _, _, records_at = _sections(len(directory), len(records))
+    offsets = [0]
+    for record in records:
+        offsets.append(offsets[-1] + len(record))
+    by_id = sorted(range(len(ids)), key=ids.__getitem__)
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as handle:
+        handle.write(_HEADER.pack(MAGIC, len(directory)))
+        handle.write(directory)
+        handle.write(b"\0" * (offsets_at - _HEADER.size - len(directory)))
+        handle.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+        handle.write(struct.pack(f"<{len(ids)}Q", *ids))
+        handle.write(struct.pack(f"<{len(ids)}Q", *(ids[index] for index in by_id)))
+        handle.write(struct.pack(f"<{len(ids)}I", *by_id))
+        handle.write(b"\0" * (records_at - handle.tell()))
+        for record in records:
+            handle.write(record)
+    os.replace(tmp, path)
+    return len(records)
+
+
+class QuestionStore:
+    """Read-only, memory-mapped view of a compiled question bank"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as handle:
+            self._data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, directory_length = _HEADER.unpack_from(self._data, 0)
+        if magic != MAGIC:
+            self._data.close()
+            raise ValueError(f"{path} is not a question bank store in the current format")
+        directory = json.loads(self._data[_HEADER.size:_HEADER.size + directory_length])
+        self.count = directory["count"]
+        # subject -> difficulty -> {"start", "count", "topics": {topic: [start, count]}}
+        self.runs: Dict[str, Dict[str, Dict]] = directory["subjects"]
+        (self._offsets_at, self._ids_at, self._sorted_ids_at,
+         self._sorted_records_at, self._records_at) = _sections(directory_length, self.count)
+
+    def record(self, index: int) -> bytes:
+        """Raw JSON of record ``index`` (its position in the file)"""
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        start, end = _RECORD_BOUNDS.unpack_from(self._data, self._offsets_at + _U64.size * index)
+        return self._data[self._records_at + start:self._records_at + end]
+
+    def question(self, index: int) -> Question:
+        return Question.from_record(self.question_id(index), json.loads(self.record(index)))
+
+    def questions(self, subject: str, difficulty: str) -> Tuple[Question, ...]:
+        run = self.runs[subject][difficulty]
+        return tuple(self.question(index) for index in range(run["start"], run["start"] + run["count"]))
+
+    def question_id(self, index: int) -> str:
+        """Stable id (attempt_items.question_key) of record ``index``"""
+        return f"{self.id_number(index):016x}"
+
+    def id_number(self, index: int) -> int:
+        """Question id of record ``index`` as an integer"""
+        return _U64.unpack_from(self._data, self._ids_at + _U64.size * index)[0]
+
+    def id_numbers(self, start: int, count: int) -> Tuple[int, ...]:
+        """Question ids of records start .. start + count - 1, read in one go"""
+        return struct.unpack_from(f"<{count}Q", self._data, self._ids_at + _U64.size * start)
+
+    def index_of(self, question_id: str) -> Optional[int]:
+        """Record holding ``question_id``, by binary search over the sorted ids"""
+        target = int(question_id, 16)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if _U64.unpack_from(self._data, self._sorted_ids_at + _U64.size * middle)[0] < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and _U64.unpack_from(self._data, self._sorted_ids_at + _U64.size * low)[0] == target:
+            return _U32.unpack_from(self._data, self._sorted_records_at + _U32.size * low)[0]
+        return None
+
+    def close(self):
+        self._data.close()
+
+
+class _Difficulties(Mapping):
+    """difficulty -> questions of one subject, decoded on first access"""
+
+    def __init__(self, bank: "QuestionBank", subject: str):
+        self._bank = bank
+        self._subject = subject
+
+    def __getitem__(self, difficulty):
+        return self._bank.questions(self._subject, difficulty)
+
+    def __contains__(self, difficulty):
+        return difficulty in self._bank.store.runs[self._subject]
+
+    def __iter__(self):
+        return iter(self._bank.store.runs[self._subject])
+
+    def __len__(self):
+        return len(self._bank.store.runs[self._subject])
+
+
+class QuestionBank(Mapping):
+    """subject -> difficulty -> tuple of Questions, loaded lazily from a store"""
+
+    def __init__(self, store: QuestionStore, name: Optional[str] = None):
+        self.store = store
+        self.name = name
+        self._loaded: Dict[Tuple[str, str], tuple] = {}
+        self._lock = threading.Lock()
+        self._subjects = {subject: _Difficulties(self, subject) for subject in store.runs}
+        # Decoded questions by record index. A plain list: a lookup is one
+        # index operation, and racing threads at worst decode a record twice
+        self._decoded: List[Optional[Question]] = [None] * store.count
+        self._decoded_count = 0
+        # Runs are contiguous and in file order, so a record's run is the
+        # last one starting at or before it (empty runs sort first)
+        starts = sorted((run["start"], run["count"] > 0, subject, difficulty)
+                        for subject, by_difficulty in store.runs.items()
+                        for difficulty, run in by_difficulty.items())
+        self._run_starts = [start for start, _, _, _ in starts]
+        self._locations = [(subject, difficulty) for _, _, subject, difficulty in starts]
+        # (subject, difficulty) -> lowercased topic -> its (start, count) runs
+        self._topic_runs: Dict[Tuple[str, str], Dict[str, List[Tuple[int, int]]]] = {}
+        for subject, by_difficulty in store.runs.items():
+            for difficulty, run in by_difficulty.items():
+                topic_runs = self._topic_runs[subject, difficulty] = {}
+                for topic, (start, count) in run["topics"].items():
+                    topic_runs.setdefault(topic.lower(), []).append((start, count))
+
+    def question(self, index: int) -> Question:
+        """Record ``index``, decoded on first use and shared afterwards"""
+        question = self._decoded[index]
+        if question is None:
+            question = self.store.question(index)
+            if self._decoded_count < DECODED_CACHE_SIZE:
+                self._decoded[index] = question
+                self._decoded_count += 1
+        return question
+
+    def questions(self, subject: str, difficulty: str) -> tuple:
+        key = (subject, difficulty)
+        questions = self._loaded.get(key)
+        if questions is None:
+            with self._lock:
+                questions = self._loaded.get(key)
+                if questions is None:
+                    run = self.store.runs[subject][difficulty]
+                    questions = tuple(self.question(index) for index in range(run["start"], run["start"] + run["count"]))
+                    self._loaded[key] = questions
+        return questions
+
+    def loaded(self) -> Iterator[Tuple[str, str]]:
+        """(subject, difficulty) pairs decoded so far"""
+        return iter(list(self._loaded))
+
+    def runs(self, subjects: Optional[Iterable[str]] = None, difficulties: Optional[Iterable[str]] = None,
+             topics: Optional[Iterable[str]] = None) -> List[Tuple[int, int]]:
+        """(start, count) record runs matching every given filter; None matches all
+
+        Topics compare case-insensitively. Unknown subjects, difficulties and
+        topics simply match nothing.
+        """
+        wanted_topics = {topic.lower() for topic in topics} if topics is not None else None
+        runs = []
+        for subject in (self.store.runs if subjects is None else subjects):
+            by_difficulty = self.store.runs.get(subject, {})
+            for difficulty in (by_difficulty if difficulties is None else difficulties):
+                run = by_difficulty.get(difficulty)
+                if run is None or not run["count"]:
+                    continue
+                if wanted_topics is None:
+                    runs.append((run["start"], run["count"]))
+                else:
+                    topic_runs = self._topic_runs[subject, difficulty]
+                    runs.extend(span for topic in wanted_topics for span in topic_runs.get(topic, ()))
+        return runs
+
+    def select(self, k: int, subjects: Optional[Iterable[str]] = None,
+               difficulties: Optional[Iterable[str]] = None, topics: Optional[Iterable[str]] = None,
+               exclude_ids: Collection[str] = (), rng: Optional[random.Random] = None) -> List[int]:
+        """Up to ``k`` distinct random records matching the filters, minus ``exclude_ids``
+
+        Draws positions over the matching runs without building a candidate
+        list, so the cost is O(k + runs) rather than O(matching questions).
+        Returns record indexes; see question() and question_id().
+        """
+        rng = rng or random
+        runs = self.runs(subjects, difficulties, topics)
+        ends = []
+        total = 0
+        for _, count in runs:
+            total += count
+            ends.append(total)
+        excluded = {int(question_id, 16) for question_id in exclude_ids}
+        if k <= 0 or not total:
+            return []
+
+        if len(excluded) + k > total // 2:
+            # Most of the pool is wanted or excluded: enumerate it instead
+            candidates = [
+                start + offset for start, count in runs
+                for offset, number in enumerate(self.store.id_numbers(start, count))
+                if number not in excluded
+            ]
+            return rng.sample(candidates, min(k, len(candidates)))
+
+        # random() scaled to the pool rather than randrange(): several times
+        # cheaper, and its bias is negligible for any realistic bank size
+        random_position = rng.random
+        single_run = runs[0][0] if len(runs) == 1 else None
+        id_number = self.store.id_number
+        picked = []
+        seen = set()
+        while len(picked) < k and len(seen) < total:
+            position = int(random_position() * total)
+            if position in seen:
+                continue
+            seen.add(position)
+            if single_run is not None:
+                index = single_run + position
+            else:
+                run = bisect.bisect_right(ends, position)
+                index = runs[run][0] + position - (ends[run] - runs[run][1])
+            if not excluded or id_number(index) not in excluded:
+                picked.append(index)
+        return picked
+
+    def question_id(self, index: int) -> str:
+        return self.store.question_id(index)
+
+    def index_of(self, question_id: str) -> Optional[int]:
+        return self.store.index_of(question_id)
+
+    def location(self, index: int) -> Tuple[str, str]:
+        """(subject, difficulty) of the run holding record ``index``"""
+        if not 0 <= index < self.store.count:
+            raise IndexError(index)
+        return self._locations[bisect.bisect_right(self._run_starts, index) - 1]
+
+    def __getitem__(self, subject):
+        return self._subjects[subject]
+
+    def __iter__(self):
+        return iter(self._subjects)
+
+    def __len__(self):
+        return len(self._subjects)
+
+
+def open_store(name: str, directory: str = QUESTION_BANK_DIR) -> QuestionStore:
+    """Open a bank's store, compiling it first if it is missing, stale or in an older format"""
+    path = store_path(name, directory)
+    source = source_path(name, directory)
+    if not os.path.exists(path) or (os.path.exists(source) and os.path.getmtime(source) > os.path.getmtime(path)):
+        write_store(load_source(name, directory), path)
+    try:
+        return QuestionStore(path)
+    except ValueError:
+        write_store(load_source(name, directory), path)
+        return QuestionStore(path)
+
+_banks: Dict[str, QuestionBank] = {}
+_banks_lock = threading.Lock()
+
+def get(name: str, directory: Optional[str] = None) -> QuestionBank:
+    """The question bank ``name``, opened on first use and shared afterwards"""
+    key = name if directory is None else os.path.join(directory, name)
+    bank = _banks.get(key)
+    if bank is None:
+        with _banks_lock:
+            bank = _banks.get(key)
+            if bank is None:
+                bank = QuestionBank(open_store(name, directory or QUESTION_BANK_DIR), name)
+                _banks[key] = bank
+    return bank
+
+
+# =============================================================================
+# QUIZ HANDLES
+# =============================================================================
+#
+# What a session keeps of a quiz between reruns: the bank name, the question
+# ids packed as u64s, the seed its option permutations are drawn from, and
+# the per-quiz attributes every question shares. questions() resolves it
+# against the shared bank when the quiz is rendered or graded, so a session
+# holds about a hundred bytes per quiz plus eight per question instead of
+# the questions' text, options and explanations.
+
+class QuizHandle:
+    """Compact, resolvable reference to a generated quiz"""
+
+    __slots__ = ("bank", "ids", "seed", "attributes")
+
+    def __init__(self, bank: str, question_ids: Iterable[str], seed: Optional[int] = None,
+                 attributes: Optional[Dict] = None):
+        self.bank = bank
+        self.ids = b"".join(_U64.pack(int(question_id, 16)) for question_id in question_ids)
+        self.seed = seed  # None keeps the bank's option order
+        self.attributes = attributes or None
+
+    @classmethod
+    def of(cls, bank: QuestionBank, questions: Iterable[QuizQuestion], shuffle: bool = SHUFFLE_OPTIONS) -> "QuizHandle":
+        """Handle for a generated quiz
+
+        Overlay attributes that differ between questions (the diagnostic
+        quiz's subject and difficulty) are not kept; questions() derives
+        those from where each question sits in the bank.
+        """
+        questions = list(questions)
+        attributes = dict(questions[0].overlay) if questions else {}
+        for question in questions[1:]:
+            attributes = {key: value for key, value in attributes.items()
+                          if key in question.overlay and question.overlay[key] == value}
+        return cls(bank.name, [question['id'] for question in questions],
+                   random.getrandbits(32) if shuffle else None, attributes)
+
+    def __len__(self):
+        return len(self.ids) // _U64.size
+
+    def question_ids(self) -> List[str]:
+        return [f"{number:016x}" for (number,) in _U64.iter_unpack(self.ids)]
+
+    def permutation(self, position: int, size: int) -> List[int]:
+        """Option order of the question at ``position``: shown option j is original option order[j]"""
+        order = list(range(size))
+        if self.seed is not None:
+            random.Random(self.seed << 16 | position).shuffle(order)
+        return order
+
+    def questions(self, bank: Optional[QuestionBank] = None) -> List[QuizQuestion]:
+        """The quiz's questions, with options in this quiz's order
+
+        Questions no longer in the bank (it was edited mid-quiz) are
+        skipped, the same way on every call.
+        """
+        bank = bank or get(self.bank)
+        questions = []
+        for position, question_id in enumerate(self.question_ids()):
+            index = bank.index_of(question_id)
+            if index is None:
+                continue
+            question = bank.question(index)
+            subject, difficulty = bank.location(index)
+            quiz_question = QuizQuestion(question, subject=subject, difficulty=difficulty)
+            quiz_question.update(self.attributes or {})
+            if self.seed is not None:
+                order = self.permutation(position, len(question.options))
+                quiz_question['options'] = tuple(question.options[original] for original in order)
+                quiz_question['correct'] = order.index(question.correct)
+            questions.append(quiz_question)
+        return questions
+
+    def __repr__(self):
+        return f"QuizHandle({self.bank!r}, {len(self)} questions, seed={self.seed!r})"
@@ -0,0 +1,431 @@
+import sqlite3
+from typing import Dict, List
+
+# =============================================================================
+# PER-STUDENT ROLLUP
+# =============================================================================
+#
+# student_stats holds one row per user with running totals over quiz_attempts.
+# Triggers keep it current for every write path (the group-commit writer,
+# bulk imports, manual SQL), so the educator student list reads one row per
+# student instead of aggregating the whole attempts table.
+
+STUDENT_STATS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS student_stats (
+        user_id INTEGER PRIMARY KEY,
+        total_quizzes INTEGER NOT NULL DEFAULT 0,
+        percentage_sum REAL NOT NULL DEFAULT 0,
+        percentage_count INTEGER NOT NULL DEFAULT 0,
+        last_activity TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+'''
+
+STUDENT_STATS_TRIGGERS = {
+    "trg_student_stats_insert": '''
+        CREATE TRIGGER IF NOT EXISTS trg_student_stats_insert
+        AFTER INSERT ON quiz_attempts
+        BEGIN
+            INSERT INTO student_stats (user_id, total_quizzes, percentage_sum, percentage_count, last_activity)
+            VALUES (NEW.user_id, 1, NEW.percentage, 1, NEW.attempt_date)
+            ON CONFLICT (user_id) DO UPDATE SET
+                total_quizzes = total_quizzes + 1,
+                percentage_sum = percentage_sum + excluded.percentage_sum,
+                percentage_count = percentage_count + 1,
+                last_activity = CASE
+                    WHEN last_activity IS NULL OR excluded.last_activity > last_activity
+                    THEN excluded.last_activity ELSE last_activity END;
+        END
+    ''',
+    "trg_student_stats_delete": '''
+        CREATE TRIGGER IF NOT EXISTS trg_student_stats_delete
+        AFTER DELETE ON quiz_attempts
+        BEGIN
+            UPDATE student_stats SET
+                total_quizzes = total_quizzes - 1,
+                percentage_sum = percentage_sum - OLD.percentage,
+                percentage_count = percentage_count - 1,
+                last_activity = (SELECT MAX(attempt_date) FROM quiz_attempts WHERE user_id = OLD.user_id)
+            WHERE user_id = OLD.user_id;
+        END
+    ''',
+    "trg_student_stats_update": '''
+        CREATE TRIGGER IF NOT EXISTS trg_student_stats_update
+        AFTER UPDATE OF user_id, percentage, attempt_date ON quiz_attempts
+        BEGIN
+            UPDATE student_stats SET
+                total_quizzes = total_quizzes - 1,
+                percentage_sum = percentage_sum - OLD.percentage,
+                percentage_count = percentage_count - 1,
+                last_activity = (SELECT MAX(attempt_date) FROM quiz_attempts WHERE user_id = OLD.user_id)
+            WHERE user_id = OLD.user_id;
+            INSERT INTO student_stats (user_id, total_quizzes, percentage_sum, percentage_count, last_activity)
+            VALUES (NEW.user_id, 1, NEW.percentage, 1, NEW.attempt_date)
+            ON CONFLICT (user_id) DO UPDATE SET
+                total_quizzes = total_quizzes + 1,
+                percentage_sum = percentage_sum + excluded.percentage_sum,
+                percentage_count = percentage_count + 1,
+                last_activity = (SELECT MAX(attempt_date) FROM quiz_attempts WHERE user_id = NEW.user_id);
+        END
+    ''',
+}
+
+# Full recompute from quiz_attempts; the source of truth for rebuilds and checks
+STUDENT_STATS_RECOMPUTE_SQL = '''
+    SELECT user_id,
+           COUNT(*) as total_quizzes,
+           SUM(percentage) as percentage_sum,
+           COUNT(percentage) as percentage_count,
+           MAX(attempt_date) as last_activity
+    FROM quiz_attempts
+    GROUP BY user_id
+'''
+
+# Same, plus the contribution of attempts moved to archive files (archive.py)
+STUDENT_STATS_WITH_ARCHIVED_RECOMPUTE_SQL = f'''
+    SELECT user_id,
+           SUM(total_quizzes) as total_quizzes,
+           SUM(percentage_sum) as percentage_sum,
+           SUM(percentage_count) as percentage_count,
+           MAX(last_activity) as last_activity
+    FROM ({STUDENT_STATS_RECOMPUTE_SQL}
+          UNION ALL
+          SELECT user_id, total_quizzes, percentage_sum, percentage_count, last_activity
+          FROM archived_student_stats)
+    GROUP BY user_id
+'''
+
+def _has_archived_rollups(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'archived_student_stats'"
+    ).fetchone() is not None
+
+def _student_recompute_sql(conn):
+    if _has_archived_rollups(conn):
+        return STUDENT_STATS_WITH_ARCHIVED_RECOMPUTE_SQL
+    return STUDENT_STATS_RECOMPUTE_SQL
+
+def create_student_stats(conn):
+    """Create the rollup table and triggers, backfilling if the table is new"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'student_stats'")
+    is_new = cursor.fetchone() is None
+
+    cursor.execute(STUDENT_STATS_TABLE_SQL)
+    for sql in STUDENT_STATS_TRIGGERS.values():
+        cursor.execute(sql)
+
+    if is_new:
+        rebuild_student_stats(conn)
+
+def rebuild_student_stats(conn):
+    """Recompute student_stats from scratch; returns the number of rows written"""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM student_stats")
+    cursor.execute(f'''
+        INSERT INTO student_stats (user_id, total_quizzes, percentage_sum, percentage_count, last_activity)
+        {_student_recompute_sql(conn)}
+    ''')
+    return cursor.rowcount
+
+def check_student_stats(conn, tolerance: float = 1e-6) -> List[Dict]:
+    """Compare student_stats with a full recompute.
+
+    Returns one dict per user whose rollup row disagrees with the recompute
+    (including rows missing on either side); an empty list means consistent.
+    """
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    expected = {row['user_id']: dict(row) for row in cursor.execute(_student_recompute_sql(conn))}
+    actual = {
+        row['user_id']: dict(row)
+        for row in cursor.execute("SELECT * FROM student_stats WHERE total_quizzes > 0")
+    }
+
+    mismatches = []
+    for user_id in sorted(set(expected) | set(actual)):
+        want, got = expected.get(user_id), actual.get(user_id)
+        if want is None or got is None:
+            mismatches.append({"user_id": user_id, "expected": want, "actual": got})
+            continue
+        if (want['total_quizzes'] != got['total_quizzes']
+                or want['percentage_count'] != got['percentage_count']
+                or abs(want['percentage_sum'] - got['percentage_sum']) > tolerance
+                or want['last_activity'] != got['last_activity']):
+            mismatches.append({"user_id": user_id, "expected": want, "actual": got})
+    return mismatches
+
+# =============================================================================
+# COURSE/TOPIC ROLLUP
+# =============================================================================
+#
+# course_topic_stats keeps count, sum, sum of squares, min and max of
+# percentage per (course_name, topic), so the analytics pages read a handful
+# of rows and get the variance without touching quiz_attempts. MIN/MAX cannot
+# be undone on delete, so the delete/update triggers re-seek them through
+# idx_quiz_attempts_course_topic.
+
+COURSE_TOPIC_STATS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS course_topic_stats (
+        course_name TEXT NOT NULL,
+        topic TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        percentage_sum REAL NOT NULL DEFAULT 0,
+        percentage_sq_sum REAL NOT NULL DEFAULT 0,
+        min_percentage REAL,
+        max_percentage REAL,
+        PRIMARY KEY (course_name, topic)
+    ) WITHOUT ROWID
+'''
+
+_COURSE_TOPIC_REMOVE_OLD = '''
+            UPDATE course_topic_stats SET
+                attempts = attempts - 1,
+                percentage_sum = percentage_sum - OLD.percentage,
+                percentage_sq_sum = percentage_sq_sum - OLD.percentage * OLD.percentage,
+                min_percentage = (SELECT MIN(percentage) FROM quiz_attempts
+                                  WHERE course_name = OLD.course_name AND topic = OLD.topic),
+                max_percentage = (SELECT MAX(percentage) FROM quiz_attempts
+                                  WHERE course_name = OLD.course_name AND topic = OLD.topic)
+            WHERE course_name = OLD.course_name AND topic = OLD.topic;
+            DELETE FROM course_topic_stats
+            WHERE course_name = OLD.course_name AND topic = OLD.topic AND attempts <= 0;
+'''
+
+_COURSE_TOPIC_ADD_NEW = '''
+            INSERT INTO course_topic_stats (course_name, topic, attempts, percentage_sum,
+                                            percentage_sq_sum, min_percentage, max_percentage)
+            VALUES (NEW.course_name, NEW.topic, 1, NEW.percentage,
+                    NEW.percentage * NEW.percentage, NEW.percentage, NEW.percentage)
+            ON CONFLICT (course_name, topic) DO UPDATE SET
+                attempts = attempts + 1,
+                percentage_sum = percentage_sum + excluded.percentage_sum,
+                percentage_sq_sum = percentage_sq_sum + excluded.percentage_sq_sum,
+                min_percentage = MIN(min_percentage, excluded.min_percentage),
+                max_percentage = MAX(max_percentage, excluded.max_percentage);
+'''
+
+COURSE_TOPIC_STATS_TRIGGERS = {
+    "trg_course_topic_stats_insert": f'''
+        CREATE TRIGGER IF NOT EXISTS trg_course_topic_stats_insert
+        AFTER INSERT ON quiz_attempts
+        BEGIN
+            {_COURSE_TOPIC_ADD_NEW}
+        END
+    ''',
+    "trg_course_topic_stats_delete": f'''
+        CREATE TRIGGER IF NOT EXISTS trg_course_topic_stats_delete
+        AFTER DELETE ON quiz_attempts
+        BEGIN
+            {_COURSE_TOPIC_REMOVE_OLD}
+        END
+    ''',
+    "trg_course_topic_stats_update": f'''
+        CREATE TRIGGER IF NOT EXISTS trg_course_topic_stats_update
+        AFTER UPDATE OF course_name, topic, percentage ON quiz_attempts
+        BEGIN
+            {_COURSE_TOPIC_REMOVE_OLD}
+            {_COURSE_TOPIC_ADD_NEW}
+        END
+    ''',
+}
+
+# Walks idx_quiz_attempts_course_topic in key order, so the GROUP BY is a
+# single streaming pass with one group in memory at a time.
+COURSE_TOPIC_STATS_RECOMPUTE_SQL = '''
+    SELECT course_name, topic,
+           COUNT(*) as attempts,
+           SUM(percentage) as percentage_sum,
+           SUM(percentage * percentage) as percentage_sq_sum,
+           MIN(percentage) as min_percentage,
+           MAX(percentage) as max_percentage
+    FROM quiz_attempts
+    GROUP BY course_name, topic
+'''
+
+# Same, plus the contribution of attempts moved to archive files (archive.py)
+COURSE_TOPIC_STATS_WITH_ARCHIVED_RECOMPUTE_SQL = f'''
+    SELECT course_name, topic,
+           SUM(attempts) as attempts,
+           SUM(percentage_sum) as percentage_sum,
+           SUM(percentage_sq_sum) as percentage_sq_sum,
+           MIN(min_percentage) as min_percentage,
+           MAX(max_percentage) as max_percentage
+    FROM ({COURSE_TOPIC_STATS_RECOMPUTE_SQL}
+          UNION ALL
+          SELECT course_name, topic, attempts, percentage_sum, percentage_sq_sum,
+                 min_percentage, max_percentage
+          FROM archived_course_topic_stats)
+    GROUP BY course_name, topic
+'''
+
+def _course_topic_recompute_sql(conn):
+    if _has_archived_rollups(conn):
+        return COURSE_TOPIC_STATS_WITH_ARCHIVED_RECOMPUTE_SQL
+    return COURSE_TOPIC_STATS_RECOMPUTE_SQL
+
+def create_course_topic_stats(conn):
+    """Create the rollup table and triggers, backfilling if the table is new"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'course_topic_stats'")
+    is_new = cursor.fetchone() is None
+
+    cursor.execute(COURSE_TOPIC_STATS_TABLE_SQL)
+    for sql in COURSE_TOPIC_STATS_TRIGGERS.values():
+        cursor.execute(sql)
+
+    if is_new:
+        rebuild_course_topic_stats(conn)
+
+def rebuild_course_topic_stats(conn):
+    """Backfill course_topic_stats in one pass; returns the number of rows written"""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM course_topic_stats")
+    cursor.execute(f'''
+        INSERT INTO course_topic_stats (course_name, topic, attempts, percentage_sum,
+                                        percentage_sq_sum, min_percentage, max_percentage)
+        {_course_topic_recompute_sql(conn)}
+    ''')
+    return cursor.rowcount
+
+def check_course_topic_stats(conn, tolerance: float = 1e-6) -> List[Dict]:
+    """Compare course_topic_stats with a full recompute; empty list means consistent"""
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    key = lambda row: (row['course_name'], row['topic'])
+    expected = {key(row): dict(row) for row in cursor.execute(_course_topic_recompute_sql(conn))}
+    actual = {key(row): dict(row) for row in cursor.execute("SELECT * FROM course_topic_stats")}
+
+    mismatches = []
+    for course_topic in sorted(set(expected) | set(actual)):
+        want, got = expected.get(course_topic), actual.get(course_topic)
+        if want is None or got is None or want['attempts'] != got['attempts'] or any(
+            abs(want[col] - got[col]) > tolerance * max(1.0, abs(want[col]))
+            for col in ('percentage_sum', 'percentage_sq_sum', 'min_percentage', 'max_percentage')
+        ):
+            mismatches.append({"course_topic": course_topic, "expected": want, "actual": got})
+    return mismatches
+
+# =============================================================================
+# ARCHIVED CONTRIBUTIONS
+# =============================================================================
+#
+# Moving attempts into archive files deletes them from quiz_attempts, which
+# fires the delete triggers above. The rollups are all-time figures, so the
+# archiver records each chunk's aggregates per term and adds them straight
+# back after the delete; rebuilds and checks fold these tables in.
+
+ARCHIVED_ROLLUP_TABLES_SQL = [
+    '''
+    CREATE TABLE IF NOT EXISTS archived_student_stats (
+        term TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        total_quizzes INTEGER NOT NULL,
+        percentage_sum REAL NOT NULL,
+        percentage_count INTEGER NOT NULL,
+        last_activity TIMESTAMP,
+        PRIMARY KEY (term, user_id)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS archived_course_topic_stats (
+        term TEXT NOT NULL,
+        course_name TEXT NOT NULL,
+        topic TEXT NOT NULL,
+        attempts INTEGER NOT NULL,
+        percentage_sum REAL NOT NULL,
+        percentage_sq_sum REAL NOT NULL,
+        min_percentage REAL,
+        max_percentage REAL,
+        PRIMARY KEY (term, course_name, topic)
+    ) WITHOUT ROWID
+    ''',
+]
+
+_STUDENT_ADD_BACK_SQL = '''
+    INSERT INTO {table} ({key_columns}, total_quizzes, percentage_sum, percentage_count, last_activity)
+    VALUES ({key_params}, ?, ?, ?, ?)
+    ON CONFLICT ({key_columns}) DO UPDATE SET
+        total_quizzes = total_quizzes + excluded.total_quizzes,
+        percentage_sum = percentage_sum + excluded.percentage_sum,
+        percentage_count = percentage_count + excluded.percentage_count,
+        last_activity = CASE
+            WHEN last_activity IS NULL OR excluded.last_activity > last_activity
+            THEN excluded.last_activity ELSE last_activity END
+'''
+
+_COURSE_TOPIC_ADD_BACK_SQL = '''
+    INSERT INTO {table} ({key_columns}, attempts, percentage_sum, percentage_sq_sum,
+                         min_percentage, max_percentage)
+    VALUES ({key_params}, ?, ?, ?, ?, ?)
+    ON CONFLICT ({key_columns}) DO UPDATE SET
+        attempts = attempts + excluded.attempts,
+        percentage_sum = percentage_sum + excluded.percentage_sum,
+        percentage_sq_sum = percentage_sq_sum + excluded.percentage_sq_sum,
+        min_percentage = MIN(COALESCE(min_percentage, excluded.min_percentage), excluded.min_percentage),
+        max_percentage = MAX(COALESCE(max_percentage, excluded.max_percentage), excluded.max_percentage)
+'''
+
+def create_archived_rollups(conn):
+    for sql in ARCHIVED_ROLLUP_TABLES_SQL:
+        conn.execute(sql)
+
+def delete_preserving_rollups(conn, term: str, id_source_sql: str):
+    """Delete attempts selected by id_source_sql without changing the rollups
+
+    Records the attempts' aggregates under ``term`` in the archived_* tables,
+    deletes them (the triggers subtract them from the live rollups), then adds
+    the same aggregates back. Must run inside the caller's transaction.
+    Returns the number of attempts deleted.
+    """
+    per_student = conn.execute(f'''
+        SELECT user_id, COUNT(*), SUM(percentage), COUNT(percentage), MAX(attempt_date)
+        FROM quiz_attempts WHERE id IN ({id_source_sql})
+        GROUP BY user_id
+    ''').fetchall()
+    per_course_topic = conn.execute(f'''
+        SELECT course_name, topic, COUNT(*), SUM(percentage), SUM(percentage * percentage),
+               MIN(percentage), MAX(percentage)
+        FROM quiz_attempts WHERE id IN ({id_source_sql})
+        GROUP BY course_name, topic
+    ''').fetchall()
+
+    conn.executemany(
+        _STUDENT_ADD_BACK_SQL.format(table="archived_student_stats",
+                                     key_columns="term, user_id", key_params="?, ?"),
+        [(term, *tuple(row)) for row in per_student]
+    )
+    conn.executemany(
+        _COURSE_TOPIC_ADD_BACK_SQL.format(table="archived_course_topic_stats",
+                                          key_columns="term, course_name, topic", key_params="?, ?, ?"),
+        [(term, *tuple(row)) for row in per_course_topic]
+    )
+
+    # The delete triggers recompute last_activity and min/max from the rows
+    # left in quiz_attempts, which forgets earlier archived chunks; the
+    # values before the delete already cover everything, so restore those.
+    last_activity = dict(conn.execute(f'''
+        SELECT user_id, last_activity FROM student_stats
+        WHERE user_id IN (SELECT user_id FROM quiz_attempts WHERE id IN ({id_source_sql}))
+    ''').fetchall())
+    extremes = {
+        (course_name, topic): (low, high)
+        for course_name, topic, low, high in conn.execute(f'''
+            SELECT course_name, topic, min_percentage, max_percentage FROM course_topic_stats
+            WHERE (course_name, topic) IN (
+                SELECT course_name, topic FROM quiz_attempts WHERE id IN ({id_source_sql}))
+        ''')
+    }
+
+    deleted = conn.execute(f"DELETE FROM quiz_attempts WHERE id IN ({id_source_sql})").rowcount
+
+    conn.executemany(
+        _STUDENT_ADD_BACK_SQL.format(table="student_stats", key_columns="user_id", key_params="?"),
+        [(*tuple(row)[:4], last_activity.get(row[0]) or row[4]) for row in per_student]
+    )
+    conn.executemany(
+        _COURSE_TOPIC_ADD_BACK_SQL.format(table="course_topic_stats",
+                                          key_columns="course_name, topic", key_params="?, ?"),
+        [(*tuple(row)[:5], *extremes.get((row[0], row[1]), (row[5], row[6]))) for row in per_course_topic]
+    )
+    return deleted
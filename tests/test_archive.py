@@ -0,0 +1,43 @@
+import sqlite3
+
+import archive
+import migrations
+import rollups
+
+
+def test_archive_run_spanning_more_terms_than_can_be_attached(tmp_path):
+    path = str(tmp_path / "hot.db")
+    migrations.migrate(path)
+    conn = sqlite3.connect(path)
+    # 20 semi-annual terms, 2005-T1 .. 2014-T2, three attempts each
+    attempts = [
+        (1, "mathematics", "Algebra", "[]", 3, 5, 60.0, f"{year}-{month:02d}-15 10:00:0{n}")
+        for year in range(2005, 2015) for month in (3, 9) for n in range(3)
+    ]
+    conn.executemany('''
+        INSERT INTO quiz_attempts (user_id, course_name, topic, answers, score, total_questions, percentage,
+                                   attempt_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', attempts)
+    conn.commit()
+
+    moved = list(archive.archive_attempts(conn, path, "2020-01-01 00:00:00", chunk_size=7,
+                                          archive_dir=str(tmp_path / "archive")))
+
+    assert sum(count for _, count in moved) == len(attempts)
+    assert len({term for term, _ in moved}) == 20
+    assert conn.execute("SELECT COUNT(*) FROM quiz_attempts").fetchone()[0] == 0
+    assert [row[1] for row in conn.execute("PRAGMA database_list")] == ["main", "temp"]
+    terms = archive.terms_overlapping(conn)
+    assert len(terms) == 20
+    assert all(term["last_attempt"] for term in terms)
+    assert rollups.check_student_stats(conn) == []
+    assert rollups.check_course_topic_stats(conn) == []
+
+    archived = 0
+    for group in archive.term_groups(terms):
+        with archive.attached(conn, group) as schemas:
+            archived += sum(conn.execute(f"SELECT COUNT(*) FROM {schema}.quiz_attempts").fetchone()[0]
+                            for schema in schemas)
+    assert archived == len(attempts)
+    conn.close()
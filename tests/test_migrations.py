@@ -0,0 +1,90 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import migrations
+import rollups
+
+LEGACY_DATABASE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "edututor.db")
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+@pytest.fixture
+def legacy_path(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    shutil.copyfile(LEGACY_DATABASE, path)
+    return path
+
+
+def test_legacy_database_migrates(legacy_path):
+    source = sqlite3.connect(legacy_path)
+    legacy = source.execute("SELECT id, user_id, score, completed_at FROM quiz_attempts ORDER BY id").fetchall()
+    source.close()
+
+    applied = migrations.migrate(legacy_path)
+    assert [migration.version for migration in applied] == [migration.version for migration in migrations.MIGRATIONS]
+
+    conn = sqlite3.connect(legacy_path)
+    assert {"topic", "total_questions", "percentage", "attempt_date"} <= _columns(conn, "quiz_attempts")
+    upgraded = conn.execute("SELECT id, user_id, percentage, attempt_date FROM quiz_attempts ORDER BY id").fetchall()
+    assert upgraded == [(id_, user_id, score, completed_at) for id_, user_id, score, completed_at in legacy]
+    assert rollups.check_student_stats(conn) == []
+    assert rollups.check_course_topic_stats(conn) == []
+    conn.close()
+
+
+def test_legacy_database_stopped_at_version_2_migrates(legacy_path):
+    # The first release of step 2 added only some attempt columns
+    conn = sqlite3.connect(legacy_path)
+    conn.execute(migrations.SCHEMA_VERSION_TABLE_SQL)
+    conn.executemany("INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                     [(1, "create users and quiz_attempts"), (2, "add course and diagnostic columns")])
+    conn.execute("ALTER TABLE quiz_attempts ADD COLUMN course_name TEXT NOT NULL DEFAULT 'General'")
+    conn.commit()
+    conn.close()
+
+    applied = migrations.migrate(legacy_path)
+    assert applied[0].version == 3
+
+    conn = sqlite3.connect(legacy_path)
+    assert rollups.check_student_stats(conn) == []
+    assert rollups.check_course_topic_stats(conn) == []
+    conn.close()
+
+
+def test_fresh_database_migrates(tmp_path):
+    path = str(tmp_path / "fresh.db")
+    applied = migrations.migrate(path)
+    assert [migration.version for migration in applied] == [migration.version for migration in migrations.MIGRATIONS]
+
+    conn = sqlite3.connect(path)
+    assert migrations.current_version(conn) == migrations.MIGRATIONS[-1].version
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {"users", "quiz_attempts", "student_stats", "course_topic_stats", "attempt_items",
+            "import_checkpoints", "email_collisions"} <= tables
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert set(migrations.INDEXES) | {migrations.EMAIL_INDEX} <= indexes
+    conn.close()
+
+
+@pytest.mark.parametrize("source", ["fresh", "legacy"])
+def test_rerun_is_a_no_op(tmp_path, legacy_path, source):
+    path = legacy_path if source == "legacy" else str(tmp_path / "fresh.db")
+    migrations.migrate(path)
+    conn = sqlite3.connect(path)
+    schema = conn.execute("SELECT type, name, sql FROM sqlite_master ORDER BY name").fetchall()
+    history = conn.execute("SELECT version, description FROM schema_version ORDER BY version").fetchall()
+
+    assert migrations.apply_migrations(conn) == []
+    assert conn.execute("SELECT type, name, sql FROM sqlite_master ORDER BY name").fetchall() == schema
+    assert conn.execute("SELECT version, description FROM schema_version ORDER BY version").fetchall() == history
+    assert rollups.check_student_stats(conn) == []
+    conn.close()
+
+    # Once per process: a second migrate() on the same file does nothing
+    assert migrations.migrate(path) == []
@@ -0,0 +1,46 @@
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import db
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = db.ConnectionPool(str(tmp_path / "pool.db"), max_size=1)
+    yield pool
+    pool.close()
+
+
+def test_failed_query_returns_connection(pool):
+    with pytest.raises(sqlite3.OperationalError):
+        with pool.connect() as conn:
+            conn.execute("SELECT * FROM missing_table")
+    assert pool.stats()["in_use"] == 0
+
+    # Another thread can check it out, so the failing thread no longer holds it
+    with ThreadPoolExecutor(1) as executor:
+        assert executor.submit(lambda: pool.connect(timeout=0.5).close()).result() is None
+
+
+def test_nested_checkouts_share_one_connection(pool):
+    with pool.connect() as outer:
+        outer.execute("CREATE TABLE t (x)")
+        with pytest.raises(sqlite3.IntegrityError):
+            with pool.connect() as inner:
+                assert inner._conn is outer._conn
+                raise sqlite3.IntegrityError("inner failure")
+        # The outer checkout still holds the connection
+        outer.execute("INSERT INTO t VALUES (1)")
+        assert pool.stats()["in_use"] == 1
+    assert pool.stats()["in_use"] == 0
+
+
+def test_open_transaction_is_rolled_back_on_release(pool):
+    with pool.connect() as conn:
+        conn.execute("CREATE TABLE t (x)")
+        conn.commit()
+        conn.execute("INSERT INTO t VALUES (1)")
+    with pool.connect() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
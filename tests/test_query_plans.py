@@ -0,0 +1,27 @@
+import sqlite3
+
+import pytest
+
+import manage
+import migrations
+import models
+
+
+@pytest.fixture
+def conn(tmp_path):
+    path = str(tmp_path / "plans.db")
+    migrations.migrate(path)
+    conn = sqlite3.connect(path)
+    yield conn
+    conn.close()
+
+
+def test_data_layer_queries_use_indexes(conn):
+    offenders = manage.find_full_scans(conn, models.DATA_LAYER_QUERIES, models.FULL_SCAN_ALLOWED)
+    assert offenders == {}
+
+
+def test_dropped_index_is_reported(conn):
+    conn.execute(f"DROP INDEX {migrations.EMAIL_INDEX}")
+    offenders = manage.find_full_scans(conn, models.DATA_LAYER_QUERIES, models.FULL_SCAN_ALLOWED)
+    assert offenders == {"get_user_by_email": ["SCAN users"]}
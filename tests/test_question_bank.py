@@ -0,0 +1,99 @@
+import json
+import os
+import random
+
+import pytest
+
+import question_bank
+from attempt_items import question_key
+
+
+def _question(text, topic):
+    return {"question": text, "options": ["a", "b", "c", "d"], "correct": 1,
+            "explanation": f"Because of {text}", "topic": topic}
+
+
+BANKS = {
+    "mathematics": {
+        "easy": [_question(f"Add {n}", "Arithmetic") for n in range(6)]
+                + [_question(f"Share {n}", "Percentages") for n in range(4)],
+        "hard": [_question(f"Integrate {n}", "Calculus") for n in range(5)],
+    },
+    "physics": {
+        "easy": [_question(f"Push {n}", "Force") for n in range(3)],
+        "hard": [],
+    },
+}
+
+
+def _write_source(directory, banks):
+    with open(question_bank.source_path("test", directory), "w", encoding="utf-8") as handle:
+        json.dump(banks, handle)
+
+
+@pytest.fixture
+def bank(tmp_path):
+    directory = str(tmp_path)
+    _write_source(directory, BANKS)
+    store = question_bank.open_store("test", directory)
+    yield question_bank.QuestionBank(store, "test")
+    store.close()
+
+
+def test_store_round_trip(bank):
+    assert bank.store.count == 18
+    for subject, difficulties in BANKS.items():
+        for difficulty, questions in difficulties.items():
+            loaded = bank[subject][difficulty]
+            # Records are grouped by topic, keeping their order within one
+            assert sorted(question["question"] for question in loaded) == sorted(q["question"] for q in questions)
+            for question in loaded:
+                index = bank.index_of(question_key(question["question"]))
+                assert bank.question(index) is question
+                assert bank.question_id(index) == question["id"]
+                assert bank.location(index) == (subject, difficulty)
+    assert bank.index_of("0" * 16) is None
+    with pytest.raises(IndexError):
+        bank.location(bank.store.count)
+
+
+def test_select_honours_filters_and_exclusions(bank):
+    rng = random.Random(7)
+    percentages = [question["id"] for question in bank["mathematics"]["easy"] if question["topic"] == "Percentages"]
+
+    picked = bank.select(10, subjects=["mathematics"], topics=["percentages"], rng=rng)
+    assert sorted(bank.question_id(index) for index in picked) == sorted(percentages)
+
+    picked = bank.select(10, subjects=["mathematics"], difficulties=["easy"], exclude_ids=percentages[:3], rng=rng)
+    ids = {bank.question_id(index) for index in picked}
+    assert len(picked) == 7 and not ids & set(percentages[:3])
+    assert all(bank.location(index) == ("mathematics", "easy") for index in picked)
+
+    picked = bank.select(2, subjects=["mathematics", "physics"], difficulties=["hard"], rng=rng)
+    assert len(set(picked)) == 2
+    assert all(bank.location(index) == ("mathematics", "hard") for index in picked)
+
+    assert bank.select(3, subjects=["chemistry"], rng=rng) == []
+    assert bank.select(3, subjects=["physics"], difficulties=["hard"], rng=rng) == []
+
+
+def test_store_is_recompiled_when_the_source_changes(tmp_path):
+    directory = str(tmp_path)
+    _write_source(directory, BANKS)
+    store = question_bank.open_store("test", directory)
+    assert store.count == 18
+    store.close()
+
+    changed = json.loads(json.dumps(BANKS))
+    changed["physics"]["hard"].append(_question("Tunnel 0", "Quantum"))
+    _write_source(directory, changed)
+    compiled_at = os.path.getmtime(question_bank.store_path("test", directory))
+    os.utime(question_bank.source_path("test", directory), (compiled_at + 10, compiled_at + 10))
+
+    store = question_bank.open_store("test", directory)
+    bank = question_bank.QuestionBank(store, "test")
+    assert store.count == 19
+    index = bank.index_of(question_key("Tunnel 0"))
+    assert bank.location(index) == ("physics", "hard")
+    assert bank.question(index)["topic"] == "Quantum"
+    store.close()
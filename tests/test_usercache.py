@@ -0,0 +1,24 @@
+from usercache import UserCache
+
+
+def test_dropping_one_of_two_colliding_emails_keeps_the_other():
+    cache = UserCache(max_size=10, ttl=60)
+    cache.put({'id': 1, 'email': 'Bob@example.com', 'name': 'Bob'})
+    cache.put({'id': 2, 'email': 'BOB@example.com', 'name': 'Robert'})
+    assert cache.get_by_email('bob@example.com')['id'] == 2
+
+    cache.invalidate(1)
+    assert cache.get(1) is None
+    assert cache.get_by_email('bob@example.com')['id'] == 2
+
+    cache.invalidate(2)
+    assert cache.get_by_email('bob@example.com') is None
+
+
+def test_eviction_drops_the_email_mapping():
+    cache = UserCache(max_size=1, ttl=60)
+    cache.put({'id': 1, 'email': 'a@example.com'})
+    cache.put({'id': 2, 'email': 'b@example.com'})
+    assert cache.get_by_email('a@example.com') is None
+    assert cache.get_by_email('b@example.com')['id'] == 2
+    assert cache.stats()['evictions'] == 1
@@ -0,0 +1,52 @@
+import sqlite3
+import time
+
+import pytest
+
+import writer
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / "writer.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (x INTEGER UNIQUE)")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_batches_commit_and_isolate_failures(database):
+    w = writer.GroupCommitWriter(database)
+    try:
+        futures = [w.execute("INSERT INTO t (x) VALUES (?)", (value,)) for value in (1, 2, 1)]
+        assert futures[0].result(timeout=5) and futures[1].result(timeout=5)
+        with pytest.raises(sqlite3.IntegrityError):
+            futures[2].result(timeout=5)
+    finally:
+        w.close()
+    conn = sqlite3.connect(database)
+    assert [row[0] for row in conn.execute("SELECT x FROM t ORDER BY x")] == [1, 2]
+    conn.close()
+
+
+def test_failed_writer_fails_queued_operations_and_is_replaced(database, monkeypatch):
+    def cannot_open(*args, **kwargs):
+        time.sleep(0.1)
+        raise sqlite3.OperationalError("unable to open database file")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(writer, "open_connection", cannot_open)
+        failed = writer.get_writer(database)
+        futures = [failed.execute("INSERT INTO t (x) VALUES (?)", (value,)) for value in range(3)]
+        for future in futures:
+            with pytest.raises(writer.WriterFailed):
+                future.result(timeout=5)
+    assert failed.closed
+
+    replacement = writer.get_writer(database)
+    try:
+        assert replacement is not failed
+        assert replacement.execute("INSERT INTO t (x) VALUES (1)").result(timeout=5)
+    finally:
+        writer.close_writers()
@@ -0,0 +1,151 @@
+import json
+import os
+import threading
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Iterable, List, Mapping, NamedTuple, Tuple, Union
+
+# =============================================================================
+# TOPIC ROUTING
+# =============================================================================
+#
+# Maps a free-text quiz topic to a subject. The keyword taxonomy
+# ({subject: {keyword: weight}}) is compiled once into an Aho-Corasick
+# automaton, so routing a topic is one pass over its characters whatever the
+# number of keywords:
+#
+#   - keywords match as case-insensitive substrings, as the old keyword
+#     lists did ("math" matches "Mathematics"); overlapping keywords all count
+#   - a subject's score is the sum of the weights of every keyword occurrence
+#   - the best-scoring subject wins, ties going to the subject listed first;
+#     confidence is its share of the total score (0 when nothing matched and
+#     the default subject is returned)
+#   - results are memoized per normalized topic (ROUTE_CACHE_SIZE)
+#
+# The built-in taxonomy reproduces the old keyword lists. A larger one can
+# be supplied as JSON via EDUTUTOR_TOPIC_TAXONOMY, mapping each subject to
+# {keyword: weight} or to a list of keywords (weight 1).
+
+TOPIC_TAXONOMY_PATH = os.environ.get("EDUTUTOR_TOPIC_TAXONOMY")
+ROUTE_CACHE_SIZE = int(os.environ.get("EDUTUTOR_TOPIC_ROUTE_CACHE_SIZE", "4096"))
+DEFAULT_SUBJECT = "mathematics"
+
+DEFAULT_TAXONOMY = {
+    "mathematics": ["math", "algebra", "calculus", "geometry", "statistics", "equation", "derivative", "integral"],
+    "computer_science": ["programming", "algorithm", "data structure", "computer", "coding", "software", "python",
+                         "java"],
+    "physics": ["physics", "force", "energy", "momentum", "gravity", "quantum", "mechanics"],
+    "literature": ["literature", "novel", "poem", "shakespeare", "author", "writing", "story"],
+}
+
+Taxonomy = Mapping[str, Union[Mapping[str, float], Iterable[str]]]
+
+
+class Route(NamedTuple):
+    subject: str
+    confidence: float
+    scores: Tuple[Tuple[str, float], ...]  # matched subjects, best first
+
+
+class TopicRouter:
+    """Weighted multi-subject keyword matcher compiled into an Aho-Corasick automaton"""
+
+    def __init__(self, taxonomy: Taxonomy = DEFAULT_TAXONOMY, default_subject: str = DEFAULT_SUBJECT,
+                 cache_size: int = ROUTE_CACHE_SIZE):
+        self.subjects: List[str] = list(taxonomy)
+        self.default_subject = default_subject
+        self.keyword_count = 0
+        # Automaton: per state, its transitions, failure link and
+        # (subject, weight) outputs, including those reached via failure links
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        outputs: List[Dict[int, float]] = [{}]
+        for subject_number, subject in enumerate(self.subjects):
+            keywords = taxonomy[subject]
+            weights = keywords.items() if isinstance(keywords, Mapping) else ((keyword, 1.0) for keyword in keywords)
+            for keyword, weight in weights:
+                keyword = keyword.strip().lower()
+                if not keyword:
+                    continue
+                state = 0
+                for char in keyword:
+                    next_state = self._goto[state].get(char)
+                    if next_state is None:
+                        next_state = len(self._goto)
+                        self._goto[state][char] = next_state
+                        self._goto.append({})
+                        self._fail.append(0)
+                        outputs.append({})
+                    state = next_state
+                outputs[state][subject_number] = outputs[state].get(subject_number, 0.0) + float(weight)
+                self.keyword_count += 1
+
+        # Breadth-first, so a state's failure target is finished before it
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                for subject_number, weight in outputs[self._fail[next_state]].items():
+                    outputs[next_state][subject_number] = outputs[next_state].get(subject_number, 0.0) + weight
+                queue.append(next_state)
+        self._outputs: List[Tuple[Tuple[int, float], ...]] = [tuple(state.items()) for state in outputs]
+
+        self._route = lru_cache(maxsize=cache_size)(self._route_normalized)
+
+    def scores(self, topic: str) -> Dict[str, float]:
+        """Summed keyword weight per matched subject"""
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        totals: Dict[int, float] = {}
+        state = 0
+        for char in topic.lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for subject_number, weight in outputs[state]:
+                totals[subject_number] = totals.get(subject_number, 0.0) + weight
+        return {self.subjects[number]: totals[number] for number in sorted(totals)}
+
+    def route(self, topic: str) -> Route:
+        """Best subject for ``topic`` with its confidence (memoized)"""
+        return self._route(" ".join(topic.lower().split()))
+
+    def subject(self, topic: str) -> str:
+        return self.route(topic).subject
+
+    def _route_normalized(self, topic: str) -> Route:
+        scores = self.scores(topic)
+        total = sum(scores.values())
+        if total <= 0:
+            return Route(self.default_subject, 0.0, ())
+        # Stable sort: ties keep taxonomy order
+        ranked = tuple(sorted(scores.items(), key=lambda item: -item[1]))
+        return Route(ranked[0][0], ranked[0][1] / total, ranked)
+
+    def cache_info(self):
+        return self._route.cache_info()
+
+
+def load_taxonomy(path: str) -> Dict:
+    with open(path, encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+_router = None
+_router_lock = threading.Lock()
+
+def get_router() -> TopicRouter:
+    """The process-wide router, compiled on first use"""
+    global _router
+    with _router_lock:
+        if _router is None:
+            taxonomy = load_taxonomy(TOPIC_TAXONOMY_PATH) if TOPIC_TAXONOMY_PATH else DEFAULT_TAXONOMY
+            _router = TopicRouter(taxonomy)
+        return _router
+
+def route(topic: str) -> Route:
+    return get_router().route(topic)
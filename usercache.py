@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# =============================================================================
+# USER RECORD CACHE
+# =============================================================================
+#
+# Process-wide read-through cache of users rows, keyed by id and by
+# normalized email, so repeated logins and profile reads skip SQLite.
+#
+#   - LRU over at most USER_CACHE_SIZE records (a row is well under 1 KiB)
+#   - entries expire USER_CACHE_TTL seconds after they were loaded
+#   - models.py invalidates an entry when it writes that user; writes made
+#     by other processes (manage.py, imports) are picked up once the TTL
+#     expires
+#   - only hits are cached, never "no such user"
+#
+# stats() reports hits, misses and evictions for sizing.
+
+USER_CACHE_SIZE = int(os.environ.get("EDUTUTOR_USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.environ.get("EDUTUTOR_USER_CACHE_TTL", "300"))
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+class UserCache:
+    """Thread-safe LRU + TTL cache of user records"""
+
+    def __init__(self, max_size: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._records: "OrderedDict[int, tuple]" = OrderedDict()  # id -> (expires, record)
+        self._ids_by_email: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _get(self, user_id) -> Optional[Dict]:
+        # Caller holds the lock
+        entry = self._records.get(user_id)
+        if entry is None:
+            return None
+        expires, record = entry
+        if expires < time.monotonic():
+            self._drop(user_id)
+            return None
+        self._records.move_to_end(user_id)
+        return record
+
+    def _drop(self, user_id):
+        expires, record = self._records.pop(user_id)
+        # Accounts grandfathered into email_collisions share a normalized
+        # email; leave the mapping alone if it points at the other one
+        email = normalize_email(record['email'])
+        if self._ids_by_email.get(email) == user_id:
+            del self._ids_by_email[email]
+
+    def _count(self, record):
+        if record is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        # A copy, so callers can modify what they get back
+        return dict(record) if record is not None else None
+
+    def get(self, user_id) -> Optional[Dict]:
+        with self._lock:
+            return self._count(self._get(user_id))
+
+    def get_by_email(self, email: str) -> Optional[Dict]:
+        with self._lock:
+            user_id = self._ids_by_email.get(normalize_email(email))
+            return self._count(self._get(user_id) if user_id is not None else None)
+
+    def put(self, record: Dict):
+        """Cache a users row (as a dict)"""
+        if self.max_size <= 0:
+            return
+        record = dict(record)
+        with self._lock:
+            if record['id'] in self._records:
+                self._drop(record['id'])
+            self._records[record['id']] = (time.monotonic() + self.ttl, record)
+            self._ids_by_email[normalize_email(record['email'])] = record['id']
+            while len(self._records) > self.max_size:
+                self._drop(next(iter(self._records)))
+                self.evictions += 1
+
+    def invalidate(self, user_id=None, email: Optional[str] = None):
+        """Forget a user by id and/or email"""
+        with self._lock:
+            ids = {user_id}
+            if email is not None:
+                ids.add(self._ids_by_email.get(normalize_email(email)))
+            for stale in ids:
+                if stale in self._records:
+                    self._drop(stale)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self._ids_by_email.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._records),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else None,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_user_cache() -> UserCache:
+    """Get the process-wide user cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = UserCache()
+        return _cache
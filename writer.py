@@ -0,0 +1,201 @@
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+from db import open_connection
+
+# =============================================================================
+# GROUP-COMMIT WRITER
+# =============================================================================
+
+WRITER_BATCH_SIZE = int(os.environ.get("EDUTUTOR_WRITER_BATCH_SIZE", "256"))
+WRITER_MAX_DELAY_MS = float(os.environ.get("EDUTUTOR_WRITER_MAX_DELAY_MS", "5"))
+# How long interactive callers wait for their write to commit
+WRITE_TIMEOUT = float(os.environ.get("EDUTUTOR_WRITE_TIMEOUT", "10"))
+
+_STOP = object()
+
+logger = logging.getLogger("edututor.writer")
+
+
+class WriterClosed(Exception):
+    """Raised when submitting to a writer that has been shut down"""
+
+
+class WriterFailed(WriterClosed):
+    """Set on operations lost because the writer thread failed"""
+
+
+class GroupCommitWriter:
+    """Single writer thread that commits queued operations in batches.
+
+    Each operation is a callable taking the writer's connection. It runs inside
+    its own SAVEPOINT, so a failing operation (e.g. a constraint violation) only
+    fails its own future. A batch is closed when it reaches ``batch_size``
+    operations or ``max_delay_ms`` after its first operation arrived, then
+    committed with a single fsync; futures resolve only after that commit.
+
+    If the thread itself fails (the connection cannot be opened, a rollback
+    fails), every pending and queued future fails with WriterFailed and the
+    writer closes; get_writer() then starts a new one.
+    """
+
+    def __init__(self, database_path: str, batch_size: int = WRITER_BATCH_SIZE,
+                 max_delay_ms: float = WRITER_MAX_DELAY_MS):
+        self.database_path = database_path
+        self.batch_size = max(1, batch_size)
+        self.max_delay = max(0.0, max_delay_ms) / 1000
+        self._queue = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()
+        self.batches_committed = 0
+        self.operations_committed = 0
+        self._thread = threading.Thread(
+            target=self._run, name=f"edututor-writer:{database_path}", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, operation: Callable[[sqlite3.Connection], object]) -> Future:
+        """Queue ``operation(conn)``; the future resolves to its return value"""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise WriterClosed(f"Writer for {self.database_path} is closed")
+            self._queue.put((operation, future))
+        return future
+
+    def execute(self, sql: str, params=()) -> Future:
+        """Queue one statement; the future resolves to the cursor's lastrowid"""
+        return self.submit(lambda conn: conn.execute(sql, params).lastrowid)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def close(self, timeout: Optional[float] = None):
+        """Commit everything already queued, then stop the writer thread"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _run(self):
+        batch = []
+        try:
+            conn = open_connection(self.database_path, instrumented=True)
+            try:
+                conn.isolation_level = None  # transactions are managed explicitly
+                if self.database_path != ":memory:":
+                    # One fsync per batch is the whole point; make it a real one
+                    conn.execute("PRAGMA synchronous = FULL")
+
+                stopping = False
+                while not stopping:
+                    item = self._queue.get()
+                    if item is _STOP:
+                        break
+                    batch = [item]
+                    deadline = time.monotonic() + self.max_delay
+                    while len(batch) < self.batch_size:
+                        try:
+                            remaining = deadline - time.monotonic()
+                            item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        if item is _STOP:
+                            stopping = True
+                            break
+                        batch.append(item)
+                    self._commit(conn, batch)
+                    batch = []
+            finally:
+                conn.close()
+        except BaseException as exc:
+            logger.exception("writer for %s failed", self.database_path)
+            self._fail(batch, exc)
+
+    def _fail(self, batch, exc: BaseException):
+        """Close the writer and fail the batch in hand plus everything queued"""
+        with self._lock:
+            self._closed = True
+        pending = list(batch)
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                pending.append(item)
+        for _, future in pending:
+            if not future.done():
+                error = WriterFailed(f"Writer for {self.database_path} failed: {exc!r}")
+                error.__cause__ = exc
+                future.set_exception(error)
+
+    def _commit(self, conn: sqlite3.Connection, batch):
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for operation, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT op")
+                try:
+                    results.append((future, operation(conn), None))
+                    conn.execute("RELEASE op")
+                except Exception as exc:
+                    conn.execute("ROLLBACK TO op")
+                    conn.execute("RELEASE op")
+                    results.append((future, None, exc))
+            conn.execute("COMMIT")
+        except Exception as exc:
+            try:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+            finally:
+                # A failing rollback takes the writer down (see _run), but
+                # this batch still gets the original error
+                for operation, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+            return
+
+        self.batches_committed += 1
+        self.operations_committed += len(results)
+        for future, result, exc in results:
+            if exc is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exc)
+
+
+_writers: Dict[str, GroupCommitWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(database_path: str) -> GroupCommitWriter:
+    """Get the process-wide writer for a database file, starting it on first use"""
+    with _writers_lock:
+        writer = _writers.get(database_path)
+        if writer is None or writer.closed:
+            writer = GroupCommitWriter(database_path)
+            _writers[database_path] = writer
+        return writer
+
+
+@atexit.register
+def close_writers():
+    """Flush and stop every writer (runs automatically at interpreter exit)"""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()